@@ -1,12 +1,102 @@
-from fastapi import FastAPI, HTTPException
+import time
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import (
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+from config.config import Config
 from services.db_service.main import query_service
+from services.db_service.json_encoding import json_bytes, ndjson_line
+from services.deadline import deadline_scope
+from services.log import get_logger
+from services.metrics import (
+    collect_timings,
+    http_seconds,
+    registry,
+    server_timing,
+    span,
+)
 
-app = FastAPI()
+logger = get_logger("gateway")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background schema introspection and model warmup; requests never
+    # wait on either
+    await query_service.start()
+    yield
+    # Release pooled DB connections on shutdown
+    await query_service.close()
+
+
+class TimingMiddleware:
+    """
+    Collects the stage spans of each request into a Server-Timing
+    header (sent when the response starts, so a stream only reports the
+    stages before its first byte) and records the request's latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        with collect_timings() as timings:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    total = time.perf_counter() - started
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        server_timing(timings + [("total", total)]),
+                    )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                # Route templates keep the label set bounded
+                route = scope.get("route")
+                http_seconds.observe(
+                    time.perf_counter() - started,
+                    scope["method"],
+                    route.path if route is not None else "unmatched",
+                    str(status),
+                )
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
 
 # Define request model
 class QueryRequest(BaseModel):
     nl_query: str
+    # Send result rows as NDJSON lines while they are read from the DB
+    stream: bool = False
+    # Seconds to answer within (capped at REQUEST_TIMEOUT)
+    timeout: float | None = None
+
+class BatchQueryRequest(BaseModel):
+    nl_queries: list[str]
+    timeout: float | None = None
+
+class NextPageRequest(BaseModel):
+    # `page.next_token` from an earlier /query/ or /query/next response
+    token: str
+    timeout: float | None = None
 
 class SQLTestRequest(BaseModel):
     raw_sql: str
@@ -16,27 +106,180 @@ class SQLTestRequest(BaseModel):
 class LLMTestRequest(BaseModel):
     nl_query: str
 
+async def wait_for_disconnect(http_request: Request):
+    # Only reads the request body, which FastAPI has already consumed, so
+    # the next message is the client hanging up
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+def request_seconds(timeout: float | None):
+    # A client may ask for less time than REQUEST_TIMEOUT, never more
+    seconds = Config.REQUEST_TIMEOUT
+    if timeout is not None and timeout > 0:
+        seconds = min(timeout, seconds)
+    return seconds
+
+async def run_request(http_request: Request, work, timeout: float | None):
+    """
+    Runs `work()` under the request's deadline. The work is cancelled,
+    along with the LLM call or query it is waiting on, when the deadline
+    passes (504) or the client disconnects (499).
+    """
+    seconds = request_seconds(timeout)
+    with deadline_scope(seconds):
+        task = asyncio.ensure_future(work())
+    disconnect = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        done, _ = await asyncio.wait(
+            {task, disconnect},
+            timeout=seconds,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    finally:
+        disconnect.cancel()
+        if not task.done():
+            task.cancel()
+    if task in done:
+        return task.result()
+    if disconnect in done:
+        logger.info("🔌 Client disconnected, request cancelled")
+        return Response(status_code=499)
+    logger.warning(
+        "⏱️ Request exceeded its %gs deadline, cancelled", seconds
+    )
+    raise HTTPException(
+        status_code=504,
+        detail=f"Request did not complete within {seconds:g} seconds.",
+    )
+
+async def run_stream(stream, timeout: float | None):
+    """
+    Iterates `stream` under the request's deadline. The status line has
+    already been sent when it passes, so the stream is cancelled (along
+    with the LLM call or query it was waiting on) and ends with an error
+    line instead of a 504.
+    """
+    seconds = request_seconds(timeout)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    with deadline_scope(seconds):
+        async with aclosing(stream):
+            try:
+                while True:
+                    # Only the wait for the next chunk is timed out, never
+                    # the send of one
+                    async with asyncio.timeout_at(deadline):
+                        chunk = await anext(stream, None)
+                    if chunk is None:
+                        return
+                    yield chunk
+            except TimeoutError:
+                logger.warning(
+                    "⏱️ Stream exceeded its %gs deadline, cancelled", seconds
+                )
+                yield ndjson_line({
+                    "status": "error",
+                    "error": (
+                        f"Request did not complete within {seconds:g} "
+                        "seconds."
+                    ),
+                })
+
+def json_response(payload):
+    # Results are already JSON-native (Mongo documents are converted by
+    # bson_to_jsonable), so json.dumps replaces FastAPI's much slower
+    # jsonable_encoder walk; encoding here also times it as its own stage
+    with span("serialize"):
+        return Response(json_bytes(payload), media_type="application/json")
+
 @app.get("/")
-def home():
+async def home():
     return {"message": "Welcome to NLQ Chatbot!"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return query_service.cache_stats()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return query_service.llm_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Stage, request and Ollama histograms in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
 @app.post("/query/")
-def query_database(request: QueryRequest):
+async def query_database(request: QueryRequest, http_request: Request):
     """
     API endpoint to process a natural language query.
     """
+    if request.stream:
+        # Starlette cancels the stream itself when the client disconnects
+        return StreamingResponse(
+            run_stream(
+                query_service.stream_query(request.nl_query), request.timeout
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    async def work():
+        result = await query_service.process_query(request.nl_query)
+        return json_response({"query_result": result})
+
     try:
-        result = query_service.process_query(request.nl_query)
-        return {"query_result": result}
+        return await run_request(http_request, work, request.timeout)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/query/batch")
+async def query_database_batch(
+    request: BatchQueryRequest, http_request: Request
+):
+    """
+    Translates and executes a list of questions concurrently; each item
+    carries its own result or error.
+    """
+    if len(request.nl_queries) > Config.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {Config.BATCH_MAX_ITEMS} questions per batch.",
+        )
+    async def work():
+        return json_response(
+            await query_service.process_batch(request.nl_queries)
+        )
+
+    return await run_request(http_request, work, request.timeout)
+
+@app.post("/query/next")
+async def query_next_page(request: NextPageRequest, http_request: Request):
+    """
+    Fetches the next page of a capped result using its continuation token.
+    """
+    async def work():
+        result = await query_service.next_page(request.token)
+        return json_response({"query_result": result})
+
+    try:
+        return await run_request(http_request, work, request.timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 ######################################
 #### THIS IS A TEST API TO TEST DB EXECUTION ####
 @app.post("/test_db/")
-def test_raw_sql(request: SQLTestRequest):
+async def test_raw_sql(request: SQLTestRequest):
     try:
-        result = query_service.test_db_query(
+        result = await query_service.test_db_query(
             raw_query=request.raw_sql,
             db_name=request.db_name,
             dbms_type=request.dbms_type
@@ -52,12 +295,12 @@ def test_raw_sql(request: SQLTestRequest):
 ######################################
 #### THIS IS A TEST API TO TEST LLM RESPONSE ####
 @app.post("/test_llm/")
-def test_llm_response(request: LLMTestRequest):
+async def test_llm_response(request: LLMTestRequest):
     """
     API endpoint to test LLM-generated query without executing it.
     """
     try:
-        result = query_service.test_llm_query(request.nl_query)
+        result = await query_service.test_llm_query(request.nl_query)
         return {
             "status": "success",
             "nl_query": request.nl_query,
@@ -0,0 +1,50 @@
+"""
+Compares benchmark result files endpoint by endpoint.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+
+import sys
+import json
+from typing import Any, Dict
+
+METRICS = (
+    ("throughput_rps", lambda s: s["throughput_rps"]),
+    ("p50_ms", lambda s: s["latency_ms"]["p50"]),
+    ("p95_ms", lambda s: s["latency_ms"]["p95"]),
+    ("p99_ms", lambda s: s["latency_ms"]["p99"]),
+    ("errors", lambda s: s["errors"] + s["failed"]),
+)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before: float, after: float) -> str:
+    if before == 0:
+        return "" if after == 0 else "new"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main() -> None:
+    if len(sys.argv) != 3:
+        sys.exit(__doc__.strip().splitlines()[-1].strip())
+    baseline, candidate = load(sys.argv[1]), load(sys.argv[2])
+    print(f"{'endpoint':<10}{'metric':<16}{'baseline':>12}{'candidate':>12}")
+    sections = {"overall": (baseline["overall"], candidate["overall"])}
+    for endpoint, stats in baseline["endpoints"].items():
+        if endpoint in candidate["endpoints"]:
+            sections[endpoint] = (stats, candidate["endpoints"][endpoint])
+    for endpoint, (before, after) in sections.items():
+        for name, metric in METRICS:
+            a, b = metric(before), metric(after)
+            print(
+                f"{endpoint:<10}{name:<16}{a:>12.2f}{b:>12.2f}"
+                f"  {change(a, b)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
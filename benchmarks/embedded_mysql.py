@@ -0,0 +1,228 @@
+import os
+import csv
+import asyncio
+import sqlite3
+import itertools
+import mysql.connector.aio
+from functools import lru_cache, partial
+from typing import Any, Dict, List, Optional
+from mysql.connector import errors
+import sqlglot
+from sqlglot.errors import ErrorLevel
+from benchmarks.workload import CSV_FOLDERS, project_root
+from services.log import get_logger
+
+logger = get_logger("sql")
+
+SHOW_TABLES = (
+    "SELECT name AS Tables_in_{db} FROM sqlite_master "
+    "WHERE type = 'table' ORDER BY name"
+)
+
+# connection_id -> open connection, so KILL QUERY can interrupt it
+_connections: Dict[int, "EmbeddedConnection"] = {}
+_connection_ids = itertools.count(1)
+
+
+def _column_type(values: List[str]) -> str:
+    present = [v for v in values if v != ""]
+    for kind, cast in (("INTEGER", int), ("REAL", float)):
+        try:
+            for value in present:
+                cast(value)
+            return kind
+        except ValueError:
+            continue
+    return "TEXT"
+
+
+def _convert(value: str, kind: str) -> Any:
+    if value == "":
+        return None
+    if kind == "INTEGER":
+        return int(value)
+    if kind == "REAL":
+        return float(value)
+    return value
+
+
+def seed(data_dir: str, force: bool = False) -> Dict[str, str]:
+    """
+    Builds one SQLite file per database from the truncated CSV exports,
+    with an index on every id column. Existing files are reused unless
+    `force` is set. Returns database -> file path.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for db_name, folder in CSV_FOLDERS.items():
+        path = os.path.join(data_dir, f"{db_name}.sqlite3")
+        paths[db_name] = path
+        if os.path.exists(path) and not force:
+            continue
+        if os.path.exists(path):
+            os.remove(path)
+        db = sqlite3.connect(path)
+        folder = os.path.join(project_root, folder)
+        for filename in sorted(os.listdir(folder)):
+            if not filename.endswith(".csv"):
+                continue
+            table = filename[:-4]
+            with open(os.path.join(folder, filename), newline="") as f:
+                reader = csv.reader(f)
+                columns = next(reader)
+                rows = list(reader)
+            kinds = [
+                _column_type([row[i] for row in rows])
+                for i in range(len(columns))
+            ]
+            definition = ", ".join(
+                f'"{c}" {k}' for c, k in zip(columns, kinds)
+            )
+            db.execute(f'CREATE TABLE "{table}" ({definition})')
+            db.executemany(
+                f'INSERT INTO "{table}" VALUES '
+                f"({', '.join('?' * len(columns))})",
+                [[_convert(v, k) for v, k in zip(row, kinds)] for row in rows],
+            )
+            for column in columns:
+                if column == "id" or column.endswith("_id"):
+                    db.execute(
+                        f'CREATE INDEX "{table}_{column}" '
+                        f'ON "{table}" ("{column}")'
+                    )
+            logger.info("🌱 Seeded %s.%s (%d rows)", db_name, table, len(rows))
+        db.commit()
+        db.close()
+    return paths
+
+
+@lru_cache(maxsize=4096)
+def to_sqlite(sql: str, db_name: Optional[str]) -> str:
+    if sql.strip().rstrip(";").upper() == "SHOW TABLES":
+        return SHOW_TABLES.format(db=db_name or "main")
+    statements = sqlglot.transpile(
+        sql,
+        read="mysql",
+        write="sqlite",
+        unsupported_level=ErrorLevel.IGNORE,
+    )
+    if len(statements) != 1:
+        raise errors.ProgrammingError(msg="Expected a single statement.")
+    return statements[0]
+
+
+class EmbeddedCursor:
+    def __init__(self, connection: "EmbeddedConnection", dictionary: bool):
+        self.connection = connection
+        self.dictionary = dictionary
+        self._cursor: Optional[sqlite3.Cursor] = None
+        self._columns: List[str] = []
+
+    async def execute(self, sql: str, params=None) -> None:
+        text = sql.strip()
+        if text.upper().startswith("KILL QUERY"):
+            target = _connections.get(int(text.split()[-1]))
+            if target is not None:
+                target.db.interrupt()
+            return
+        if text.upper().startswith("SET SESSION"):
+            # Session variables such as max_execution_time have no SQLite
+            # counterpart
+            self._cursor = None
+            self._columns = []
+            return
+        if text.upper().startswith("EXPLAIN"):
+            raise errors.NotSupportedError(
+                msg="EXPLAIN is not available on the embedded database."
+            )
+        statement = to_sqlite(text, self.connection.database)
+        try:
+            self._cursor = await asyncio.to_thread(
+                self.connection.db.execute, statement
+            )
+        except sqlite3.Error as e:
+            raise errors.ProgrammingError(msg=str(e))
+        description = self._cursor.description or []
+        self._columns = [column[0] for column in description]
+
+    def _rows(self, rows: List[tuple]) -> List[Any]:
+        if self.dictionary:
+            return [dict(zip(self._columns, row)) for row in rows]
+        return rows
+
+    async def fetchall(self) -> List[Any]:
+        return self._rows(await asyncio.to_thread(self._cursor.fetchall))
+
+    async def fetchmany(self, size: int) -> List[Any]:
+        rows = await asyncio.to_thread(self._cursor.fetchmany, size)
+        return self._rows(rows)
+
+    async def fetchone(self) -> Any:
+        row = await asyncio.to_thread(self._cursor.fetchone)
+        return None if row is None else self._rows([row])[0]
+
+    async def close(self) -> None:
+        if self._cursor is not None:
+            self._cursor.close()
+
+
+class EmbeddedConnection:
+    """
+    Stands in for mysql.connector.aio's connection over SQLite files.
+    Every database is attached under its own name, so queries qualified
+    with a database resolve as they do in MySQL. Statements are
+    translated from MySQL by sqlglot and run on a worker thread.
+    """
+
+    def __init__(self, paths: Dict[str, str], database: Optional[str]):
+        self.database = database
+        self.connection_id = next(_connection_ids)
+        self.db = sqlite3.connect(
+            paths[database] if database else ":memory:",
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        for name, path in paths.items():
+            if name != database:
+                self.db.execute("ATTACH DATABASE ? AS ?", (path, name))
+        _connections[self.connection_id] = self
+
+    async def cursor(self, dictionary: bool = False, buffered: bool = True):
+        return EmbeddedCursor(self, dictionary)
+
+    async def commit(self) -> None:
+        pass
+
+    async def ping(self) -> None:
+        pass
+
+    def is_socket_connected(self) -> bool:
+        return self.connection_id in _connections
+
+    async def close(self) -> None:
+        _connections.pop(self.connection_id, None)
+        self.db.close()
+
+
+async def connect(paths: Dict[str, str], **params) -> EmbeddedConnection:
+    database = params.get("database")
+    if database is not None and database not in paths:
+        # MySQL resolves database names case-insensitively on this setup
+        database = next(
+            (name for name in paths if name.lower() == database.lower()),
+            None,
+        )
+        if database is None:
+            raise errors.ProgrammingError(
+                msg=f"Unknown database '{params['database']}'"
+            )
+    return EmbeddedConnection(paths, database)
+
+
+def install(data_dir: str) -> None:
+    """
+    Routes every MySQL connection the gateway opens to the seeded SQLite
+    files, so pooling, rewriting, caching and result encoding all run
+    as they would against a server.
+    """
+    mysql.connector.aio.connect = partial(connect, seed(data_dir))
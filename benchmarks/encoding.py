@@ -0,0 +1,106 @@
+"""
+Compares ways of turning a Mongo result into a /query/ response body.
+
+    python -m benchmarks.encoding --docs 5000 --repeat 5
+
+- raw_json_util: per-document json_util.dumps over RawBSONDocuments,
+  the removed `raw` request mode (json_util decodes each document
+  anyway, so it never skipped the round trip)
+- jsonable_encoder: decoded documents through bson_to_jsonable and then
+  FastAPI's jsonable_encoder + JSONResponse, the gateway's former path
+- json_bytes: decoded documents through bson_to_jsonable and json_bytes,
+  the gateway's current path
+"""
+
+import time
+import argparse
+import datetime
+import bson
+from bson import Decimal128, ObjectId, json_util
+from bson.raw_bson import RawBSONDocument
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Any, Callable, Dict, List
+from services.db_service.json_encoding import bson_to_jsonable, json_bytes
+
+
+def sample_documents(count: int) -> List[Dict[str, Any]]:
+    # Shaped like the imdb_ijs movies collection, with the BSON types
+    # generated queries return
+    return [
+        {
+            "_id": ObjectId(),
+            "id": i,
+            "name": f"Movie {i}",
+            "year": 1950 + i % 70,
+            "rank": Decimal128(f"{i % 100 / 10:.1f}"),
+            "genres": ["Drama", "Comedy"][: 1 + i % 2],
+            "added": datetime.datetime(2020, 1, 1)
+            + datetime.timedelta(minutes=i),
+            "director": {"first_name": "Christopher", "last_name": "Nolan"},
+        }
+        for i in range(count)
+    ]
+
+
+def raw_json_util(raw: List[RawBSONDocument]) -> bytes:
+    return (
+        b"["
+        + b",".join(
+            json_util.dumps(
+                document, json_options=json_util.DEFAULT_JSON_OPTIONS
+            ).encode("utf-8")
+            for document in raw
+        )
+        + b"]"
+    )
+
+
+def with_jsonable_encoder(documents: List[Dict[str, Any]]) -> bytes:
+    payload = {"query_result": {"result": bson_to_jsonable(documents)}}
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def with_json_bytes(documents: List[Dict[str, Any]]) -> bytes:
+    return json_bytes(
+        {"query_result": {"result": bson_to_jsonable(documents)}}
+    )
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = sample_documents(args.docs)
+    raw = [RawBSONDocument(bson.encode(d)) for d in documents]
+    # What the driver hands back without the raw codec options
+    decoded = [bson.decode(document.raw) for document in raw]
+
+    cases = {
+        "raw_json_util": lambda: raw_json_util(raw),
+        "jsonable_encoder": lambda: with_jsonable_encoder(decoded),
+        "json_bytes": lambda: with_json_bytes(decoded),
+    }
+    results = {name: best_of(args.repeat, fn) for name, fn in cases.items()}
+    baseline = results["json_bytes"]
+    print(f"{args.docs} documents, best of {args.repeat}")
+    for name, seconds in results.items():
+        print(
+            f"  {name:<18} {seconds * 1000:8.1f} ms"
+            f"  {seconds / baseline:5.2f}x json_bytes"
+        )
+
+
+if __name__ == "__main__":
+    main()
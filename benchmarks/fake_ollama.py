@@ -0,0 +1,119 @@
+"""
+Ollama-compatible /api/generate stand-in for benchmarks.
+
+Answers each prompt with the query of the benchmark question it
+contains, after a fixed prompt-evaluation delay and a per-token delay,
+streamed or not as requested. Reported durations match the delays.
+
+    python -m benchmarks.fake_ollama --port 11435 --first-token-ms 150
+"""
+
+import json
+import time
+import asyncio
+import zlib
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List
+from benchmarks.workload import answer_table
+
+FALLBACK_ANSWER = "SELECT 1;"
+
+
+class FakeOllama:
+    def __init__(self, first_token_ms: float, token_ms: float) -> None:
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        # Longest questions first, so one containing another never wins
+        self.answers = sorted(
+            answer_table().items(), key=lambda item: -len(item[0])
+        )
+
+    def answer(self, prompt: str) -> str:
+        for question, query in self.answers:
+            if question in prompt:
+                return query
+        return FALLBACK_ANSWER
+
+    def final_chunk(
+        self, prompt: str, eval_count: int, started: float
+    ) -> Dict[str, Any]:
+        prompt_tokens = max(len(prompt) // 4, 1)
+        # A short context derived from the prompt, enough for clients
+        # that key on it
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        return {
+            "model": "llama3",
+            "response": "",
+            "done": True,
+            "context": [(seed + i) % 32000 for i in range(8)],
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.first_token_ms * 1e6),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_count * self.token_ms * 1e6),
+        }
+
+    def tokens(self, body: Dict[str, Any]) -> List[str]:
+        prompt = body.get("prompt", "")
+        if not prompt:
+            # Warmup: loads the model, generates nothing
+            return []
+        words = self.answer(prompt).split(" ")
+        tokens = [word + " " for word in words[:-1]] + words[-1:]
+        limit = body.get("options", {}).get("num_predict")
+        return tokens[:limit] if limit else tokens
+
+    async def generate(self, body: Dict[str, Any]):
+        started = time.perf_counter()
+        prompt = body.get("prompt", "")
+        tokens = self.tokens(body)
+        if prompt:
+            await asyncio.sleep(self.first_token_ms / 1000)
+
+        if not body.get("stream", True):
+            await asyncio.sleep(len(tokens) * self.token_ms / 1000)
+            return {
+                **self.final_chunk(prompt, len(tokens), started),
+                "response": "".join(tokens),
+            }
+
+        async def chunks():
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(self.token_ms / 1000)
+                line = {"model": "llama3", "response": token, "done": False}
+                yield json.dumps(line) + "\n"
+            final = self.final_chunk(prompt, len(tokens), started)
+            yield json.dumps(final) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+def create_app(first_token_ms: float, token_ms: float) -> FastAPI:
+    app = FastAPI()
+    fake = FakeOllama(first_token_ms, token_ms)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        return await fake.generate(await request.json())
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    app = create_app(args.first_token_ms, args.token_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+Load test for the API gateway's /query/, /test_db/ and /test_llm/.
+
+Starts the fake Ollama server and the gateway (on the embedded MySQL
+stand-in unless --mysql local), drives a closed- or open-loop workload
+of demo and synthetic questions, and writes per-endpoint latency
+percentiles, throughput and errors to a JSON file.
+
+    python -m benchmarks.run --mode closed --concurrency 16 --duration 30
+    python -m benchmarks.run --mode open --rate 50 --duration 60
+
+The gateway's caches stay on as configured; pass e.g.
+--env GENERATION_CACHE_ENABLED=false to measure every LLM round trip.
+Compare runs with `python -m benchmarks.compare a.json b.json`.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import httpx
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from benchmarks.workload import ENDPOINTS, Workload, project_root
+
+RESULTS_DIR = os.path.join(project_root, "benchmarks", "results")
+DATA_DIR = os.path.join(project_root, "benchmarks", ".data")
+
+# (endpoint, latency in seconds, outcome)
+Sample = Tuple[str, float, str]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    The q-th percentile (0-100) of sorted `values`, interpolated.
+    """
+    if not values:
+        return 0.0
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(samples: List[Sample], duration: float) -> Dict[str, Any]:
+    latencies = sorted(latency * 1000 for _, latency, _ in samples)
+    outcomes: Dict[str, int] = {}
+    for _, _, outcome in samples:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    ok = outcomes.get("ok", 0)
+    return {
+        "requests": len(samples),
+        "ok": ok,
+        # Answered, but with an error in the payload
+        "failed": outcomes.get("failed", 0),
+        "errors": len(samples) - ok - outcomes.get("failed", 0),
+        "outcomes": outcomes,
+        "throughput_rps": round(len(samples) / duration, 2),
+        "latency_ms": {
+            "min": round(latencies[0], 2) if latencies else 0.0,
+            "mean": (
+                round(sum(latencies) / len(latencies), 2) if latencies else 0.0
+            ),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+    }
+
+
+def classify(endpoint: str, response: httpx.Response) -> str:
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    body = response.json()
+    if endpoint == "query":
+        result = body.get("query_result", {})
+        failed = result.get("status") == "error"
+    elif endpoint == "test_db":
+        result = body.get("result")
+        failed = isinstance(result, dict) and "error" in result
+    else:
+        result = body.get("llm_result", {}).get("llm_query")
+        failed = isinstance(result, dict) and "error" in result
+    return "failed" if failed else "ok"
+
+
+async def send(client: httpx.AsyncClient, request: Dict[str, Any]) -> str:
+    try:
+        response = await client.post(request["path"], json=request["body"])
+        return classify(request["endpoint"], response)
+    except httpx.TimeoutException:
+        return "timeout"
+    except httpx.HTTPError as e:
+        return type(e).__name__
+
+
+async def closed_loop(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    max_requests: Optional[int],
+) -> Tuple[List[Sample], float]:
+    """
+    `concurrency` workers each send their next request as soon as the
+    previous one is answered.
+    """
+    samples: List[Sample] = []
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            if max_requests is not None and len(samples) >= max_requests:
+                return
+            request = workload.next()
+            sent = time.perf_counter()
+            outcome = await send(client, request)
+            if sent >= measure_from:
+                latency = time.perf_counter() - sent
+                samples.append((request["endpoint"], latency, outcome))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - measure_from
+
+
+async def open_loop(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    rate: float,
+    duration: float,
+    warmup: float,
+    arrivals: str,
+    max_inflight: int,
+    seed: Optional[int],
+) -> Tuple[List[Sample], float]:
+    """
+    Requests arrive at `rate` per second whether or not earlier ones
+    have been answered. Latency counts from the scheduled arrival, so a
+    backed-up server is not hidden by a late send. Arrivals beyond
+    `max_inflight` outstanding requests are recorded as "dropped".
+    """
+    samples: List[Sample] = []
+    tasks = set()
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def issue(request, scheduled):
+        outcome = await send(client, request)
+        if scheduled >= measure_from:
+            latency = time.perf_counter() - scheduled
+            samples.append((request["endpoint"], latency, outcome))
+
+    scheduled = started
+    while True:
+        gap = rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+        scheduled += gap
+        if scheduled >= stop_at:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        request = workload.next()
+        if len(tasks) >= max_inflight:
+            if scheduled >= measure_from:
+                samples.append((request["endpoint"], 0.0, "dropped"))
+            continue
+        task = asyncio.create_task(issue(request, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return samples, stop_at - measure_from
+
+
+def start_process(
+    module: str, args: List[str], env: Dict[str, str], log
+) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", module, *args],
+        cwd=project_root,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up")
+                await asyncio.sleep(0.2)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=project_root, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        endpoint, _, weight = part.partition("=")
+        mix[endpoint.strip()] = float(weight or 1)
+    return mix
+
+
+def server_env(args, ollama_url: str) -> Dict[str, str]:
+    """
+    Environment overrides for the gateway process.
+    """
+    overrides = {
+        "OLLAMA_API_URL": ollama_url,
+        # Demo questions measure the pipeline, not a simulated model
+        "DEMO_LLM_LATENCY": "0",
+    }
+    if args.mysql == "embedded":
+        # Connection settings are unused, but Config requires them
+        overrides.update(
+            {
+                "MYSQL_HOST": "127.0.0.1",
+                "MYSQL_PORT": "3306",
+                "MYSQL_USER": "benchmark",
+                "MYSQL_PASSWORD": "",
+                # The stand-in has no information_schema or EXPLAIN
+                "SCHEMA_CATALOG_ENABLED": "false",
+                "COST_GUARD_ENABLED": "false",
+            }
+        )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        overrides[key] = value
+    return overrides
+
+
+async def drive(args, base_url: str) -> Dict[str, Any]:
+    workload = Workload(parse_mix(args.mix), args.dbms, seed=args.seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=args.timeout, limits=limits
+    ) as client:
+        if args.mode == "closed":
+            samples, duration = await closed_loop(
+                client,
+                workload,
+                args.concurrency,
+                args.duration,
+                args.warmup,
+                args.requests,
+            )
+        else:
+            samples, duration = await open_loop(
+                client,
+                workload,
+                args.rate,
+                args.duration,
+                args.warmup,
+                args.arrivals,
+                args.max_inflight,
+                args.seed,
+            )
+        server_stats = {}
+        for path in ("/cache/stats", "/llm/stats"):
+            try:
+                server_stats[path] = (await client.get(path)).json()
+            except (httpx.HTTPError, ValueError):
+                server_stats[path] = None
+
+    return {
+        "duration_s": round(duration, 2),
+        "overall": summarize(samples, duration),
+        "endpoints": {
+            endpoint: summarize(
+                [s for s in samples if s[0] == endpoint], duration
+            )
+            for endpoint in ENDPOINTS
+            if any(s[0] == endpoint for s in samples)
+        },
+        "server_stats": server_stats,
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    if args.target:
+        return await drive(args, args.target)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    log_path = os.path.splitext(args.output)[0] + ".log"
+    ollama_url = f"http://127.0.0.1:{args.ollama_port}/api/generate"
+    env = {**os.environ, **server_env(args, ollama_url)}
+    base_url = f"http://127.0.0.1:{args.gateway_port}"
+    gateway_args = ["--port", str(args.gateway_port)]
+    if args.mysql == "embedded":
+        gateway_args += ["--embedded-sql", args.data_dir]
+
+    processes = []
+    with open(log_path, "w") as log:
+        try:
+            processes.append(
+                start_process(
+                    "benchmarks.fake_ollama",
+                    [
+                        "--port",
+                        str(args.ollama_port),
+                        "--first-token-ms",
+                        str(args.first_token_ms),
+                        "--token-ms",
+                        str(args.token_ms),
+                    ],
+                    env,
+                    log,
+                )
+            )
+            processes.append(
+                start_process("benchmarks.server", gateway_args, env, log)
+            )
+            await wait_ready(base_url + "/")
+            print(f"🚀 Gateway up at {base_url}, logging to {log_path}")
+            report = await drive(args, base_url)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    report["server_log"] = log_path
+    report["server_env"] = server_env(args, ollama_url)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=5.0,
+        help="seconds of load before measuring starts",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="closed-loop workers"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        help="closed loop: stop after this many measured requests",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=20.0, help="open-loop arrivals/s"
+    )
+    parser.add_argument(
+        "--arrivals", choices=("poisson", "uniform"), default="poisson"
+    )
+    parser.add_argument("--max-inflight", type=int, default=1000)
+    parser.add_argument(
+        "--mix",
+        default="query=0.6,test_db=0.3,test_llm=0.1",
+        help="endpoint weights, e.g. query=1,test_db=1",
+    )
+    parser.add_argument(
+        "--dbms",
+        type=lambda text: text.split(","),
+        default=["sql"],
+        help="question types: sql, mongo or sql,mongo (mongo needs a "
+        "local server seeded by db_data_loaders/mongo_data_loader.py)",
+    )
+    parser.add_argument(
+        "--mysql",
+        choices=("embedded", "local"),
+        default="embedded",
+        help="SQLite stand-in seeded from the *_trunc_csv folders, or "
+        "the MySQL server in config",
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--gateway-port", type=int, default=8100)
+    parser.add_argument("--ollama-port", type=int, default=11435)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="extra gateway setting, e.g. RESULT_CACHE_ENABLED=false",
+    )
+    parser.add_argument(
+        "--target", help="benchmark an already running gateway instead"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    if args.output is None:
+        stamp = started_at.strftime("%Y%m%dT%H%M%SZ")
+        args.output = os.path.join(RESULTS_DIR, f"{stamp}-{args.mode}.json")
+
+    report = asyncio.run(run(args))
+    report = {
+        "label": args.label,
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "config": vars(args),
+        **report,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for endpoint, stats in report["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(
+            f"📊 {endpoint:<8} {stats['requests']:>6} req "
+            f"{stats['throughput_rps']:>8.2f} req/s  "
+            f"p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+            f"p99 {latency['p99']:.1f} ms  "
+            f"errors {stats['errors']}  failed {stats['failed']}"
+        )
+    print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
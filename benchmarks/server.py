@@ -0,0 +1,36 @@
+"""
+Runs the API gateway for a benchmark, optionally on the embedded MySQL
+stand-in.
+
+    python -m benchmarks.server --port 8100 --embedded-sql benchmarks/.data
+"""
+
+import argparse
+import uvicorn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--embedded-sql",
+        metavar="DIR",
+        help="serve MySQL queries from SQLite files seeded into DIR",
+    )
+    args = parser.parse_args()
+    if args.embedded_sql:
+        # Must be installed before the gateway opens any connection
+        from benchmarks.embedded_mysql import install
+
+        install(args.embedded_sql)
+    uvicorn.run(
+        "api_gateway.main:app",
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import re
+import csv
+import random
+from typing import Any, Dict, List, Optional
+from demo.demo_query import DEMO_QUERIES
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Truncated CSV exports and the database each one holds
+CSV_FOLDERS = {
+    "CORA": "CORA_trunc_csv",
+    "financial": "financial_trunc_csv",
+    "imdb_ijs": "imdb_ijs_truc_csv",
+}
+
+ENDPOINTS = ("query", "test_db", "test_llm")
+
+WRITE_SQL = re.compile(r"^\s*(insert|update|delete|replace)\b", re.I)
+WRITE_MONGO = re.compile(r"\.(insert|update|delete|replace)\w*\(", re.I)
+
+
+class Question:
+    """
+    One benchmark question with the query a model should answer it with.
+    """
+
+    __slots__ = ("text", "dbms_type", "db_name", "query", "demo")
+
+    def __init__(
+        self,
+        text: str,
+        dbms_type: str,
+        db_name: str,
+        query: str,
+        demo: bool = False,
+    ) -> None:
+        self.text = text
+        self.dbms_type = dbms_type
+        self.db_name = db_name
+        self.query = query
+        # Sent with its leading "-", which bypasses the LLM
+        self.demo = demo
+
+
+def read_tables(db_name: str) -> Dict[str, List[str]]:
+    """
+    Table name -> column names, from the headers of a CSV folder.
+    """
+    folder = os.path.join(project_root, CSV_FOLDERS[db_name])
+    tables = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".csv"):
+            with open(os.path.join(folder, filename), newline="") as f:
+                tables[filename[:-4]] = next(csv.reader(f))
+    return tables
+
+
+def is_write(dbms_type: str, query: str) -> bool:
+    pattern = WRITE_SQL if dbms_type == "sql" else WRITE_MONGO
+    return bool(pattern.search(query))
+
+
+def demo_questions(dbms_types: List[str]) -> List[Question]:
+    """
+    Read-only DEMO_QUERIES entries. Writes are left out so repeated runs
+    see the same data.
+    """
+    questions = []
+    for text, demo in DEMO_QUERIES.items():
+        if demo["dbms_type"] not in dbms_types:
+            continue
+        if is_write(demo["dbms_type"], demo["query"]):
+            continue
+        questions.append(
+            Question(
+                text,
+                demo["dbms_type"],
+                demo["db_name"],
+                demo["query"],
+                demo=True,
+            )
+        )
+    return questions
+
+
+def synthetic_questions(dbms_types: List[str]) -> List[Question]:
+    """
+    Templated read questions over every table in the truncated exports.
+    """
+    questions = []
+    for db_name in CSV_FOLDERS:
+        for table, columns in read_tables(db_name).items():
+            column = columns[-1]
+            if "sql" in dbms_types:
+                where = f"in the {db_name} sql database"
+                questions += [
+                    Question(
+                        f"give me 20 rows of {table} {where}",
+                        "sql",
+                        db_name,
+                        f"SELECT * FROM {table} LIMIT 20;",
+                    ),
+                    Question(
+                        f"count the rows of {table} {where}",
+                        "sql",
+                        db_name,
+                        f"SELECT COUNT(*) AS total FROM {table};",
+                    ),
+                    Question(
+                        f"each distinct {column} of {table} {where}",
+                        "sql",
+                        db_name,
+                        f"SELECT DISTINCT {column} FROM {table} LIMIT 100;",
+                    ),
+                ]
+            if "mongo" in dbms_types:
+                where = f"in the {db_name.lower()} mongodb database"
+                questions += [
+                    Question(
+                        f"give me 20 documents of {table} {where}",
+                        "mongo",
+                        db_name.lower(),
+                        f"db.{table}.find({{}}).limit(20)",
+                    ),
+                    Question(
+                        f"count the documents of {table} {where}",
+                        "mongo",
+                        db_name.lower(),
+                        f"db.{table}.countDocuments({{}})",
+                    ),
+                ]
+    return questions
+
+
+def answer_table() -> Dict[str, str]:
+    """
+    Question text -> query, for the fake LLM. Demo questions are also
+    answerable without their leading "-".
+    """
+    questions = demo_questions(["sql", "mongo"])
+    questions += synthetic_questions(["sql", "mongo"])
+    answers = {}
+    for question in questions:
+        answers[question.text.lstrip("-")] = question.query
+    return answers
+
+
+class Workload:
+    """
+    Builds request bodies for the gateway endpoints, picked at random
+    with weights `mix` (endpoint -> weight) from the demo and synthetic
+    questions of `dbms_types`.
+    """
+
+    def __init__(
+        self,
+        mix: Dict[str, float],
+        dbms_types: List[str],
+        seed: Optional[int] = None,
+    ) -> None:
+        unknown = set(mix) - set(ENDPOINTS)
+        if unknown:
+            raise ValueError(f"Unknown endpoints in mix: {sorted(unknown)}")
+        self.endpoints = [e for e in ENDPOINTS if mix.get(e, 0) > 0]
+        self.weights = [mix[e] for e in self.endpoints]
+        self.random = random.Random(seed)
+        self.demo = demo_questions(dbms_types)
+        self.synthetic = synthetic_questions(dbms_types)
+        # Demo questions also go through the LLM when asked without "-"
+        self.llm = self.synthetic + [
+            q for q in self.demo if self._routes_to(q.text, q.dbms_type)
+        ]
+        self.queries = self.demo + self.synthetic
+
+    @staticmethod
+    def _routes_to(text: str, dbms_type: str) -> bool:
+        # The generator treats a question as Mongo only if it says mongodb
+        return ("mongodb" in text.lower()) == (dbms_type == "mongo")
+
+    def next(self) -> Dict[str, Any]:
+        """
+        The next request as {"endpoint", "path", "body"}.
+        """
+        endpoint = self.random.choices(self.endpoints, self.weights)[0]
+        if endpoint == "query":
+            if self.random.random() < 0.5:
+                body = {"nl_query": self.random.choice(self.demo).text}
+            else:
+                question = self.random.choice(self.llm)
+                body = {"nl_query": question.text.lstrip("-")}
+        elif endpoint == "test_db":
+            question = self.random.choice(self.queries)
+            body = {
+                "raw_sql": question.query,
+                "db_name": question.db_name,
+                "dbms_type": question.dbms_type,
+            }
+        else:
+            question = self.random.choice(self.llm)
+            body = {"nl_query": question.text.lstrip("-")}
+        return {"endpoint": endpoint, "path": f"/{endpoint}/", "body": body}
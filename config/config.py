@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 env_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(dotenv_path=env_path)
 
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class Config:
     MYSQL = {
@@ -13,10 +15,197 @@ class Config:
         "password": os.getenv("MYSQL_PASSWORD"),
     }
 
+    # Per-database async connection pools used by MySQLExecutor
+    MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "10"))
+    MYSQL_POOL_PING_INTERVAL = float(
+        os.getenv("MYSQL_POOL_PING_INTERVAL", "30")
+    )
+
+    # Rows per fetchmany() round when streaming SQL results as NDJSON
+    MYSQL_STREAM_BATCH_SIZE = int(os.getenv("MYSQL_STREAM_BATCH_SIZE", "500"))
+    # Most rows a streamed (NDJSON) result sends before stopping (0
+    # disables); streams are not paged, so this bounds them instead
+    STREAM_MAX_ROWS = int(os.getenv("STREAM_MAX_ROWS", "100000"))
+
+    # Raw SQL text -> final MySQL text memo for the sqlglot pipeline
+    SQL_PREPARE_CACHE_SIZE = int(os.getenv("SQL_PREPARE_CACHE_SIZE", "4096"))
+
+    # Row cap added to generated SELECTs that have no LIMIT (0 disables);
+    # also the page size of POST /query/next continuations
+    SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "1000"))
+    # HMAC key for continuation tokens (random per process when unset) and
+    # how long a token stays valid (s)
+    PAGE_TOKEN_SECRET = os.getenv("PAGE_TOKEN_SECRET", "")
+    PAGE_TOKEN_TTL = float(os.getenv("PAGE_TOKEN_TTL", "3600"))
+
+    # Time limit on every SELECT, as a MAX_EXECUTION_TIME hint or the
+    # session max_execution_time for WITH queries (ms, 0 disables)
+    SQL_MAX_EXECUTION_MS = int(os.getenv("SQL_MAX_EXECUTION_MS", "30000"))
+
+    # Cost gate run on generated queries before execution, from MySQL
+    # EXPLAIN FORMAT=JSON and Mongo explain(). Over COST_GUARD_MAX_COST
+    # (MySQL query_cost / Mongo documents examined) a query is rejected;
+    # over COST_GUARD_MAX_ROWS estimated rows it is cut to
+    # COST_GUARD_LIMIT rows, or rejected when COST_GUARD_ACTION=reject
+    COST_GUARD_ENABLED = (
+        os.getenv("COST_GUARD_ENABLED", "true").lower() == "true"
+    )
+    COST_GUARD_MAX_COST = float(os.getenv("COST_GUARD_MAX_COST", "10000000"))
+    COST_GUARD_MAX_ROWS = float(os.getenv("COST_GUARD_MAX_ROWS", "1000000"))
+    COST_GUARD_ACTION = os.getenv("COST_GUARD_ACTION", "limit")
+    COST_GUARD_LIMIT = int(os.getenv("COST_GUARD_LIMIT", "1000"))
+
+    # Live schema catalog: databases to introspect and how often to refresh
+    SCHEMA_CATALOG_ENABLED = (
+        os.getenv("SCHEMA_CATALOG_ENABLED", "true").lower() == "true"
+    )
+    SCHEMA_CATALOG_DATABASES = os.getenv(
+        "SCHEMA_CATALOG_DATABASES", "CORA,financial,imdb_ijs"
+    ).split(",")
+    SCHEMA_REFRESH_INTERVAL = float(
+        os.getenv("SCHEMA_REFRESH_INTERVAL", "300")
+    )
+    # Documents per collection sampled to infer Mongo field types
+    MONGO_SCHEMA_SAMPLE_SIZE = int(
+        os.getenv("MONGO_SCHEMA_SAMPLE_SIZE", "200")
+    )
+
+    # Send only the tables/columns a question needs instead of the full schema
+    SCHEMA_PRUNING_ENABLED = (
+        os.getenv("SCHEMA_PRUNING_ENABLED", "true").lower() == "true"
+    )
+    # Tables wider than this are cut down to the matched and key columns
+    SCHEMA_PRUNING_MAX_COLUMNS = int(
+        os.getenv("SCHEMA_PRUNING_MAX_COLUMNS", "8")
+    )
+
+    # Read-query result cache, invalidated by writes to the tables it read
+    RESULT_CACHE_ENABLED = (
+        os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    )
+    RESULT_CACHE_MAX_BYTES = int(
+        os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+    )
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
     MONGODB = {
         "host": os.getenv("MONGO_HOST"),
         "port": int(os.getenv("MONGO_PORT")),
     }
 
+    # Unbounded find/aggregate cursors kept open for POST /query/next: max
+    # open per process and how long one may sit unread (s)
+    MONGO_CURSOR_MAX = int(os.getenv("MONGO_CURSOR_MAX", "100"))
+    MONGO_CURSOR_IDLE_TTL = float(os.getenv("MONGO_CURSOR_IDLE_TTL", "300"))
+
+    # Server-side time limit (maxTimeMS) for Mongo reads (0 disables)
+    MONGO_MAX_TIME_MS = int(os.getenv("MONGO_MAX_TIME_MS", "30000"))
+
+    # Raw query text -> compiled mongosh operation plan memo
+    MONGO_PLAN_CACHE_SIZE = int(os.getenv("MONGO_PLAN_CACHE_SIZE", "4096"))
+
     LLAMA_MODEL_NAME = os.getenv("LLAMA_MODEL_NAME")
     HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+
+    # Stream Ollama tokens and hang up once a complete query has arrived
+    OLLAMA_STREAMING = os.getenv("OLLAMA_STREAMING", "true").lower() == "true"
+
+    # Ollama generate endpoint (the benchmarks point it at a stand-in)
+    OLLAMA_API_URL = os.getenv(
+        "OLLAMA_API_URL", "http://localhost:11434/api/generate"
+    )
+
+    # Shared Ollama HTTP client: how long the model stays loaded after a
+    # request, request timeout (s), pooled connections, and how long the
+    # model may sit idle (s) before it is warmed again (0 disables)
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+    OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+    OLLAMA_WARMUP_INTERVAL = float(os.getenv("OLLAMA_WARMUP_INTERVAL", "240"))
+
+    # LLM backend: "ollama" (live), "record" (live, saving every
+    # prompt -> response pair with its timings to LLM_RECORDING_PATH) or
+    # "replay" (served from that file, Ollama is never contacted)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama").lower()
+    LLM_RECORDING_PATH = os.getenv(
+        "LLM_RECORDING_PATH",
+        os.path.join(project_root, ".cache", "llm_recording.sqlite3"),
+    )
+    # Replay latency per call: milliseconds, or "recorded" to wait as long
+    # as the recorded call took
+    LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0")
+
+    # Simulated LLM latency (s) for the "-" demo questions
+    DEMO_LLM_LATENCY = float(os.getenv("DEMO_LLM_LATENCY", "7"))
+
+    # Service log level, with per-stage overrides such as
+    # "llm=DEBUG,mongo=WARNING". Stages: gateway, query, llm, schema,
+    # sql, mongo, cache, cost
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_STAGE_LEVELS = os.getenv("LOG_STAGE_LEVELS", "")
+    # "text" or "json" (one object per line)
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    # Debug payloads (prompts, LLM responses, queries, pipelines): the
+    # fraction of them written, and the characters kept of each
+    LOG_PAYLOAD_SAMPLE_RATE = float(
+        os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0")
+    )
+    LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "500"))
+
+    # Default end-to-end deadline (s) for a gateway request, covering LLM
+    # generation and database execution; clients may ask for less
+    REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+
+    # POST /query/batch: max questions per batch, concurrent LLM generations,
+    # and concurrent executions per database within a batch
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+    BATCH_DB_CONCURRENCY = int(os.getenv("BATCH_DB_CONCURRENCY", "4"))
+
+    # "prefix_stable" puts a byte-identical instructions + schema block per
+    # (dbms, database) first and the question last, so Ollama's KV cache
+    # is reused across questions; "legacy" keeps the per-intent templates
+    PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "legacy")
+    # With prefix_stable: encode each prefix once and send only the suffix
+    # together with the returned token context
+    OLLAMA_REUSE_CONTEXT = (
+        os.getenv("OLLAMA_REUSE_CONTEXT", "false").lower() == "true"
+    )
+    # Most recently used databases whose prompt prefix (and its encoded
+    # token context) is kept; an entry is replaced when its schema changes
+    PROMPT_PREFIX_CACHE_SIZE = int(os.getenv("PROMPT_PREFIX_CACHE_SIZE", "32"))
+    # Chat template wrapped around every prompt ("\n" for newlines), with
+    # {prompt} where the prompt goes; defaults to llama3's own
+    OLLAMA_PROMPT_TEMPLATE = os.getenv(
+        "OLLAMA_PROMPT_TEMPLATE",
+        "<|start_header_id|>user<|end_header_id|>\\n\\n{prompt}<|eot_id|>"
+        "<|start_header_id|>assistant<|end_header_id|>\\n\\n",
+    ).replace("\\n", "\n")
+
+    # Exact-match cache of LLM generations (in-memory LRU + SQLite file)
+    GENERATION_CACHE_ENABLED = (
+        os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+    )
+    GENERATION_CACHE_PATH = os.getenv(
+        "GENERATION_CACHE_PATH",
+        os.path.join(project_root, ".cache", "llm_generations.sqlite3"),
+    )
+    GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "2048"))
+    GENERATION_CACHE_TTL = float(
+        os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600))
+    )
+
+    # Near-duplicate question cache over hashed n-gram embeddings
+    SEMANTIC_CACHE_ENABLED = (
+        os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    )
+    SEMANTIC_CACHE_THRESHOLD = float(
+        os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.88")
+    )
+    SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+    # Max remembered questions across all (dbms, database, table, intent,
+    # model, schema version) partitions, least recently used evicted first
+    # (SEMANTIC_CACHE_DIM * 4 bytes of vector each)
+    SEMANTIC_CACHE_CAPACITY = int(
+        os.getenv("SEMANTIC_CACHE_CAPACITY", "100000")
+    )
@@ -0,0 +1,178 @@
+import os
+import re
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config.config import Config
+
+
+def normalize_question(nl_query: str) -> str:
+    """
+    Canonical form of a question for cache lookups: case-folded, with
+    whitespace collapsed and trailing punctuation dropped.
+    """
+    question = re.sub(r"\s+", " ", nl_query.strip().lower())
+    return question.rstrip(" ?.!;")
+
+
+def fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache for LLM generations.
+
+    The front tier is an in-process LRU; the back tier is a SQLite file
+    that survives restarts. Entries expire after `ttl` seconds in both
+    tiers. A disk hit is promoted into the LRU. SQLite calls block, so
+    `get` and `set` run them in a worker thread, off the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str = Config.GENERATION_CACHE_PATH,
+        max_entries: int = Config.GENERATION_CACHE_SIZE,
+        ttl: float = Config.GENERATION_CACHE_TTL,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # Guards the LRU and stats; _db_lock serializes the SQLite file
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+        }
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """)
+        self._db.commit()
+
+    def make_key(
+        self,
+        nl_query: str,
+        db_name: str,
+        dbms_type: str,
+        intent: str,
+        model: str,
+        schema: str,
+        instructions: str,
+    ) -> str:
+        return fingerprint(
+            normalize_question(nl_query),
+            db_name.lower(),
+            dbms_type,
+            intent,
+            model,
+            fingerprint(schema, instructions),
+        )
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        row = await asyncio.to_thread(self._load, key, now)
+        with self._lock:
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            response, expires_at = row
+            if expires_at <= now:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._remember(key, response, expires_at)
+            self.stats["disk_hits"] += 1
+            return response
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT response, expires_at FROM generations WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute(
+                    "DELETE FROM generations WHERE key = ?", (key,)
+                )
+                self._db.commit()
+            return row
+
+    async def set(self, key: str, response: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self.stats["stores"] += 1
+        await asyncio.to_thread(self._store, key, response, expires_at)
+
+    def _store(self, key: str, response: str, expires_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?)",
+                (key, response, expires_at),
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM generations WHERE expires_at <= ?", (time.time(),)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "memory_entries": len(self._memory),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            self._db.execute("DELETE FROM generations")
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import zlib
+import asyncio
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from config.config import Config
+from services.chatbot_service.generation_cache import fingerprint
+from services.chatbot_service.ollama_client import OllamaClient
+from services.chatbot_service.query_completion import QueryCompletionDetector
+from services.deadline import remaining
+from services.log import get_logger
+
+logger = get_logger("llm")
+
+
+def recording_key(
+    kind: str, model: str, prompt: str, context: Optional[List[int]] = None
+) -> str:
+    """
+    Identity of one LLM call. Streamed and non-streamed generations of
+    the same prompt share a key, so either mode replays the other's
+    recording.
+    """
+    tokens = fingerprint(json.dumps(context)) if context else ""
+    return fingerprint(kind, model, prompt, tokens)
+
+
+class LLMRecording:
+    """
+    SQLite file of recorded LLM calls: the key, Ollama's result as
+    zlib-compressed JSON, and how long the call took end to end. `get`
+    and `put` run in a worker thread, off the event loop.
+    """
+
+    def __init__(self, path: str = Config.LLM_RECORDING_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                result BLOB NOT NULL,
+                elapsed_ms REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+            """)
+        self._db.commit()
+
+    async def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        return await asyncio.to_thread(self._load, key)
+
+    def _load(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, elapsed_ms FROM llm_calls WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0])), row[1]
+
+    async def put(
+        self, key: str, kind: str, result: Dict[str, Any], elapsed_ms: float
+    ) -> None:
+        await asyncio.to_thread(self._store, key, kind, result, elapsed_ms)
+
+    def _store(
+        self, key: str, kind: str, result: Dict[str, Any], elapsed_ms: float
+    ) -> None:
+        blob = zlib.compress(
+            json.dumps(result, separators=(",", ":")).encode("utf-8")
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_calls VALUES (?, ?, ?, ?, ?)",
+                (key, kind, blob, round(elapsed_ms, 2), time.time()),
+            )
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM llm_calls"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class RecordingOllamaClient(OllamaClient):
+    """
+    Live Ollama client that saves every prefix encoding and generation,
+    with its wall-clock time, into an `LLMRecording`.
+    """
+
+    def __init__(
+        self, model: str, api_url: str, recording: LLMRecording, **kwargs
+    ) -> None:
+        super().__init__(model, api_url, **kwargs)
+        self.recording = recording
+        self.stats["recorded"] = 0
+
+    async def _save(
+        self,
+        key: str,
+        kind: str,
+        result: Dict[str, Any],
+        started: float,
+    ) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        await self.recording.put(key, kind, result, elapsed_ms)
+        self.stats["recorded"] += 1
+
+    async def encode_prefix(self, prefix: str) -> List[int]:
+        started = time.perf_counter()
+        context = await super().encode_prefix(prefix)
+        key = recording_key("prefix", self.model, prefix)
+        await self._save(key, "prefix", {"context": context}, started)
+        return context
+
+    async def generate(
+        self, prompt: str, context: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await super().generate(prompt, context)
+        key = recording_key("generate", self.model, prompt, context)
+        # The returned token context is large and never read by callers
+        stored = {k: v for k, v in result.items() if k != "context"}
+        await self._save(key, "generate", stored, started)
+        return result
+
+    async def generate_until_complete(
+        self,
+        prompt: str,
+        dbms_type: str,
+        context: Optional[List[int]] = None,
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await super().generate_until_complete(
+            prompt, dbms_type, context
+        )
+        key = recording_key("generate", self.model, prompt, context)
+        stored = {k: v for k, v in result.items() if k != "context"}
+        await self._save(key, "generate", stored, started)
+        return result
+
+    async def close(self) -> None:
+        await super().close()
+        self.recording.close()
+
+
+class ReplayOllamaClient(OllamaClient):
+    """
+    Serves recorded LLM calls without contacting Ollama, so the parse,
+    rewrite, execute and serialize path can be measured on its own.
+
+    Each call waits `latency` first: a number of milliseconds, or
+    "recorded" for the recorded call's own duration. The wait is an
+    asyncio sleep bounded by the request's deadline. A prompt with no
+    recording raises LookupError, which the generator reports as a
+    failed generation.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_url: str,
+        recording: LLMRecording,
+        latency: str = Config.LLM_REPLAY_LATENCY,
+    ) -> None:
+        # No model to keep loaded
+        super().__init__(model, api_url, warmup_interval=0)
+        self.recording = recording
+        self.latency = latency
+        self.stats["replayed"] = 0
+        self.stats["missing"] = 0
+
+    async def _lookup(self, key: str) -> Tuple[Dict[str, Any], float]:
+        found = await self.recording.get(key)
+        if found is None:
+            self.stats["missing"] += 1
+            raise LookupError(
+                f"No recorded LLM response for this prompt ({key[:12]})"
+            )
+        self.stats["replayed"] += 1
+        return found
+
+    async def _wait(self, elapsed_ms: float) -> None:
+        if self.latency == "recorded":
+            delay_ms = elapsed_ms
+        else:
+            delay_ms = float(self.latency)
+        if delay_ms > 0:
+            async with asyncio.timeout(remaining()):
+                await asyncio.sleep(delay_ms / 1000)
+
+    def _replayed(self, result: Dict[str, Any]) -> None:
+        self._record(result)
+        # Includes first_token_ms, which a stream cut short only measured
+        self.last_timings = result.get("timings", {})
+
+    async def warmup(self) -> Dict[str, float]:
+        return {}
+
+    async def encode_prefix(self, prefix: str) -> List[int]:
+        result, elapsed_ms = await self._lookup(
+            recording_key("prefix", self.model, prefix)
+        )
+        await self._wait(elapsed_ms)
+        return list(result["context"])
+
+    async def generate(
+        self, prompt: str, context: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        result, elapsed_ms = await self._lookup(
+            recording_key("generate", self.model, prompt, context)
+        )
+        await self._wait(elapsed_ms)
+        self._replayed(result)
+        return {**result, "timings": result.get("timings", {})}
+
+    async def generate_until_complete(
+        self,
+        prompt: str,
+        dbms_type: str,
+        context: Optional[List[int]] = None,
+    ) -> Dict[str, Any]:
+        result, elapsed_ms = await self._lookup(
+            recording_key("generate", self.model, prompt, context)
+        )
+        await self._wait(elapsed_ms)
+        self._replayed(result)
+        # Cut the recorded text where a live stream would have stopped
+        detector = QueryCompletionDetector(dbms_type)
+        early_stop = detector.feed(result.get("response", ""))
+        return {
+            **result,
+            "response": detector.text,
+            "early_stop": early_stop,
+            "timings": result.get("timings", {}),
+        }
+
+    async def close(self) -> None:
+        await super().close()
+        self.recording.close()
+
+
+def create_llm_client(
+    model: str, api_url: str, backend: str = Config.LLM_BACKEND
+) -> OllamaClient:
+    """
+    The LLM client selected by LLM_BACKEND.
+    """
+    if backend == "ollama":
+        return OllamaClient(model, api_url)
+    if backend == "record":
+        logger.info("🎙️ Recording LLM calls to %s", Config.LLM_RECORDING_PATH)
+        return RecordingOllamaClient(model, api_url, LLMRecording())
+    if backend == "replay":
+        recording = LLMRecording()
+        logger.info(
+            "📼 Replaying %d recorded LLM calls from %s",
+            recording.count(),
+            Config.LLM_RECORDING_PATH,
+        )
+        return ReplayOllamaClient(model, api_url, recording)
+    raise ValueError(f"Unknown LLM_BACKEND: {backend}")
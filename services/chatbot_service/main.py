@@ -1,22 +1,73 @@
 import re
 import json
-import requests
+from collections import OrderedDict
+from logging import DEBUG
 from services.chatbot_service.schema_loader import SchemaLoader
 from services.chatbot_service.mongo_schema_loader import MongoSchemaLoader
 from services.chatbot_service.instruction_loader import InstructionLoader
+from services.chatbot_service.generation_cache import GenerationCache
+from services.chatbot_service.semantic_cache import SemanticCache
+from services.chatbot_service.ollama_client import OllamaClient
+from services.chatbot_service.llm_replay import create_llm_client
+from services.chatbot_service.schema_selector import (
+    SchemaSelector,
+    estimate_tokens,
+)
+from config.config import Config
+from services.metrics import span
+from services.log import get_logger, log_payload
+
+logger = get_logger("llm")
+
 # from services.chatbot_service.query_generator import QueryGenerator
 
+MYSQL_HEADER = "Use MySQL version 8.0.32 syntax. Do not use features unsupported in this version.\n"
+
+# Per-intent task lines for the prefix-stable layout; they go after the
+# shared prefix so every intent reuses the same cached tokens
+MONGO_TASKS = {
+    "insert": "Convert the instruction below into a valid MongoDB `insertOne` query using the provided schema.",
+    "update": "Convert the instruction below into a valid MongoDB `updateOne` query using the provided schema.",
+    "delete": "Convert the instruction below into a valid MongoDB `deleteOne` query using the provided schema.",
+    "data": "Write a MongoDB query to return 5 sample documents from the appropriate collection.",
+    "query": "Convert the instruction into a **single-line MongoDB query** using either `find()` or `aggregate()`.\nUse `$lookup` only if the instruction requires fields from multiple collections.\nIMPORTANT: Do not hardcode any ID values like director_id or movie_id. If a name is given, use a subquery or lookup to find the ID.",
+}
+SQL_TASKS = {
+    "insert": "Convert the following to a valid SQL INSERT query.",
+    "update": "Convert the following to a valid SQL UPDATE query.",
+    "delete": "Convert the following to a valid SQL DELETE query.",
+    "data": "Generate a SQL query to return 5 sample rows.",
+    "query": "Convert the following natural language question into an optimized MySQL 8.0.32-compatible SQL query.",
+}
+
 
 class QueryGenerator:
     def __init__(
-        self, sql_schema_loader, mongo_schema_loader, instruction_loader
+        self,
+        sql_schema_loader,
+        mongo_schema_loader,
+        instruction_loader,
+        generation_cache=None,
+        semantic_cache=None,
+        schema_selector=None,
     ):
         self.model = "llama3"
-        self.api_url = "http://localhost:11434/api/generate"
+        self.api_url = Config.OLLAMA_API_URL
         self.sql_schema_loader: SchemaLoader = sql_schema_loader
         self.mongo_schema_loader: MongoSchemaLoader = mongo_schema_loader
         self.instruction_loader: InstructionLoader = instruction_loader
-        print(f"✅ Using {self.model} via local Ollama")
+        self.generation_cache: GenerationCache | None = generation_cache
+        self.semantic_cache: SemanticCache | None = semantic_cache
+        self.schema_selector: SchemaSelector | None = schema_selector
+        # Live Ollama, or recording/replaying it (LLM_BACKEND)
+        self.ollama_client: OllamaClient = create_llm_client(
+            self.model, self.api_url
+        )
+        # (dbms, db) -> (schema version, static prompt prefix), LRU
+        self.prompt_prefixes = OrderedDict()
+        # prompt prefix -> Ollama token context for it, LRU
+        self.prefix_contexts = OrderedDict()
+        logger.info("✅ Using %s via local Ollama", self.model)
 
     def detect_intent(self, nl_query: str):
         intent_map = {
@@ -65,7 +116,7 @@ class QueryGenerator:
                 return f"{instructions}\n\nConvert the instruction into a **single-line MongoDB query** using either `find()` or `aggregate()`.\nUse `$lookup` only if the instruction requires fields from multiple collections.\nSchema:\n{schema}\nInstruction: {nl_question}\nIMPORTANT: Do not hardcode any ID values like director_id or movie_id. If a name is given, use a subquery or lookup to find the ID.\nMongoDB Query:"
         else:
             # Add MySQL 8.0.32 tag to every SQL prompt
-            mysql_header = "Use MySQL version 8.0.32 syntax. Do not use features unsupported in this version.\n"
+            mysql_header = MYSQL_HEADER
 
             if intent == "insert":
                 return f"{mysql_header}Convert the following to a valid SQL INSERT query. Schema:\n{schema}\nInstruction: {nl_question}\nSQL:"
@@ -80,6 +131,81 @@ class QueryGenerator:
             else:
                 return f"{mysql_header}Convert the following natural language question into an optimized MySQL 8.0.32-compatible SQL query. Schema:\n{schema}\nQuestion: {nl_question}\nSQL:"
 
+    def build_prompt_prefix(self, dbms_type, db_name):
+        """
+        Byte-identical prompt head for every question against one
+        database: the instructions and the full schema. Memoized for the
+        PROMPT_PREFIX_CACHE_SIZE most recent databases and rebuilt when
+        the schema version changes, dropping the stale prefix's context.
+        """
+        loader = (
+            self.sql_schema_loader
+            if dbms_type == "sql"
+            else self.mongo_schema_loader
+        )
+        key = (dbms_type, db_name.lower())
+        entry = self.prompt_prefixes.get(key)
+        if entry is not None and entry[0] == loader.version:
+            self.prompt_prefixes.move_to_end(key)
+            return entry[1]
+        if entry is not None:
+            self.prefix_contexts.pop(entry[1], None)
+
+        if dbms_type == "sql":
+            schema = self.sql_schema_loader.get_schema(db_name)
+            head = MYSQL_HEADER
+        else:
+            schema = self.mongo_schema_loader.get_schema(db_name.lower())
+            head = f"{self.instruction_loader.mongo_instructions}\n\n"
+        prefix = f"{head}Schema of database {db_name.lower()}:\n{schema}\n\n"
+        self.prompt_prefixes[key] = (loader.version, prefix)
+        self.prompt_prefixes.move_to_end(key)
+        while len(self.prompt_prefixes) > Config.PROMPT_PREFIX_CACHE_SIZE:
+            _, (_, evicted) = self.prompt_prefixes.popitem(last=False)
+            self.prefix_contexts.pop(evicted, None)
+        return prefix
+
+    def build_prompt_suffix(self, nl_question, intent, dbms_type, table_name):
+        """
+        The per-question tail of the prefix-stable layout.
+        """
+        if dbms_type == "mongo":
+            task = MONGO_TASKS.get(intent, MONGO_TASKS["query"])
+            label, answer = "Instruction", "MongoDB Query:"
+        else:
+            task = SQL_TASKS.get(intent, SQL_TASKS["query"])
+            label = "Question" if intent == "query" else "Instruction"
+            answer = "SQL:"
+        focus = f"Focus on: {table_name}\n" if table_name else ""
+        return f"Task: {task}\n{focus}{label}: {nl_question}\n{answer}"
+
+    async def prefix_context(self, prefix):
+        context = self.prefix_contexts.get(prefix)
+        if context is not None:
+            self.prefix_contexts.move_to_end(prefix)
+            return context
+        context = await self.ollama_client.encode_prefix(prefix)
+        self.prefix_contexts[prefix] = context
+        while len(self.prefix_contexts) > Config.PROMPT_PREFIX_CACHE_SIZE:
+            self.prefix_contexts.popitem(last=False)
+        logger.debug("🧊 Encoded prompt prefix (%d tokens)", len(context))
+        return context
+
+    def clean_response(self, response_text):
+        response_text = response_text.strip()
+        # Remove LLM explanations and markdown formatting if present
+        code_block = re.search(
+            r"```(?:sql)?\n(.*?)```", response_text, re.DOTALL
+        )
+        if code_block:
+            return code_block.group(1).strip()
+        return (
+            re.sub(r"(?i)^Here is .*?SQL query:\n", "", response_text)
+            .strip()
+            .split("Explanation:")[0]
+            .strip()
+        )
+
     def extract_info(self, nl_query):
         dbms_match = re.search(
             r"\b(mysql|mongodb|sql)\b", nl_query, re.IGNORECASE
@@ -95,9 +221,9 @@ class QueryGenerator:
         dbms_type = (
             "sql"
             if dbms_raw in ["mysql", "sql"]
-            else "mongo"
-            if dbms_raw == "mongodb"
-            else "sql"  # Default to SQL if not specified
+            else (
+                "mongo" if dbms_raw == "mongodb" else "sql"
+            )  # Default to SQL if not specified
         )
 
         db_name = db_match.group(1) if db_match else None
@@ -108,12 +234,13 @@ class QueryGenerator:
 
         return dbms_type, db_name, table_name, cleaned_query
 
-    def generate_query(self, nl_query):
+    async def generate_query(self, nl_query):
         try:
-            intent = self.detect_intent(nl_query)
-            dbms_type, db_name, table_name, cleaned_query = self.extract_info(
-                nl_query
-            )
+            with span("intent"):
+                intent = self.detect_intent(nl_query)
+                dbms_type, db_name, table_name, cleaned_query = (
+                    self.extract_info(nl_query)
+                )
             if not db_name:
                 return (
                     None,
@@ -126,110 +253,157 @@ class QueryGenerator:
             # ⬇️ Handle schema intent directly without calling LLM
             if intent == "schema":
                 if dbms_type == "sql":
-                    if not table_name:
-                        # Return just table names
-                        table_names = list(
-                            self.sql_schema_loader.schemas.get(
-                                db_name, {}
-                            ).keys()
-                        )
-                        return dbms_type, db_name, {"tables": table_names}
-                    else:
-                        related_schema = self.sql_schema_loader.schemas.get(
-                            db_name, {}
-                        ).get(table_name)
-                        if related_schema:
-                            field_lines = [
-                                line.strip("- ").strip()
-                                for line in related_schema.strip().splitlines()
-                                if "-" in line
-                            ]
-                            return dbms_type, db_name, {"fields": field_lines}
-                        else:
-                            return (
-                                dbms_type,
-                                db_name,
-                                {
-                                    "error": f"No schema found for table '{table_name}'"
-                                },
-                            )
+                    loader, kind = self.sql_schema_loader, "table"
+                    names = loader.get_table_names(db_name)
+                    names_key = "tables"
+                else:
+                    loader, kind = self.mongo_schema_loader, "collection"
+                    names = loader.get_collection_names(db_name)
+                    names_key = "collections"
 
-                elif dbms_type == "mongo":
-                    if not table_name:
-                        # Return just collection names
-                        collection_names = list(
-                            self.mongo_schema_loader.schema.get(
-                                db_name.lower(), {}
-                            ).keys()
-                        )
-                        return (
-                            dbms_type,
-                            db_name,
-                            {"collections": collection_names},
+                if not table_name:
+                    # Return just table/collection names
+                    return dbms_type, db_name, {names_key: names}
+                field_lines = loader.get_fields(db_name, table_name)
+                if field_lines:
+                    return dbms_type, db_name, {"fields": list(field_lines)}
+                return (
+                    dbms_type,
+                    db_name,
+                    {"error": f"No schema found for {kind} '{table_name}'"},
+                )
+
+            # Precompiled fragments: this is a dictionary lookup
+            with span("prompt"):
+                prefix = suffix = None
+                if Config.PROMPT_LAYOUT == "prefix_stable":
+                    # The full schema stays in the shared prefix; pruning it
+                    # per question would break the cached prefix
+                    prefix = self.build_prompt_prefix(dbms_type, db_name)
+                    suffix = self.build_prompt_suffix(
+                        cleaned_query, intent, dbms_type, table_name
+                    )
+                    schema, instructions = prefix, Config.PROMPT_LAYOUT
+                    prompt = prefix + suffix
+                else:
+                    schema = (
+                        self.sql_schema_loader.get_schema(db_name, table_name)
+                        if dbms_type == "sql"
+                        else self.mongo_schema_loader.get_schema(
+                            db_name.lower(), collection_name=table_name
                         )
-                    else:
-                        related_schema: str = (
-                            self.mongo_schema_loader.schema.get(
-                                db_name.lower(), {}
-                            ).get(table_name)
+                    )
+                    if self.schema_selector is not None and not table_name:
+                        pruned = self.schema_selector.prune(
+                            cleaned_query, dbms_type, db_name
                         )
-                        if related_schema:
-                            field_lines = [
-                                line.strip("- ").strip()
-                                for line in related_schema.strip().splitlines()
-                                if "->" in line or ":" in line
-                            ]
-                            return dbms_type, db_name, {"fields": field_lines}
-                        else:
-                            return (
-                                dbms_type,
-                                db_name,
-                                {
-                                    "error": f"No schema found for collection '{table_name}'"
-                                },
+                        # Counting tokens is a regex pass over the schema
+                        if pruned is not None and logger.isEnabledFor(DEBUG):
+                            logger.debug(
+                                "✂️ Pruned schema: ~%d tokens (full ~%d)",
+                                estimate_tokens(pruned),
+                                estimate_tokens(schema),
                             )
+                        if pruned is not None:
+                            schema = pruned
+                    instructions = self.instruction_loader.mongo_instructions
+                    prompt = self.build_prompt(
+                        cleaned_query, schema, intent, dbms_type, instructions
+                    )
 
-            schema = (
-                self.sql_schema_loader.get_schema(db_name, table_name)
-                if db_name == "sql"
-                else self.mongo_schema_loader.get_schema(
-                    db_name.lower(), collection_name=table_name
-                )
-            )
-            instructions = self.instruction_loader.mongo_instructions
-            prompt = self.build_prompt(
-                cleaned_query, schema, intent, dbms_type, instructions
-            )
+            cache_key = None
+            if self.generation_cache is not None:
+                with span("generation_cache"):
+                    cache_key = self.generation_cache.make_key(
+                        cleaned_query,
+                        db_name,
+                        dbms_type,
+                        intent,
+                        self.model,
+                        schema,
+                        instructions,
+                    )
+                    cached = await self.generation_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("⚡ Generation cache hit")
+                    return dbms_type, db_name, cached
 
-            print("\n📤 PROMPT SENT TO LLM:\n", prompt)
-            response = requests.post(
-                self.api_url,
-                json={"model": self.model, "prompt": prompt, "stream": False},
-            )
+            schema_version = (
+                self.sql_schema_loader
+                if dbms_type == "sql"
+                else self.mongo_schema_loader
+            ).version
+            if self.semantic_cache is not None:
+                with span("semantic_cache"):
+                    match = self.semantic_cache.lookup(
+                        cleaned_query,
+                        db_name,
+                        dbms_type,
+                        intent,
+                        self.model,
+                        schema_version,
+                        table_name,
+                    )
+                if match is not None:
+                    score, matched_question, cached = match
+                    logger.debug(
+                        "⚡ Semantic cache hit (%.3f): %s",
+                        score,
+                        matched_question,
+                    )
+                    return dbms_type, db_name, cached
 
-            response.raise_for_status()
-            response_text = response.json().get("response", "").strip()
-            # Remove LLM explanations and markdown formatting if present
-            code_block = re.search(
-                r"```(?:sql)?\n(.*?)```", response_text, re.DOTALL
+            log_payload(
+                logger, "📤 Prompt sent to LLM", prompt, chars=len(prompt)
             )
-            if code_block:
-                response_text = code_block.group(1).strip()
-            else:
-                response_text = (
-                    re.sub(r"(?i)^Here is .*?SQL query:\n", "", response_text)
-                    .strip()
-                    .split("Explanation:")[0]
-                    .strip()
-                )
-            print("\n📥 RAW RESPONSE FROM LLM:\n", response_text)
+            context = None
+            if prefix is not None and Config.OLLAMA_REUSE_CONTEXT:
+                # The prefix is already encoded; only the suffix is sent
+                with span("prefix_context"):
+                    context = await self.prefix_context(prefix)
+                prompt = suffix
+            with span("llm"):
+                if Config.OLLAMA_STREAMING:
+                    result = await self.ollama_client.generate_until_complete(
+                        prompt, dbms_type, context
+                    )
+                else:
+                    result = await self.ollama_client.generate(prompt, context)
+            logger.debug("⏱️ Ollama timings", extra=result.get("timings", {}))
 
-            if dbms_type == "sql" and db_name:
-                response_text = re.sub(
-                    r"\bdb\.([a-zA-Z_][a-zA-Z0-9_]*)",
-                    f"{db_name}.\\1",
-                    response_text,
-                )
+            with span("clean"):
+                if result.get("early_stop"):
+                    logger.debug(
+                        "✂️ Stopped generation at the end of the query"
+                    )
+                    response_text = result["early_stop"]
+                else:
+                    response_text = self.clean_response(
+                        result.get("response", "")
+                    )
+                log_payload(logger, "📥 Raw response from LLM", response_text)
+
+                if dbms_type == "sql" and db_name:
+                    response_text = re.sub(
+                        r"\bdb\.([a-zA-Z_][a-zA-Z0-9_]*)",
+                        f"{db_name}.\\1",
+                        response_text,
+                    )
+
+            with span("cache_store"):
+                if cache_key is not None and response_text:
+                    await self.generation_cache.set(cache_key, response_text)
+                if self.semantic_cache is not None and response_text:
+                    self.semantic_cache.add(
+                        cleaned_query,
+                        db_name,
+                        dbms_type,
+                        intent,
+                        self.model,
+                        response_text,
+                        schema_version,
+                        table_name,
+                    )
 
             return dbms_type, db_name, response_text
 
@@ -240,6 +414,20 @@ class QueryGenerator:
 sql_schema_loader = SchemaLoader()
 mongo_schema_loader = MongoSchemaLoader()
 instruction_loader = InstructionLoader()
+generation_cache = (
+    GenerationCache() if Config.GENERATION_CACHE_ENABLED else None
+)
+semantic_cache = SemanticCache() if Config.SEMANTIC_CACHE_ENABLED else None
+schema_selector = (
+    SchemaSelector(sql_schema_loader, mongo_schema_loader)
+    if Config.SCHEMA_PRUNING_ENABLED
+    else None
+)
 query_generator = QueryGenerator(
-    sql_schema_loader, mongo_schema_loader, instruction_loader
+    sql_schema_loader,
+    mongo_schema_loader,
+    instruction_loader,
+    generation_cache,
+    semantic_cache,
+    schema_selector,
 )
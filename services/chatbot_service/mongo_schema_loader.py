@@ -1,4 +1,8 @@
-from typing import Optional
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+from services.log import get_logger
+
+logger = get_logger("schema")
 
 
 class MongoSchemaLoader:
@@ -277,54 +281,156 @@ class MongoSchemaLoader:
             ],
         }
 
-    def get_schema(self, db_name: str, collection_name: Optional[str] = None):
-        if db_name not in self.schema:
-            raise ValueError(f"Database '{db_name}' not found.")
+        # Bumped on every rebuild so callers can tell fragments apart
+        self.version = 0
+        self.fragments = self.compile()
 
-        db = self.schema[db_name]
+    def compile(self):
+        """
+        Renders the prompt text for every database and collection once.
 
-        if collection_name is None:
-            related_collections = db
-        else:
-            if collection_name not in db:
-                raise ValueError(
-                    f"Collection '{collection_name}' not found in database '{db_name}'."
+        Collection blocks and the relationship block are rendered once per
+        database; the prompt for a collection is its reference closure
+        joined with that relationship block. The result is read-only and
+        replaced as a whole by `invalidate`.
+        """
+        fragments = {}
+        for db_name, db in self.schema.items():
+            blocks = {
+                coll_name: self._render_collection(coll_name, fields)
+                for coll_name, fields in db.items()
+            }
+            relations_block = self._render_relations(db_name)
+
+            def render(coll_names):
+                text = "".join(blocks[c] for c in coll_names)
+                return (text + relations_block).strip()
+
+            prompts = {None: render(db)}
+            for coll_name in db:
+                prompts[coll_name] = render(
+                    self._collect_relations(db, coll_name)
                 )
+            fields = {
+                coll_name: tuple(
+                    line.strip("- ").strip()
+                    for line in block.strip().splitlines()[1:]
+                )
+                for coll_name, block in blocks.items()
+            }
+            fragments[db_name] = MappingProxyType(
+                {
+                    "prompts": MappingProxyType(prompts),
+                    "fields": MappingProxyType(fields),
+                }
+            )
+        return MappingProxyType(fragments)
 
-            visited = set()
-            related_collections = {}
+    def invalidate(self, schema=None, relations=None):
+        """
+        Rebuilds the fragments after the schema changed, optionally
+        swapping in new collection or relationship definitions first.
+        """
+        if schema is not None:
+            self.schema = schema
+        if relations is not None:
+            self.relations = relations
+        self.fragments = self.compile()
+        self.version += 1
+        logger.info(
+            "🔄 Mongo schema fragments rebuilt (version %d)", self.version
+        )
 
-            def collect_relations(coll_name):
-                if coll_name in visited:
-                    return
-                visited.add(coll_name)
-                related_collections[coll_name] = db[coll_name]
-                for field_meta in db[coll_name].values():
-                    if isinstance(field_meta, dict) and "ref" in field_meta:
-                        ref_collection = field_meta["ref"][0]
-                        if ref_collection in db:
-                            collect_relations(ref_collection)
+    def _collect_relations(self, db: Dict, collection_name: str):
+        # Depth-first walk over "ref" fields, in first-visit order
+        visited = []
+        stack = [collection_name]
+        while stack:
+            coll_name = stack.pop()
+            if coll_name in visited:
+                continue
+            visited.append(coll_name)
+            refs = [
+                meta["ref"][0]
+                for meta in db[coll_name].values()
+                if isinstance(meta, dict) and "ref" in meta
+            ]
+            stack.extend(ref for ref in reversed(refs) if ref in db)
+        return visited
 
-            collect_relations(collection_name)
+    def _render_collection(self, coll_name: str, fields: Dict) -> str:
+        lines = [f"\n📂 {coll_name}:\n"]
+        for field, meta in fields.items():
+            type_info = meta["type"]
+            ref_info = (
+                f" (refers to {meta['ref'][1]} in {meta['ref'][0]})"
+                if "ref" in meta
+                else ""
+            )
+            lines.append(f"  - {field}: {type_info}{ref_info}\n")
+        return "".join(lines)
 
-        # Format for LLM: schema + relationship list
-        schema_description = ""
-        for coll_name, fields in related_collections.items():
-            schema_description += f"\n📂 {coll_name}:\n"
-            for field, meta in fields.items():
-                type_info = meta["type"]
-                ref_info = (
-                    f" (refers to {meta['ref'][1]} in {meta['ref'][0]})"
-                    if "ref" in meta
-                    else ""
-                )
-                schema_description += f"  - {field}: {type_info}{ref_info}\n"
+    def _render_relations(
+        self, db_name: str, collections: Optional[Dict] = None
+    ) -> str:
+        relations = [
+            rel
+            for rel in self.relations.get(db_name, [])
+            if collections is None
+            or (
+                rel["from"] in collections
+                and rel["foreign_collection"] in collections
+            )
+        ]
+        if not relations:
+            return ""
+        lines = [f"\n🔗 Relationships in {db_name}:\n"]
+        for rel in relations:
+            lines.append(
+                f"  - {rel['from']}.{rel['local_field']} → "
+                f"{rel['foreign_collection']}.{rel['foreign_field']}\n"
+            )
+        return "".join(lines)
+
+    def get_relations(self, db_name: str):
+        return self.relations.get(db_name.lower(), [])
+
+    def render_subset(
+        self, db_name: str, collections: Dict[str, Optional[Tuple[str, ...]]]
+    ) -> str:
+        """
+        Prompt text for a subset of collections and the relationships
+        between them. `collections` maps each collection to the field
+        names to keep, or None to keep every field.
+        """
+        db = self.schema[db_name]
+        text = ""
+        for coll_name, field_names in collections.items():
+            fields = db[coll_name]
+            if field_names is not None:
+                fields = {f: fields[f] for f in fields if f in field_names}
+            text += self._render_collection(coll_name, fields)
+        return (text + self._render_relations(db_name, collections)).strip()
 
-        # Add relation info
-        relations = self.relations.get(db_name, [])
-        if relations:
-            schema_description += f"\n🔗 Relationships in {db_name}:\n"
-            for rel in relations:
-                schema_description += f"  - {rel['from']}.{rel['local_field']} → {rel['foreign_collection']}.{rel['foreign_field']}\n"
+    def get_collection_names(self, db_name: str):
+        return list(self.schema.get(db_name.lower(), {}).keys())
+
+    def get_fields(
+        self, db_name: str, collection_name: str
+    ) -> Optional[Tuple[str, ...]]:
+        fragments = self.fragments.get(db_name.lower())
+        if fragments is None:
+            return None
+        return fragments["fields"].get(collection_name)
+
+    def get_schema(self, db_name: str, collection_name: Optional[str] = None):
+        fragments = self.fragments.get(db_name)
+        if fragments is None:
+            raise ValueError(f"Database '{db_name}' not found.")
 
-        return schema_description.strip()
+        prompts = fragments["prompts"]
+        if collection_name is not None and collection_name not in prompts:
+            raise ValueError(
+                f"Collection '{collection_name}' not found in database '{db_name}'."
+            )
+        return prompts[collection_name]
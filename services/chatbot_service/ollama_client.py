@@ -0,0 +1,311 @@
+import json
+import time
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional
+from config.config import Config
+from services.chatbot_service.query_completion import QueryCompletionDetector
+from services.deadline import cap_seconds, remaining
+from services.metrics import observe_ollama, ollama_seconds
+from services.log import get_logger
+
+logger = get_logger("llm")
+
+# Prose the model tends to append after the query; generation stops there
+STOP_SEQUENCES: List[str] = ["Explanation:", "\nNote:", "\nThis query"]
+
+# Ollama reports durations in nanoseconds under these keys
+TIMING_KEYS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_duration",
+    "eval_duration",
+)
+
+
+def extract_timings(result: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Ollama's durations in milliseconds plus its token counts.
+    """
+    timings = {
+        key.replace("duration", "ms"): round(result[key] / 1e6, 2)
+        for key in TIMING_KEYS
+        if key in result
+    }
+    for key in ("prompt_eval_count", "eval_count"):
+        if key in result:
+            timings[key] = result[key]
+    return timings
+
+
+class OllamaClient:
+    """
+    Long-lived Ollama client. One pooled httpx.AsyncClient is shared by
+    every request, each request asks Ollama to keep the model loaded for
+    `keep_alive`, and a background task warms the model at startup and
+    again whenever it has been idle for `warmup_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_url: str,
+        keep_alive: str = Config.OLLAMA_KEEP_ALIVE,
+        timeout: float = Config.OLLAMA_TIMEOUT,
+        max_connections: int = Config.OLLAMA_MAX_CONNECTIONS,
+        warmup_interval: float = Config.OLLAMA_WARMUP_INTERVAL,
+        prompt_template: str = Config.OLLAMA_PROMPT_TEMPLATE,
+    ) -> None:
+        self.model = model
+        self.api_url = api_url
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.warmup_interval = warmup_interval
+        # Chat template text before and after the prompt
+        self.prompt_head, _, self.prompt_tail = prompt_template.partition(
+            "{prompt}"
+        )
+        # Created on first use, inside the running event loop
+        self.client: Optional[httpx.AsyncClient] = None
+        self.last_used = 0.0
+        self.last_timings: Dict[str, float] = {}
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "warmups": 0,
+            "cold_loads": 0,
+            "load_ms": 0.0,
+            "prompt_eval_ms": 0.0,
+        }
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self.client
+
+    def _request_timeout(self) -> httpx.Timeout:
+        # Never wait on Ollama past the current request's deadline
+        return httpx.Timeout(
+            cap_seconds(self.timeout), connect=cap_seconds(5.0)
+        )
+
+    def _payload(
+        self,
+        prompt: str,
+        stream: bool,
+        context: Optional[List[int]] = None,
+        **options: Any,
+    ) -> Dict[str, Any]:
+        # Prompts are sent raw and wrapped in the chat template here, so a
+        # prefix encoded once (encode_prefix) plus the rest of the prompt
+        # reaches the model as the same text as the whole prompt would
+        if context is None:
+            prompt = self.prompt_head + prompt
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": prompt + self.prompt_tail,
+            "stream": stream,
+            "raw": True,
+            "keep_alive": self.keep_alive,
+            "options": {"stop": STOP_SEQUENCES, **options},
+        }
+        if context is not None:
+            # Continues from the tokens of the template head and prefix
+            payload["context"] = context
+        return payload
+
+    def _record(self, result: Dict[str, Any], warmup: bool = False) -> None:
+        self.last_used = time.monotonic()
+        timings = extract_timings(result)
+        self.stats["warmups" if warmup else "requests"] += 1
+        self.stats["load_ms"] += timings.get("load_ms", 0.0)
+        self.stats["prompt_eval_ms"] += timings.get("prompt_eval_ms", 0.0)
+        # Anything above a second of load time means the model was paged in
+        if timings.get("load_ms", 0.0) > 1000:
+            self.stats["cold_loads"] += 1
+        if not warmup:
+            self.last_timings = timings
+            observe_ollama(timings)
+
+    async def warmup(self) -> Dict[str, float]:
+        """
+        Loads the model (an empty prompt generates nothing) and resets
+        its keep-alive timer.
+        """
+        response = await self._get_client().post(
+            self.api_url,
+            json={
+                "model": self.model,
+                "prompt": "",
+                "stream": False,
+                "keep_alive": self.keep_alive,
+            },
+        )
+        response.raise_for_status()
+        result = response.json()
+        self._record(result, warmup=True)
+        return extract_timings(result)
+
+    async def _keep_warm(self) -> None:
+        while True:
+            attempted = time.monotonic()
+            try:
+                timings = await self.warmup()
+                logger.info(
+                    "🔥 Warmed %s (load %.0f ms)",
+                    self.model,
+                    timings.get("load_ms", 0),
+                )
+            except Exception as e:
+                logger.warning("⚠️ Ollama warmup failed: %s", e)
+            # Only re-warm after a full interval without real traffic
+            while True:
+                idle = time.monotonic() - max(self.last_used, attempted)
+                if idle >= self.warmup_interval:
+                    break
+                await asyncio.sleep(self.warmup_interval - idle)
+
+    def start(self) -> None:
+        if self._warmup_task is None and self.warmup_interval > 0:
+            self._warmup_task = asyncio.create_task(self._keep_warm())
+
+    async def close(self) -> None:
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            try:
+                await self._warmup_task
+            except asyncio.CancelledError:
+                pass
+            self._warmup_task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = self.stats["requests"] + self.stats["warmups"]
+        return {
+            **self.stats,
+            "avg_load_ms": (
+                round(self.stats["load_ms"] / calls, 2) if calls else 0.0
+            ),
+            "avg_prompt_eval_ms": (
+                round(self.stats["prompt_eval_ms"] / self.stats["requests"], 2)
+                if self.stats["requests"]
+                else 0.0
+            ),
+            "last": self.last_timings,
+        }
+
+    async def encode_prefix(self, prefix: str) -> List[int]:
+        """
+        Evaluates `prefix` once, after the chat template's head, and
+        returns its token context, so later requests can send only what
+        follows it.
+        """
+        async with asyncio.timeout(remaining()):
+            response = await self._get_client().post(
+                self.api_url,
+                json={
+                    **self._payload("", False, num_predict=1),
+                    "prompt": self.prompt_head + prefix,
+                },
+                timeout=self._request_timeout(),
+            )
+        response.raise_for_status()
+        result = response.json()
+        self._record(result, warmup=True)
+        context = result.get("context") or []
+        # Drop the token generated after the prefix
+        return context[: max(len(context) - result.get("eval_count", 0), 0)]
+
+    async def generate(
+        self, prompt: str, context: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Single blocking-style generation; returns Ollama's final JSON
+        with its durations converted under `timings`. Raises TimeoutError
+        when the request's deadline passes first.
+        """
+        async with asyncio.timeout(remaining()):
+            response = await self._get_client().post(
+                self.api_url,
+                json=self._payload(prompt, False, context),
+                timeout=self._request_timeout(),
+            )
+        response.raise_for_status()
+        result = response.json()
+        self._record(result)
+        return {**result, "timings": extract_timings(result)}
+
+    async def generate_until_complete(
+        self,
+        prompt: str,
+        dbms_type: str,
+        context: Optional[List[int]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Streams the generation and closes the request as soon as a
+        complete query has arrived, so the model never spends tokens on
+        the explanation that follows it.
+
+        Returns the same shape as `generate`, plus `early_stop` holding
+        the extracted query when the stream was cut short. Ollama only
+        reports durations on the final chunk, so an early stop carries
+        just the measured `first_token_ms`. Leaving early on the request's
+        deadline (TimeoutError) or a cancellation closes the connection
+        the same way, so Ollama stops generating.
+        """
+        detector = QueryCompletionDetector(dbms_type)
+        final: Dict[str, Any] = {}
+        early_stop: Optional[str] = None
+        started = time.perf_counter()
+        first_token_ms: Optional[float] = None
+
+        async with asyncio.timeout(remaining()):
+            async with self._get_client().stream(
+                "POST",
+                self.api_url,
+                json=self._payload(prompt, True, context),
+                timeout=self._request_timeout(),
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    if first_token_ms is None:
+                        # Load + prompt eval as seen from here; the only
+                        # figure available when the stream is cut short
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    early_stop = detector.feed(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        final = chunk
+                        break
+                    if early_stop is not None:
+                        # Leaving the block with the body unread closes this
+                        # pooled connection, which makes Ollama abort the rest
+                        # of the generation.
+                        break
+
+        self._record(final)
+        timings = extract_timings(final)
+        if first_token_ms is not None:
+            timings["first_token_ms"] = round(first_token_ms, 2)
+            self.last_timings = timings
+            ollama_seconds.observe(first_token_ms / 1000, "first_token")
+        return {
+            **final,
+            "response": detector.text,
+            "done": bool(final.get("done")),
+            "early_stop": early_stop,
+            "timings": timings,
+        }
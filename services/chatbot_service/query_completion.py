@@ -0,0 +1,133 @@
+import re
+from typing import Optional
+
+SQL_START = re.compile(
+    r"(?im)^[ \t]*(?:```[a-z]*[ \t]*\n?[ \t]*|sql:[ \t]*)?"
+    r"((?:select|with|insert|update|delete|replace|show|describe)\s)"
+)
+MONGO_START = re.compile(r"(db\.[A-Za-z_]|show collections\b)")
+
+QUOTES = "'\"`"
+OPENERS = "([{"
+CLOSERS = ")]}"
+
+
+class QueryCompletionDetector:
+    """
+    Incrementally scans streamed LLM output and reports the first
+    syntactically complete query.
+
+    SQL is complete at the first `;` outside quotes and comments. A Mongo
+    shell query is complete once its `db.coll.method(...)` chain has
+    balanced brackets and the next non-blank character does not continue
+    the chain with `.`. In both cases a closing markdown fence also ends
+    the query.
+    """
+
+    def __init__(self, dbms_type: str) -> None:
+        self.dbms_type = dbms_type
+        self.text = ""
+        self.start: Optional[int] = None
+        self.pos = 0
+        self.quote: Optional[str] = None
+        self.escaped = False
+        self.line_comment = False
+        self.block_comment = False
+        self.depth = 0
+        self.closed_at: Optional[int] = None
+        self.query: Optional[str] = None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Appends a streamed chunk; returns the complete query once one has
+        arrived, otherwise None.
+        """
+        if self.query is not None:
+            return self.query
+        self.text += chunk
+
+        if self.start is None:
+            pattern = SQL_START if self.dbms_type == "sql" else MONGO_START
+            match = pattern.search(self.text)
+            if not match:
+                return None
+            self.start = self.pos = match.start(1)
+            if match.group(1).startswith("show collections"):
+                self.query = "show collections"
+                return self.query
+
+        scan = self._scan_sql if self.dbms_type == "sql" else self._scan_mongo
+        self.query = scan()
+        return self.query
+
+    def _at_fence(self) -> bool:
+        return not (
+            self.quote or self.line_comment or self.block_comment
+        ) and self.text.startswith("```", self.pos)
+
+    def _in_literal(self, ch: str, nxt: str) -> bool:
+        """
+        Advances quote/comment state for `ch`; True while inside one.
+        """
+        if self.line_comment:
+            self.line_comment = ch != "\n"
+            return True
+        if self.block_comment:
+            if ch == "*" and nxt == "/":
+                self.block_comment = False
+                self.pos += 1
+            return True
+        if self.quote:
+            if self.escaped:
+                self.escaped = False
+            elif ch == "\\":
+                self.escaped = True
+            elif ch == self.quote:
+                self.quote = None
+            return True
+        if ch in QUOTES:
+            self.quote = ch
+            return True
+        if ch == "/" and nxt == "*":
+            self.block_comment = True
+            self.pos += 1
+            return True
+        return False
+
+    def _scan_sql(self) -> Optional[str]:
+        text = self.text
+        # Keep two characters of lookahead so a fence is never split
+        while self.pos < len(text) - 2:
+            if self._at_fence():
+                return text[self.start : self.pos].strip()
+            ch, nxt = text[self.pos], text[self.pos + 1]
+            if not self._in_literal(ch, nxt):
+                if ch == "-" and nxt == "-" or ch == "#":
+                    self.line_comment = True
+                elif ch == ";":
+                    return text[self.start : self.pos + 1].strip()
+            self.pos += 1
+        return None
+
+    def _scan_mongo(self) -> Optional[str]:
+        text = self.text
+        while self.pos < len(text) - 2:
+            ch, nxt = text[self.pos], text[self.pos + 1]
+            if self.closed_at is not None and not ch.isspace():
+                if ch == ".":
+                    self.closed_at = None
+                else:
+                    return text[self.start : self.closed_at + 1].strip()
+            if self._at_fence():
+                return text[self.start : self.pos].strip()
+            if not self._in_literal(ch, nxt):
+                if ch == "/" and nxt == "/":
+                    self.line_comment = True
+                elif ch in OPENERS:
+                    self.depth += 1
+                elif ch in CLOSERS:
+                    self.depth -= 1
+                    if self.depth == 0 and ch == ")":
+                        self.closed_at = self.pos
+            self.pos += 1
+        return None
@@ -1,3 +1,9 @@
+from types import MappingProxyType
+from services.log import get_logger
+
+logger = get_logger("schema")
+
+
 class SchemaLoader:
     def __init__(self):
         # Full table schemas
@@ -153,21 +159,98 @@ class SchemaLoader:
             "cora": {"paper": ["paper", "cites"], "cites": ["paper", "cites"]},
         }
 
-    def get_schema(self, db_name, table_name=None):
-        db = db_name.lower()
-        if db not in self.schemas:
-            return "Schema not available."
+        # Bumped on every rebuild so callers can tell fragments apart
+        self.version = 0
+        self.fragments = self.compile()
+
+    def compile(self):
+        """
+        Renders the prompt text for every database and table once.
+
+        Each database maps to its full-schema text (`None` key), the text
+        for every table together with its related tables, and the field
+        lines of each table. The result is read-only and replaced as a
+        whole by `invalidate`.
+        """
+        fragments = {}
+        for db, tables in self.schemas.items():
+            related_map = self.related_table_map.get(db, {})
+            prompts = {None: "\n".join(tables.values())}
+            for table in tables:
+                prompts[table] = "\n".join(
+                    tables[t]
+                    for t in related_map.get(table, [table])
+                    if t in tables
+                )
+            fields = {
+                table: tuple(
+                    line.strip("- ").strip()
+                    for line in text.strip().splitlines()
+                    if "-" in line
+                )
+                for table, text in tables.items()
+            }
+            fragments[db] = MappingProxyType(
+                {
+                    "prompts": MappingProxyType(prompts),
+                    "fields": MappingProxyType(fields),
+                }
+            )
+        return MappingProxyType(fragments)
 
-        # If no table mentioned → inject full DB schema
-        if not table_name:
-            return "\n".join(self.schemas[db].values())
+    def invalidate(self, schemas=None, related_table_map=None):
+        """
+        Rebuilds the fragments after the schema changed, optionally
+        swapping in new schema or relationship definitions first.
+        """
+        if schemas is not None:
+            self.schemas = schemas
+        if related_table_map is not None:
+            self.related_table_map = related_table_map
+        self.fragments = self.compile()
+        self.version += 1
+        logger.info(
+            "🔄 SQL schema fragments rebuilt (version %d)", self.version
+        )
+
+    def get_table_names(self, db_name):
+        return list(self.schemas.get(db_name.lower(), {}).keys())
+
+    def get_fields(self, db_name, table_name):
+        fragments = self.fragments.get(db_name.lower())
+        if fragments is None:
+            return None
+        return fragments["fields"].get(table_name.lower())
+
+    def get_join_paths(self, db_name):
+        return self.related_table_map.get(db_name.lower(), {})
 
-        table = table_name.lower()
+    def render_subset(self, db_name, tables):
+        """
+        Prompt text for a subset of tables. `tables` maps each table to
+        the column names to keep, or None to keep the whole table.
+        """
+        db = db_name.lower()
+        parts = []
+        for table, columns in tables.items():
+            if columns is None:
+                parts.append(self.schemas[db][table])
+                continue
+            lines = [
+                f"- {line}"
+                for line in self.get_fields(db, table)
+                if line.split(":", 1)[0].strip() in columns
+            ]
+            parts.append("\n".join([f"Table: {table}"] + lines))
+        return "\n".join(parts)
+
+    def get_schema(self, db_name, table_name=None):
+        fragments = self.fragments.get(db_name.lower())
+        if fragments is None:
+            return "Schema not available."
 
-        # If related tables defined, inject them all
-        related_tables = self.related_table_map.get(db, {}).get(table, [table])
-        return "\n".join(
-            self.schemas[db].get(t, "")
-            for t in related_tables
-            if t in self.schemas[db]
+        # No table mentioned → the full DB schema; otherwise the table
+        # together with its related tables
+        return fragments["prompts"].get(
+            table_name.lower() if table_name else None, ""
         )
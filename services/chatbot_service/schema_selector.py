@@ -0,0 +1,302 @@
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config.config import Config
+
+# Question words -> schema terms they stand for (both sides normalized)
+SYNONYMS: Dict[str, List[str]] = {
+    "film": ["movie"],
+    "picture": ["movie"],
+    "title": ["name", "movie"],
+    "rating": ["rank"],
+    "rated": ["rank"],
+    "released": ["year"],
+    "release": ["year"],
+    "category": ["genre"],
+    "cast": ["role", "actor"],
+    "character": ["role"],
+    "acted": ["actor", "role"],
+    "starred": ["actor", "role"],
+    "directed": ["director"],
+    "customer": ["client"],
+    "owner": ["client", "disp"],
+    "transaction": ["trans"],
+    "withdrawal": ["trans"],
+    "deposit": ["trans"],
+    "credit": ["card"],
+    "birthday": ["birth"],
+    "born": ["birth"],
+    "age": ["birth"],
+    "region": ["district"],
+    "city": ["district"],
+    "salary": ["district"],
+    "inhabitant": ["district"],
+    "unemployment": ["district"],
+    "crime": ["district"],
+    "male": ["gender"],
+    "female": ["gender"],
+    "men": ["gender"],
+    "women": ["gender"],
+    "sex": ["gender"],
+    "publication": ["paper"],
+    "article": ["paper"],
+    "citation": ["cite"],
+    "cited": ["cite"],
+    "citing": ["cite"],
+    "reference": ["cite"],
+    "label": ["class"],
+    "topic": ["class"],
+    "word": ["word", "content"],
+}
+
+# Terms too common in column names to say anything about a question
+IGNORED_TERMS = {"id", "a", "to", "mixed", "type"}
+
+# A column term found in more tables than this cannot pick tables alone
+MAX_COLUMN_TERM_TABLES = 1
+
+
+def normalize_term(word: str) -> str:
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def identifier_terms(name: str) -> Set[str]:
+    parts = [p for p in re.split(r"[^a-zA-Z0-9]+", name) if p]
+    terms = {normalize_term(p) for p in parts}
+    return terms - IGNORED_TERMS
+
+
+def question_words(nl_query: str) -> Set[str]:
+    words = {normalize_term(w) for w in re.findall(r"[a-zA-Z]+", nl_query)}
+    expanded = set(words)
+    for word in words:
+        expanded.update(SYNONYMS.get(word, []))
+    return expanded - IGNORED_TERMS
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough llama-style token count: words, numbers and punctuation marks.
+    """
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+class DatabaseIndex:
+    """
+    Inverted index over one database's table and column names, plus the
+    join graph used to keep the selected tables connected.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, List[str]],
+        edges: Dict[str, Set[str]],
+        join_paths: Dict[str, List[str]],
+    ) -> None:
+        self.tables = list(columns)
+        self.columns = columns
+        self.edges = edges
+        self.join_paths = join_paths
+        # Tables are matched on their whole name; compound names such as
+        # movies_directors only when every part appears in the question
+        self.table_terms: Dict[Any, Set[str]] = {}
+        self.column_terms: Dict[str, Set[Tuple[str, str]]] = {}
+        for table, names in columns.items():
+            terms = frozenset(identifier_terms(table))
+            for term in terms if len(terms) == 1 else ():
+                self.table_terms.setdefault(term, set()).add(table)
+            if len(terms) > 1:
+                self.table_terms.setdefault(terms, set()).add(table)
+            for column in names:
+                for term in identifier_terms(column):
+                    self.column_terms.setdefault(term, set()).add(
+                        (table, column)
+                    )
+
+    def select(
+        self, nl_query: str
+    ) -> Optional[Dict[str, Optional[Tuple[str, ...]]]]:
+        """
+        Returns the tables to show mapped to the columns to keep (None for
+        all of them), or None when the question names nothing in the
+        schema and the full schema should be used.
+        """
+        words = question_words(nl_query)
+        seeds: Set[str] = set()
+        for term, tables in self.table_terms.items():
+            if term in words or (
+                isinstance(term, frozenset) and term <= words
+            ):
+                seeds.update(tables)
+
+        matched_columns: Dict[str, Set[str]] = {}
+        for word in words:
+            hits = self.column_terms.get(word, set())
+            hit_tables = {table for table, _ in hits}
+            if hit_tables & seeds:
+                hits = {(t, c) for t, c in hits if t in seeds}
+            elif len(hit_tables) <= MAX_COLUMN_TERM_TABLES:
+                seeds.update(hit_tables)
+            else:
+                continue
+            for table, column in hits:
+                matched_columns.setdefault(table, set()).add(column)
+
+        if not seeds:
+            return None
+
+        selected = self._connect(seeds)
+        result: Dict[str, Optional[Tuple[str, ...]]] = {}
+        for table in self.tables:
+            if table not in selected:
+                continue
+            columns = self.columns[table]
+            wanted = matched_columns.get(table)
+            if not wanted or len(columns) <= Config.SCHEMA_PRUNING_MAX_COLUMNS:
+                result[table] = None
+                continue
+            # Wide table: keep the asked-for columns and the join keys
+            result[table] = tuple(
+                c
+                for c in columns
+                if c in wanted or c == "id" or c.lower().endswith("_id")
+            )
+        return result
+
+    def _connect(self, seeds: Set[str]) -> Set[str]:
+        """
+        Grows the seed tables into a connected set by attaching each seed
+        through its shortest join path. A curated join path covering every
+        seed wins when it is no larger.
+        """
+        if len(seeds) < 2:
+            return set(seeds)
+
+        ordered = [t for t in self.tables if t in seeds]
+        selected = {ordered[0]}
+        for target in ordered[1:]:
+            if target not in selected:
+                selected.update(self._shortest_path(selected, target))
+
+        # Prefer a curated join path unless it drags in extra tables
+        for seed in ordered:
+            path = set(self.join_paths.get(seed, ()))
+            if seeds <= path and len(path) <= len(selected):
+                return path
+        return selected
+
+    def _shortest_path(self, sources: Set[str], target: str) -> List[str]:
+        previous: Dict[str, Optional[str]] = {s: None for s in sources}
+        queue = deque(sources)
+        while queue:
+            table = queue.popleft()
+            if table == target:
+                path = []
+                while table is not None and table not in sources:
+                    path.append(table)
+                    table = previous[table]
+                return path
+            for neighbour in self.edges.get(table, ()):
+                if neighbour not in previous:
+                    previous[neighbour] = table
+                    queue.append(neighbour)
+        # Not joinable: still show the table the question asked about
+        return [target]
+
+
+def key_column_edges(columns: Dict[str, List[str]]) -> Dict[str, Set[str]]:
+    """
+    Join graph inferred from key column names: a table holding `x_id` (or
+    `*_x_id`) joins table `x`/`xs`. Keys with no owning table link the
+    tables that share them instead.
+    """
+    edges: Dict[str, Set[str]] = {t: set() for t in columns}
+    by_key: Dict[str, Set[str]] = {}
+    for table, names in columns.items():
+        for column in names:
+            if column.lower().endswith("_id"):
+                by_key.setdefault(column.lower(), set()).add(table)
+
+    for key, tables in by_key.items():
+        owners = {
+            t
+            for t in columns
+            if key.endswith(f"{normalize_term(t)}_id") or key == f"{t}_id"
+        }
+        for owner in owners or tables:
+            for table in tables - {owner}:
+                edges[owner].add(table)
+                edges[table].add(owner)
+    return edges
+
+
+class SchemaSelector:
+    """
+    Picks the part of a database schema a question needs.
+
+    Indexes are built per (dbms, database) from the schema loaders and
+    rebuilt whenever a loader's version changes.
+    """
+
+    def __init__(self, sql_schema_loader, mongo_schema_loader) -> None:
+        self.sql_schema_loader = sql_schema_loader
+        self.mongo_schema_loader = mongo_schema_loader
+        self._indexes: Dict[Tuple[str, str], Tuple[int, DatabaseIndex]] = {}
+
+    def _index(self, dbms_type: str, db_name: str) -> DatabaseIndex:
+        loader = (
+            self.sql_schema_loader
+            if dbms_type == "sql"
+            else self.mongo_schema_loader
+        )
+        key = (dbms_type, db_name.lower())
+        cached = self._indexes.get(key)
+        if cached is not None and cached[0] == loader.version:
+            return cached[1]
+
+        table_names = (
+            loader.get_table_names(db_name)
+            if dbms_type == "sql"
+            else loader.get_collection_names(db_name)
+        )
+        columns = {
+            table: [
+                line.split(":", 1)[0].strip()
+                for line in loader.get_fields(db_name, table) or ()
+            ]
+            for table in table_names
+        }
+        if dbms_type == "sql":
+            edges = key_column_edges(columns)
+            join_paths = loader.get_join_paths(db_name)
+        else:
+            edges = {t: set() for t in columns}
+            for rel in loader.get_relations(db_name):
+                a, b = rel["from"], rel["foreign_collection"]
+                if a in edges and b in edges:
+                    edges[a].add(b)
+                    edges[b].add(a)
+            join_paths = {}
+
+        index = DatabaseIndex(columns, edges, join_paths)
+        self._indexes[key] = (loader.version, index)
+        return index
+
+    def prune(
+        self, nl_query: str, dbms_type: str, db_name: str
+    ) -> Optional[str]:
+        """
+        Schema text restricted to what the question needs, or None to
+        fall back to the full schema.
+        """
+        selection = self._index(dbms_type, db_name).select(nl_query)
+        if selection is None:
+            return None
+        if dbms_type == "sql":
+            return self.sql_schema_loader.render_subset(db_name, selection)
+        return self.mongo_schema_loader.render_subset(
+            db_name.lower(), selection
+        )
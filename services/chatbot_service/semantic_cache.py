@@ -0,0 +1,334 @@
+import re
+import zlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from config.config import Config
+
+# Words that carry no meaning for matching a question to a query; the
+# database/dbms names are dropped too since the index is partitioned by them.
+STOP_WORDS = {
+    "a", "an", "the", "in", "of", "from", "for", "with", "to", "on", "at",
+    "by", "and", "or", "is", "are", "was", "were", "be", "me", "show",
+    "list", "give", "get", "find", "what", "which", "who", "all", "please",
+    "database", "db", "table", "tables", "collection", "collections",
+    "mysql", "sql", "mongodb", "mongo", "using", "each", "per", "there",
+}  # fmt: skip
+
+SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ed", "es", "s")
+
+# Words that flip or reorder a question's result while barely moving its
+# embedding; mapped to one token per meaning so they must match exactly
+POLARITY_WORDS = {
+    "not": "not", "no": "not", "never": "not", "without": "not",
+    "above": "above", "over": "above", "greater": "above",
+    "higher": "above", "below": "below", "under": "below",
+    "lower": "below", "more": "more", "most": "more", "less": "less",
+    "fewer": "less", "least": "less", "before": "before",
+    "after": "after", "min": "min", "minimum": "min", "max": "max",
+    "maximum": "max", "asc": "asc", "ascending": "asc", "desc": "desc",
+    "descending": "desc", "first": "first", "last": "last",
+}  # fmt: skip
+
+# Only read questions share queries; a near-duplicate insert, update or
+# delete must never be answered with another question's write
+CACHEABLE_INTENTS = ("query",)
+
+WORD_WEIGHT = 3.0
+TRIGRAM_WEIGHT = 1.0
+
+
+def _stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def question_terms(nl_query: str, db_name: str = "") -> List[str]:
+    db = db_name.lower()
+    return [
+        _stem(word)
+        for word in re.findall(r"[a-z0-9_]+", nl_query.lower())
+        if word not in STOP_WORDS and word != db
+    ]
+
+
+def question_literals(nl_query: str) -> Tuple[str, ...]:
+    """
+    Numbers, quoted strings and negation/comparison/ordering words must
+    match exactly for two questions to share a query: "top 10" and
+    "top 20", or "cited" and "not cited", embed almost identically.
+    """
+    numbers = re.findall(r"\d+(?:\.\d+)?", nl_query)
+    quoted = re.findall(r"\"([^\"]*)\"|'([^']*)'", nl_query)
+    lowered = re.sub(r"n't\b", " not", nl_query.lower())
+    polarity = [
+        POLARITY_WORDS[word]
+        for word in re.findall(r"[a-z]+", lowered)
+        if word in POLARITY_WORDS
+    ]
+    return (
+        tuple(sorted(numbers))
+        + tuple(sorted(a or b for a, b in quoted))
+        + tuple(sorted(polarity))
+    )
+
+
+def embed_question(
+    nl_query: str, db_name: str = "", dim: int = Config.SEMANTIC_CACHE_DIM
+) -> np.ndarray:
+    """
+    Offline sentence vector built from signed feature hashing of stemmed
+    words and their character trigrams, L2-normalised so a dot product
+    is the cosine similarity.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for term in question_terms(nl_query, db_name):
+        padded = f" {term} "
+        features = [(f"w:{term}", WORD_WEIGHT)] + [
+            (f"c:{padded[i:i + 3]}", TRIGRAM_WEIGHT)
+            for i in range(len(padded) - 2)
+        ]
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Dense cosine index of one partition. Rows are allocated on first use
+    and grow by doubling; removing an entry moves the last row into its
+    slot, and storage shrinks again once it is a quarter full.
+    """
+
+    MIN_ROWS = 16
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.payloads: List[Tuple[Tuple[str, ...], str, str]] = []
+        self.ids: List[int] = []
+        self.slots: Dict[int, int] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def _resize(self, rows: int) -> None:
+        resized = np.zeros((rows, self.dim), dtype=np.float32)
+        resized[: self.size] = self.vectors[: self.size]
+        self.vectors = resized
+
+    def add(
+        self,
+        entry_id: int,
+        vector: np.ndarray,
+        literals: Tuple[str, ...],
+        question: str,
+        response: str,
+    ) -> None:
+        if self.size == len(self.vectors):
+            self._resize(max(self.MIN_ROWS, 2 * len(self.vectors)))
+        slot = self.size
+        self.vectors[slot] = vector
+        self.payloads.append((literals, question, response))
+        self.ids.append(entry_id)
+        self.slots[entry_id] = slot
+
+    def remove(self, entry_id: int) -> None:
+        slot = self.slots.pop(entry_id)
+        last = self.size - 1
+        if slot != last:
+            self.vectors[slot] = self.vectors[last]
+            self.payloads[slot] = self.payloads[last]
+            self.ids[slot] = self.ids[last]
+            self.slots[self.ids[slot]] = slot
+        self.payloads.pop()
+        self.ids.pop()
+        if self.MIN_ROWS < len(self.vectors) and self.size * 4 <= len(
+            self.vectors
+        ):
+            self._resize(len(self.vectors) // 2)
+
+    def nearest(
+        self, vector: np.ndarray, literals: Tuple[str, ...], threshold: float
+    ) -> Optional[Tuple[float, str, str, int]]:
+        if not self.size:
+            return None
+        scores = self.vectors[: self.size] @ vector
+        if scores.max() < threshold:
+            return None
+        # Only the few best candidates need the exact literal check
+        k = min(8, self.size)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        for idx in candidates[np.argsort(-scores[candidates])]:
+            score = float(scores[idx])
+            if score < threshold:
+                break
+            entry_literals, question, response = self.payloads[idx]
+            if entry_literals == literals:
+                return score, question, response, self.ids[idx]
+        return None
+
+
+class SemanticCache:
+    """
+    Near-duplicate question cache for read questions. One VectorIndex is
+    kept per (dbms_type, db_name, table, intent, model, schema version)
+    partition so a match can only return a query generated for the same
+    target and schema.
+
+    `capacity` bounds the entries of all partitions together (each holds
+    a `dim` float32 vector); past it, the least recently stored or
+    matched entry is evicted. A newer schema version drops that dbms'
+    older partitions, and emptied partitions are removed.
+    """
+
+    def __init__(
+        self,
+        threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+        dim: int = Config.SEMANTIC_CACHE_DIM,
+        capacity: int = Config.SEMANTIC_CACHE_CAPACITY,
+    ) -> None:
+        self.threshold = threshold
+        self.dim = dim
+        self.capacity = capacity
+        self.indexes: Dict[Tuple, VectorIndex] = {}
+        # (partition, entry id) in least recently used order
+        self._lru: "OrderedDict[Tuple[Tuple, int], None]" = OrderedDict()
+        self._next_id = 0
+        # Latest schema version seen per dbms_type
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    def lookup(
+        self,
+        nl_query: str,
+        db_name: str,
+        dbms_type: str,
+        intent: str,
+        model: str,
+        schema_version: int = 0,
+        table_name: Optional[str] = None,
+    ) -> Optional[Tuple[float, str, str]]:
+        """
+        Returns (similarity, matched_question, response) for the closest
+        past question above the threshold, or None. Intents other than
+        CACHEABLE_INTENTS never match.
+        """
+        if intent not in CACHEABLE_INTENTS:
+            return None
+        key = self._partition(
+            dbms_type, db_name, table_name, intent, model, schema_version
+        )
+        vector = embed_question(nl_query, db_name, self.dim)
+        literals = question_literals(nl_query)
+        with self._lock:
+            index = self.indexes.get(key)
+            match = (
+                index.nearest(vector, literals, self.threshold)
+                if index is not None
+                else None
+            )
+            self.stats["hits" if match else "misses"] += 1
+            if match is None:
+                return None
+            self._lru.move_to_end((key, match[3]))
+        return match[:3]
+
+    def add(
+        self,
+        nl_query: str,
+        db_name: str,
+        dbms_type: str,
+        intent: str,
+        model: str,
+        response: str,
+        schema_version: int = 0,
+        table_name: Optional[str] = None,
+    ) -> None:
+        if intent not in CACHEABLE_INTENTS or self.capacity <= 0:
+            return
+        key = self._partition(
+            dbms_type, db_name, table_name, intent, model, schema_version
+        )
+        vector = embed_question(nl_query, db_name, self.dim)
+        literals = question_literals(nl_query)
+        with self._lock:
+            latest = self._versions.get(dbms_type)
+            if latest is not None and schema_version < latest:
+                # Generated against a schema that has since been replaced
+                return
+            if latest is None or schema_version > latest:
+                self._versions[dbms_type] = schema_version
+                self._drop_superseded(dbms_type, schema_version)
+
+            index = self.indexes.get(key)
+            if index is None:
+                index = VectorIndex(self.dim)
+                self.indexes[key] = index
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add(entry_id, vector, literals, nl_query, response)
+            self._lru[(key, entry_id)] = None
+            self.stats["stores"] += 1
+            while len(self._lru) > self.capacity:
+                (oldest, oldest_id), _ = self._lru.popitem(last=False)
+                self._remove(oldest, oldest_id)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: Tuple, entry_id: int) -> None:
+        index = self.indexes[key]
+        index.remove(entry_id)
+        if not index.size:
+            del self.indexes[key]
+
+    def _drop_superseded(self, dbms_type: str, version: int) -> None:
+        stale = [
+            key
+            for key in self.indexes
+            if key[0] == dbms_type and key[-1] < version
+        ]
+        for key in stale:
+            for entry_id in self.indexes.pop(key).ids:
+                del self._lru[(key, entry_id)]
+
+    @staticmethod
+    def _partition(
+        dbms_type: str,
+        db_name: str,
+        table_name: Optional[str],
+        intent: str,
+        model: str,
+        schema_version: int,
+    ) -> Tuple:
+        return (
+            dbms_type,
+            db_name.lower(),
+            (table_name or "").lower(),
+            intent,
+            model,
+            schema_version,
+        )
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._lru),
+                "partitions": len(self.indexes),
+                "hit_rate": (
+                    round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+                ),
+            }
@@ -0,0 +1,310 @@
+import time
+from collections import OrderedDict
+from config.config import Config
+from services.db_service.mongo_parser import compile_mongo_query
+from services.db_service.sql_executor import prepare_sql
+from services.db_service.sql_pagination import page_plan
+from typing import Any, Dict, List, Optional, Tuple
+from services.log import get_logger
+
+logger = get_logger("cost")
+
+# Verdicts are reused for repeated queries for this long (s)
+VERDICT_TTL = 300
+VERDICT_CACHE_SIZE = 1024
+
+
+class CostVerdict:
+    """
+    Planner estimate for one query and what the guard decided: "allowed",
+    "limited" (run with a LIMIT of `limit` rows) or "rejected".
+    """
+
+    __slots__ = ("rows", "cost", "full_scans", "action", "limit", "reason")
+
+    def __init__(
+        self, rows: Optional[float], cost: float, full_scans: List[str]
+    ) -> None:
+        self.rows = rows
+        self.cost = cost
+        self.full_scans = full_scans
+        self.action = "allowed"
+        self.limit: Optional[int] = None
+        self.reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        estimate = {
+            "rows": self.rows,
+            "cost": self.cost,
+            "full_scans": self.full_scans,
+            "action": self.action,
+        }
+        if self.limit is not None:
+            estimate["limit"] = self.limit
+        if self.reason is not None:
+            estimate["reason"] = self.reason
+        return estimate
+
+
+def mysql_estimate(plan: Dict[str, Any]) -> CostVerdict:
+    """
+    Reads an EXPLAIN FORMAT=JSON plan: the optimizer's total query_cost,
+    the largest row count any join step produces, and the tables read
+    with a full scan (access_type ALL).
+    """
+    rows = 0.0
+    block_costs: List[float] = []
+    full_scans: List[str] = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        nonlocal rows
+        if "table_name" in node:
+            rows = max(rows, float(node.get("rows_produced_per_join", 0)))
+            if node.get("access_type") == "ALL":
+                full_scans.append(node["table_name"])
+        if "query_cost" in node.get("cost_info", {}):
+            block_costs.append(float(node["cost_info"]["query_cost"]))
+        for value in node.values():
+            walk(value)
+
+    walk(plan)
+    top = plan.get("query_block", {}).get("cost_info", {})
+    # UNIONs only carry costs on their member blocks
+    cost = (
+        float(top["query_cost"]) if "query_cost" in top else sum(block_costs)
+    )
+    return CostVerdict(rows, cost, full_scans)
+
+
+# Aggregation stages that return fewer documents than they read
+REDUCING_STAGES = (
+    "$match",
+    "$group",
+    "$count",
+    "$sample",
+    "$bucket",
+    "$bucketAuto",
+    "$sortByCount",
+    "$facet",
+    "$limit",
+)
+
+
+def plan_stages(explain: Any, stage: str) -> List[Dict[str, Any]]:
+    """
+    The `stage` nodes of the winning plan(s) in a Mongo explain output.
+    Rejected plans and per-plan execution traces are skipped.
+    """
+    found: List[Dict[str, Any]] = []
+
+    def walk(node: Any, winning: bool) -> None:
+        if isinstance(node, list):
+            for item in node:
+                walk(item, winning)
+            return
+        if not isinstance(node, dict):
+            return
+        if winning and node.get("stage") == stage:
+            found.append(node)
+        for key, value in node.items():
+            if key in ("rejectedPlans", "allPlansExecution"):
+                continue
+            walk(value, winning or key == "winningPlan")
+
+    walk(explain, False)
+    return found
+
+
+def mongo_scan_estimate(
+    explain: Dict[str, Any], documents: float, reducing: bool
+) -> Tuple[Optional[float], float]:
+    """
+    Documents returned (None when unknown) and documents examined by a
+    Mongo query, out of a collection of `documents`, from the winning
+    plan of a queryPlanner explain. A collection scan examines every
+    document and, without a filter or a `reducing` stage, returns them
+    all; an index scan gives no estimate, so its row count is left to
+    the executors' limits.
+    """
+    scans = plan_stages(explain, "COLLSCAN")
+    if not scans:
+        return None, 0.0
+    filtered = any(scan.get("filter") for scan in scans)
+    return (None if filtered or reducing else documents), documents
+
+
+class CostGuard:
+    """
+    Pre-execution cost gate for generated queries.
+
+    MySQL queries are estimated with EXPLAIN FORMAT=JSON. For Mongo, rows
+    and documents examined come from explain (see mongo_scan_estimate),
+    and every `$lookup` adds one index probe per input document, or a
+    scan of the foreign collection per input document when its
+    foreignField is not indexed. A query whose rows cannot be estimated
+    is only held to `max_cost`.
+
+    A query over `max_cost` is rejected. One without a LIMIT of its own
+    that is over `max_rows` is capped at `limit` rows when `action` is
+    "limit", and rejected otherwise. Queries that cannot be explained run as is,
+    so a bad estimate never blocks a valid query; the executors' time
+    limits are the backstop.
+    """
+
+    def __init__(
+        self,
+        sql_executor,
+        mongo_executor,
+        max_cost: float = Config.COST_GUARD_MAX_COST,
+        max_rows: float = Config.COST_GUARD_MAX_ROWS,
+        action: str = Config.COST_GUARD_ACTION,
+        limit: int = Config.COST_GUARD_LIMIT,
+    ) -> None:
+        self.sql_executor = sql_executor
+        self.mongo_executor = mongo_executor
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.limit = limit
+        # (dbms, db, query) -> (expires_at, verdict)
+        self._verdicts: OrderedDict = OrderedDict()
+        self.stats: Dict[str, int] = {
+            "checked": 0,
+            "allowed": 0,
+            "limited": 0,
+            "rejected": 0,
+            "unavailable": 0,
+        }
+
+    async def check(
+        self, dbms_type: str, query: str, db_name: Optional[str]
+    ) -> Optional[CostVerdict]:
+        """
+        Verdict for a query, or None when it could not be estimated.
+        """
+        key = (dbms_type, (db_name or "").lower(), query)
+        cached = self._verdicts.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._verdicts.move_to_end(key)
+            return cached[1]
+
+        try:
+            if dbms_type == "sql":
+                verdict, bounded = await self._estimate_sql(query, db_name)
+            elif dbms_type == "mongo":
+                verdict, bounded = await self._estimate_mongo(query, db_name)
+            else:
+                return None
+        except Exception as e:
+            logger.warning("⚠️ Cost estimate failed, running unchecked: %s", e)
+            self.stats["unavailable"] += 1
+            return None
+        if verdict is None:
+            return None
+
+        self._decide(verdict, bounded)
+        self.stats["checked"] += 1
+        self.stats[verdict.action] += 1
+        logger.debug(
+            "💰 Estimated %s rows, cost %.0f -> %s",
+            "?" if verdict.rows is None else f"{verdict.rows:.0f}",
+            verdict.cost,
+            verdict.action,
+        )
+        self._verdicts[key] = (time.monotonic() + VERDICT_TTL, verdict)
+        while len(self._verdicts) > VERDICT_CACHE_SIZE:
+            self._verdicts.popitem(last=False)
+        return verdict
+
+    def _decide(self, verdict: CostVerdict, bounded: bool) -> None:
+        if verdict.cost > self.max_cost:
+            verdict.action = "rejected"
+            verdict.reason = (
+                f"Estimated cost {verdict.cost:.0f} exceeds "
+                f"{self.max_cost:.0f}"
+            )
+            if verdict.full_scans:
+                verdict.reason += (
+                    f" (full scans of {', '.join(verdict.full_scans)})"
+                )
+        elif (
+            verdict.rows is not None
+            and verdict.rows > self.max_rows
+            and not bounded
+        ):
+            # Planner row counts ignore LIMIT, so only unbounded queries
+            # are held to max_rows
+            if self.action == "limit":
+                verdict.action = "limited"
+                verdict.limit = self.limit
+            else:
+                verdict.action = "rejected"
+                verdict.reason = (
+                    f"Estimated {verdict.rows:.0f} rows exceeds "
+                    f"{self.max_rows:.0f}"
+                )
+
+    async def _estimate_sql(
+        self, query: str, db_name: Optional[str]
+    ) -> Tuple[Optional[CostVerdict], bool]:
+        plan = await self.sql_executor.explain(query, db_name)
+        if plan is None:
+            return None, False
+        # No paging plan means the query already has its own LIMIT
+        bounded = page_plan(prepare_sql(query).sql) is None
+        return mysql_estimate(plan), bounded
+
+    async def _estimate_mongo(
+        self, query: str, db_name: str
+    ) -> Tuple[Optional[CostVerdict], bool]:
+        explain = await self.mongo_executor.explain(query, db_name)
+        if explain is None:
+            return None, False
+        plan = compile_mongo_query(query)
+        db = self.mongo_executor.client[db_name]
+        documents = float(await db[plan.collection].estimated_document_count())
+        reducing = any(
+            isinstance(stage, dict)
+            and any(k in stage for k in REDUCING_STAGES)
+            for stage in plan.pipeline
+        )
+        rows, cost = mongo_scan_estimate(explain, documents, reducing)
+        full_scans: List[str] = []
+        if plan_stages(explain, "COLLSCAN"):
+            full_scans.append(plan.collection)
+
+        # Documents entering the $lookups: all of them after a collection
+        # scan, unknown after an index scan
+        inputs = documents if full_scans else rows
+        for stage in plan.pipeline:
+            spec = stage.get("$lookup") if isinstance(stage, dict) else None
+            if (
+                inputs is None
+                or not isinstance(spec, dict)
+                or not isinstance(spec.get("from"), str)
+            ):
+                continue
+            foreign = db[spec["from"]]
+            field = spec.get("foreignField")
+            if field is not None and await self._has_index(foreign, field):
+                cost += inputs
+            else:
+                # Every input document scans the foreign collection
+                full_scans.append(spec["from"])
+                cost += inputs * await foreign.estimated_document_count()
+        return CostVerdict(rows, cost, full_scans), plan.is_bounded()
+
+    async def _has_index(self, coll, field: str) -> bool:
+        if field == "_id":
+            return True
+        indexes = await coll.index_information()
+        return any(index["key"][0][0] == field for index in indexes.values())
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "cached_verdicts": len(self._verdicts)}
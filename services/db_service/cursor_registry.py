@@ -0,0 +1,144 @@
+import time
+import asyncio
+import secrets
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from config.config import Config
+from services.log import get_logger
+
+logger = get_logger("mongo")
+
+
+class OpenCursor:
+    """
+    A live pymongo cursor parked between pages, plus the documents read
+    ahead of the last page (used to tell whether another page exists).
+    """
+
+    __slots__ = ("cursor", "db_name", "page_size", "pending", "last_used")
+
+    def __init__(
+        self,
+        cursor: Any,
+        db_name: str,
+        page_size: int,
+        pending: List[Any],
+    ) -> None:
+        self.cursor = cursor
+        self.db_name = db_name
+        self.page_size = page_size
+        self.pending = pending
+        self.last_used = time.monotonic()
+
+
+class CursorRegistry:
+    """
+    Keeps open Mongo cursors between pages so the next page is read from
+    the same server cursor instead of re-running the query with `skip`.
+
+    Each page hands out a fresh id and `take` removes the cursor while it
+    is read, so a cursor never serves two requests at once and a stale
+    id cannot replay a page. Cursors idle for longer than `idle_ttl`
+    seconds are closed by a background sweep; beyond `max_cursors` the
+    least recently used one is closed.
+    """
+
+    def __init__(
+        self,
+        max_cursors: int = Config.MONGO_CURSOR_MAX,
+        idle_ttl: float = Config.MONGO_CURSOR_IDLE_TTL,
+    ) -> None:
+        self.max_cursors = max_cursors
+        self.idle_ttl = idle_ttl
+        self._cursors: "OrderedDict[str, OpenCursor]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "opened": 0,
+            "resumed": 0,
+            "exhausted": 0,
+            "expired": 0,
+            "evicted": 0,
+            "discarded": 0,
+        }
+
+    async def add(self, entry: OpenCursor, resumed: bool = False) -> str:
+        cursor_id = secrets.token_urlsafe(16)
+        entry.last_used = time.monotonic()
+        self._cursors[cursor_id] = entry
+        self.stats["resumed" if resumed else "opened"] += 1
+        while len(self._cursors) > self.max_cursors:
+            _, oldest = self._cursors.popitem(last=False)
+            self.stats["evicted"] += 1
+            await self._close(oldest)
+        return cursor_id
+
+    def take(self, cursor_id: str) -> Optional[OpenCursor]:
+        """
+        Removes and returns a parked cursor, or None when it expired,
+        was evicted or has already been read.
+        """
+        entry = self._cursors.pop(cursor_id, None)
+        if entry is not None and self._idle(entry):
+            self.stats["expired"] += 1
+            asyncio.ensure_future(self._close(entry))
+            return None
+        return entry
+
+    async def finish(self, entry: OpenCursor) -> None:
+        self.stats["exhausted"] += 1
+        await self._close(entry)
+
+    async def discard(self, entry: OpenCursor) -> None:
+        """
+        Closes a cursor whose read failed or was cancelled.
+        """
+        self.stats["discarded"] += 1
+        await self._close(entry)
+
+    def _idle(self, entry: OpenCursor) -> bool:
+        return time.monotonic() - entry.last_used > self.idle_ttl
+
+    async def _close(self, entry: OpenCursor) -> None:
+        try:
+            # Shielded: a cancelled caller must not leave it open
+            await asyncio.shield(entry.cursor.close())
+        except Exception as e:
+            logger.warning("⚠️ Failed to close Mongo cursor: %s", e)
+
+    async def sweep(self) -> int:
+        expired = [
+            cursor_id
+            for cursor_id, entry in self._cursors.items()
+            if self._idle(entry)
+        ]
+        for cursor_id in expired:
+            entry = self._cursors.pop(cursor_id)
+            self.stats["expired"] += 1
+            await self._close(entry)
+        if expired:
+            logger.info("🧹 Closed %d idle Mongo cursors", len(expired))
+        return len(expired)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.idle_ttl / 2, 1))
+            await self.sweep()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._cursors:
+            _, entry = self._cursors.popitem()
+            await self._close(entry)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "open": len(self._cursors)}
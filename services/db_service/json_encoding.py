@@ -0,0 +1,57 @@
+import json
+import datetime
+from decimal import Decimal
+from typing import Any
+from bson import json_util
+
+JSON_NATIVE = (str, int, float, bool, type(None))
+
+
+def json_default(value: Any) -> Any:
+    """
+    `default=` hook for json.dumps covering the driver types FastAPI's
+    encoder would otherwise handle for us.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
+
+
+def json_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, default=json_default, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def ndjson_line(obj: Any) -> bytes:
+    return json_bytes(obj) + b"\n"
+
+
+def bson_to_jsonable(value: Any) -> Any:
+    """
+    Converts a pymongo result to JSON-native Python values in one walk.
+    Plain values pass through untouched; BSON types (ObjectId, datetime,
+    Decimal128, ...) get the same relaxed Extended JSON form that
+    json_util.dumps would give them.
+    """
+    value_type = type(value)
+    if value_type in JSON_NATIVE:
+        return value
+    if isinstance(value, dict):
+        return {key: bson_to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [bson_to_jsonable(item) for item in value]
+    if isinstance(value, int):
+        # Int64 is an int subclass; plain int keeps the output native
+        return int(value)
+    return json_util.default(value, json_util.DEFAULT_JSON_OPTIONS)
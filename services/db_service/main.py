@@ -1,104 +1,483 @@
 import time
-from services.db_service.sql_executor import sql_executor
+import asyncio
+from contextlib import aclosing
+from services.db_service.sql_executor import sql_executor, prepare_sql
 from services.db_service.mongo_executor import mongo_executor
-from services.chatbot_service.main import query_generator
+from services.db_service.json_encoding import ndjson_line
+from services.db_service.schema_catalog import SchemaCatalog
+from services.db_service.single_flight import SingleFlight
+from services.db_service.result_cache import result_cache
+from services.db_service.sql_pagination import SQLPager, limit_sql
+from services.db_service.cost_guard import CostGuard
+from services.db_service.page_tokens import decode_page_token
+from services.chatbot_service.generation_cache import normalize_question
+from services.chatbot_service.main import (
+    query_generator,
+    generation_cache,
+    semantic_cache,
+    sql_schema_loader,
+    mongo_schema_loader,
+)
+from config.config import Config
+from services.metrics import span
 from demo.demo_query import DEMO_QUERIES
 import random
+from services.log import get_logger
+
+logger = get_logger("query")
+
+# Questions that change data: each one runs, never coalesced with or
+# deduplicated against an identical question
+WRITE_INTENTS = ("insert", "update", "delete")
 
 
 class QueryService:
-    def process_query(self, nl_query):
+    def __init__(self):
+        # Identical questions in flight share one generation + execution
+        self.single_flight = SingleFlight()
+        self.schema_catalog = None
+        if Config.SCHEMA_CATALOG_ENABLED:
+            self.schema_catalog = SchemaCatalog(sql_executor, mongo_executor)
+            self.schema_catalog.subscribe(self._apply_schema_changes)
+        # Caps generated SELECTs; keyset pages need the catalog's keys
+        self.sql_pager = SQLPager(sql_executor, self.schema_catalog)
+        self.cost_guard = None
+        if Config.COST_GUARD_ENABLED:
+            self.cost_guard = CostGuard(sql_executor, mongo_executor)
+
+    async def start(self):
+        # The hand-written schemas serve prompts until the first refresh
+        if self.schema_catalog is not None:
+            self.schema_catalog.start()
+        query_generator.ollama_client.start()
+        mongo_executor.cursors.start()
+
+    def _apply_schema_changes(self, catalog, changed):
+        """
+        Pushes changed databases from the live catalog into the prompt
+        schema loaders, which rebuild their fragments once per refresh.
+        """
+        sql_schemas = dict(sql_schema_loader.schemas)
+        mongo_schema = dict(mongo_schema_loader.schema)
+        for dbms_type, db_key in changed:
+            if result_cache is not None:
+                # Cached rows may no longer match the new table layout
+                result_cache.invalidate(dbms_type, db_key)
+            if dbms_type == "sql":
+                sql_schemas[db_key] = catalog.render_sql_schemas(db_key)
+                continue
+            # Mongo has no declared references; keep the documented ones
+            refs = {
+                (coll_name, field): meta["ref"]
+                for coll_name, fields in mongo_schema.get(db_key, {}).items()
+                for field, meta in fields.items()
+                if "ref" in meta
+            }
+            mongo_schema[db_key] = catalog.render_mongo_schema(db_key, refs)
+
+        if any(dbms_type == "sql" for dbms_type, _ in changed):
+            sql_schema_loader.invalidate(schemas=sql_schemas)
+        if any(dbms_type == "mongo" for dbms_type, _ in changed):
+            mongo_schema_loader.invalidate(schema=mongo_schema)
+
+    async def _translate(self, nl_query):
+        """
+        Resolves a question to (response, dbms_type, db_name, query).
+        `response` is a finished reply (error or schema info) when there is
+        nothing to execute, otherwise None.
+        """
         if nl_query.strip().startswith("-"):
             key = nl_query.strip()
-            if key in DEMO_QUERIES:
-                demo = DEMO_QUERIES[key]
-                dbms_type = demo.get("dbms_type")
-                db_name = demo.get("db_name")
-                query = demo.get("query")
-
-                # print("⏳ Simulating LLM response for prompt...")
-                time.sleep(7)
-
-                if dbms_type == "sql":
-                    result = sql_executor.execute_query(query, db_name=db_name)
-                elif dbms_type == "mongo":
-                    result = mongo_executor.execute_query(
-                        query, db_name=db_name
-                    )
-                else:
-                    result = {"error": "Unsupported DBMS in demo query"}
-
-                return {
-                    "status": "success",
-                    "dbms_type": dbms_type,
-                    "db_name": db_name,
-                    "query": query,
-                    "result": result,
-                }
-
-            else:
-                return {
+            if key not in DEMO_QUERIES:
+                response = {
                     "status": "error",
                     "query": None,
                     "result": {"error": f"No demo query found for: {key}"},
                 }
+                return response, None, None, None
 
-        dbms_type, db_name, generated_query = query_generator.generate_query(
-            nl_query
-        )
+            demo = DEMO_QUERIES[key]
+            # Stands in for generation time without holding the loop
+            if Config.DEMO_LLM_LATENCY > 0:
+                await asyncio.sleep(Config.DEMO_LLM_LATENCY)
+            return (
+                None,
+                demo.get("dbms_type"),
+                demo.get("db_name"),
+                demo.get("query"),
+            )
+
+        with span("translate"):
+            dbms_type, db_name, generated_query = (
+                await query_generator.generate_query(nl_query)
+            )
 
         if isinstance(generated_query, dict) and "error" in generated_query:
-            return {
+            response = {
                 "status": "error",
                 "dbms_type": dbms_type,
                 "db_name": db_name,
                 "query": None,
                 "result": generated_query,
             }
+            return response, dbms_type, db_name, None
 
         if isinstance(generated_query, dict) and (
             "info" in generated_query
             or "tables" in generated_query
+            or "collections" in generated_query
             or "fields" in generated_query
         ):
-            return {
+            response = {
                 "status": "info",
                 "dbms_type": dbms_type,
                 "db_name": db_name,
                 "result": generated_query,
             }
+            return response, dbms_type, db_name, None
+
+        return None, dbms_type, db_name, generated_query
 
+    async def _execute(self, dbms_type, query, db_name, limit=None):
         if dbms_type == "sql":
-            result = sql_executor.execute_query(
-                generated_query, db_name=db_name
-            )
+            return await sql_executor.execute_query(query, db_name=db_name)
         elif dbms_type == "mongo":
-            result = mongo_executor.execute_query(
-                generated_query, db_name=db_name
+            return await mongo_executor.execute_query(
+                query, db_name=db_name, limit=limit
             )
-        else:
-            result = {"error": "Unsupported DBMS or database"}
+        return {"error": "Unsupported DBMS or database"}
+
+    async def _check_cost(self, dbms_type, query, db_name):
+        if self.cost_guard is None:
+            return None
+        with span("cost_estimate"):
+            return await self.cost_guard.check(dbms_type, query, db_name)
 
+    async def _guard(self, dbms_type, query, db_name):
+        """
+        Runs a generated query past the cost guard, before any execution
+        path (paged or streamed) opens a cursor. Returns (rejection, query,
+        limit, meta): `rejection` is the result to send instead of running
+        the query, `query` has the guard's row cap applied for SQL, `limit`
+        is that cap for Mongo, and meta holds the response's "estimate".
+        """
+        meta = {}
+        verdict = await self._check_cost(dbms_type, query, db_name)
+        if verdict is None:
+            return None, query, None, meta
+        meta["estimate"] = verdict.to_dict()
+        if verdict.action == "rejected":
+            logger.warning(
+                "⛔ Query rejected by cost guard: %s", verdict.reason
+            )
+            rejection = {
+                "error": f"Query rejected by cost guard: {verdict.reason}"
+            }
+            return rejection, query, None, meta
+        if dbms_type == "sql" and verdict.limit is not None:
+            query = limit_sql(prepare_sql(query).sql, verdict.limit)
+        return None, query, verdict.limit, meta
+
+    async def _execute_page(self, dbms_type, query, db_name):
+        """
+        Executes a generated query behind the cost guard. Returns
+        (result, meta), where meta holds the response's "estimate" and
+        "page" entries when they apply.
+        """
+        rejection, query, limit, meta = await self._guard(
+            dbms_type, query, db_name
+        )
+        if rejection is not None:
+            return rejection, meta
+
+        with span("execute"):
+            if dbms_type == "sql":
+                result, page = await self.sql_pager.first_page(query, db_name)
+            elif dbms_type == "mongo":
+                result, page = await mongo_executor.execute_page(
+                    query, db_name, limit=limit
+                )
+            else:
+                return await self._execute(dbms_type, query, db_name), meta
+        if page is not None:
+            meta["page"] = page
+        return result, meta
+
+    def _flight_key(self, kind, nl_query):
+        dbms_type, db_name, _, _ = query_generator.extract_info(nl_query)
+        return (
+            kind,
+            normalize_question(nl_query),
+            (db_name or "").lower(),
+            dbms_type,
+        )
+
+    @staticmethod
+    def _is_write(nl_query):
+        return query_generator.detect_intent(nl_query) in WRITE_INTENTS
+
+    @staticmethod
+    def _holds_cursor(response):
+        page = response.get("page") if isinstance(response, dict) else None
+        return bool(page and page["mode"] == "cursor" and page["next_token"])
+
+    async def _reopen_cursor(self, response):
+        """
+        A Mongo cursor token can be read only once, so a caller sharing
+        another caller's response runs the generated query again for a
+        cursor (and first page) of its own.
+        """
+        result, meta = await self._execute_page(
+            response["dbms_type"], response["query"], response["db_name"]
+        )
+        shared = {
+            key: value
+            for key, value in response.items()
+            if key not in ("estimate", "page")
+        }
+        return {**shared, "result": result, **meta}
+
+    async def _shared(self, nl_query, work):
+        """
+        Runs `work` through single_flight. Followers get the leader's
+        response, except for a parked Mongo cursor, which only the
+        leader may read on from.
+        """
+        claim = object()
+
+        async def run():
+            return claim, await work()
+
+        owner, response = await self.single_flight.do(
+            self._flight_key("json", nl_query), run
+        )
+        if owner is not claim and self._holds_cursor(response):
+            response = await self._reopen_cursor(response)
+        return response
+
+    async def process_query(self, nl_query):
+        if self._is_write(nl_query):
+            return await self._process_query(nl_query)
+        return await self._shared(
+            nl_query, lambda: self._process_query(nl_query)
+        )
+
+    async def _process_query(self, nl_query):
+        response, dbms_type, db_name, query = await self._translate(nl_query)
+        if response is not None:
+            return response
+
+        result, meta = await self._execute_page(dbms_type, query, db_name)
         return {
             "status": "success",
             "dbms_type": dbms_type,
             "db_name": db_name,
-            "query": generated_query,
+            "query": query,
+            "result": result,
+            **meta,
+        }
+
+    async def next_page(self, token):
+        """
+        Next page of an earlier result, read straight from the database
+        without generating the query again. Raises ValueError for a bad
+        or expired token.
+        """
+        state = decode_page_token(token)
+        if state.get("kind") == "sql":
+            result, page = await self.sql_pager.next_page(state)
+        elif state.get("kind") == "mongo":
+            result, page = await mongo_executor.next_page(state)
+        else:
+            raise ValueError("Unsupported page token.")
+        response = {
+            "status": "success",
+            "dbms_type": state["kind"],
+            "db_name": state["db"],
             "result": result,
         }
+        if page is not None:
+            response["page"] = page
+        return response
+
+    async def process_batch(self, nl_queries):
+        """
+        Translates and executes many questions concurrently. Duplicate
+        read questions (after normalization) run once, though each repeat
+        of a paged Mongo result opens its own cursor; writes run once per
+        occurrence. Generation is bounded by
+        BATCH_LLM_CONCURRENCY; each item is executed as soon as its query
+        is ready, with at most BATCH_DB_CONCURRENCY executions per
+        database so they share that database's warm pooled connections.
+        """
+        started = time.perf_counter()
+        unique = {}
+        item_keys = []
+        for i, nl_query in enumerate(nl_queries):
+            if self._is_write(nl_query):
+                key = ("write", i)
+            else:
+                key = ("read", normalize_question(nl_query))
+            unique.setdefault(key, nl_query)
+            item_keys.append(key)
+
+        llm_slots = asyncio.Semaphore(Config.BATCH_LLM_CONCURRENCY)
+        db_slots = {}
+
+        async def work(nl_query):
+            async with llm_slots:
+                response, dbms_type, db_name, query = await self._translate(
+                    nl_query
+                )
+            if response is not None:
+                return response
+
+            slots = db_slots.setdefault(
+                (dbms_type, (db_name or "").lower()),
+                asyncio.Semaphore(Config.BATCH_DB_CONCURRENCY),
+            )
+            async with slots:
+                result, meta = await self._execute_page(
+                    dbms_type, query, db_name
+                )
+            return {
+                "status": "success",
+                "dbms_type": dbms_type,
+                "db_name": db_name,
+                "query": query,
+                "result": result,
+                **meta,
+            }
 
-    def test_db_query(
+        def failed(nl_query, e):
+            logger.error("❌ Batch item failed: %r: %s", nl_query, e)
+            return {
+                "status": "error",
+                "query": None,
+                "result": {"error": str(e)},
+            }
+
+        async def run_item(key, nl_query):
+            try:
+                if key[0] == "write":
+                    return await work(nl_query)
+                # Shares flights with /query/ for the same question
+                return await self._shared(nl_query, lambda: work(nl_query))
+            except Exception as e:
+                return failed(nl_query, e)
+
+        async def finish_item(nl_query, outcome, repeated):
+            # A duplicate needs its own cursor to read further pages
+            if not (repeated and self._holds_cursor(outcome)):
+                return outcome
+            try:
+                return await self._reopen_cursor(outcome)
+            except Exception as e:
+                return failed(nl_query, e)
+
+        keys = list(unique)
+        outcomes = dict(
+            zip(
+                keys,
+                await asyncio.gather(*(run_item(k, unique[k]) for k in keys)),
+            )
+        )
+        seen = set()
+        items = []
+        for nl_query, key in zip(nl_queries, item_keys):
+            items.append(finish_item(nl_query, outcomes[key], key in seen))
+            seen.add(key)
+        return {
+            "results": [
+                {"nl_query": nl_query, "query_result": outcome}
+                for nl_query, outcome in zip(
+                    nl_queries, await asyncio.gather(*items)
+                )
+            ],
+            "unique_questions": len(keys),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    async def stream_query(self, nl_query):
+        """
+        NDJSON variant of process_query. Yields a header line with the
+        generated query, then one line per result row as batches arrive
+        from the database, then a trailer line with the row count. The
+        cost guard runs first; a rejected query ends the stream with the
+        rejection as an error line. Streams are not paged but stop after
+        STREAM_MAX_ROWS rows, with "truncated" set in the trailer.
+        """
+        response, dbms_type, db_name, query = await self._translate(nl_query)
+        if response is not None:
+            yield ndjson_line(response)
+            return
+
+        rejection, guarded, limit, meta = await self._guard(
+            dbms_type, query, db_name
+        )
+        yield ndjson_line(
+            {
+                "status": "success",
+                "dbms_type": dbms_type,
+                "db_name": db_name,
+                "query": query,
+                **meta,
+            }
+        )
+        if rejection is not None:
+            yield ndjson_line({"status": "error", **rejection})
+            return
+
+        cap = Config.STREAM_MAX_ROWS
+        row_count = 0
+        truncated = False
+        try:
+            if dbms_type == "sql":
+                prepared = prepare_sql(guarded)
+                if prepared is not None and cap > 0:
+                    # The server stops one row past the cap, which only
+                    # tells the loop that more rows exist
+                    guarded = limit_sql(prepared.sql, cap + 1)
+                async with aclosing(
+                    sql_executor.stream_query(guarded, db_name=db_name)
+                ) as batches:
+                    async for rows in batches:
+                        if cap > 0 and row_count + len(rows) > cap:
+                            rows = rows[: cap - row_count]
+                            truncated = True
+                        row_count += len(rows)
+                        yield b"".join(ndjson_line(row) for row in rows)
+                        if truncated:
+                            break
+            else:
+                result = await self._execute(
+                    dbms_type, guarded, db_name, limit
+                )
+                rows = result if isinstance(result, list) else [result]
+                if cap > 0 and len(rows) > cap:
+                    rows = rows[:cap]
+                    truncated = True
+                row_count = len(rows)
+                yield b"".join(ndjson_line(row) for row in rows)
+        except Exception as e:
+            logger.error("❌ Error while streaming results: %s", e)
+            yield ndjson_line({"status": "error", "error": str(e)})
+            return
+
+        yield ndjson_line(
+            {"status": "done", "row_count": row_count, "truncated": truncated}
+        )
+
+    async def test_db_query(
         self, raw_query: str, db_name: str = None, dbms_type: str = "sql"
     ):
-        if dbms_type == "sql":
-            return sql_executor.execute_query(raw_query, db_name=db_name)
-        elif dbms_type == "mongo":
-            return mongo_executor.execute_query(raw_query, db_name=db_name)
-        return {"error": "Unsupported DBMS"}
+        if dbms_type not in ("sql", "mongo"):
+            return {"error": "Unsupported DBMS"}
+        return await self._execute(dbms_type, raw_query, db_name)
 
-    def test_llm_query(self, nl_query: str):
-        dbms_type, db_name, generated_query = query_generator.generate_query(
-            nl_query
+    async def test_llm_query(self, nl_query: str):
+        dbms_type, db_name, generated_query = (
+            await query_generator.generate_query(nl_query)
         )
         return {
             "status": "success",
@@ -107,5 +486,37 @@ class QueryService:
             "llm_query": generated_query,
         }
 
+    def cache_stats(self):
+        return {
+            "generation_cache": (
+                generation_cache.get_stats()
+                if generation_cache
+                else "disabled"
+            ),
+            "semantic_cache": (
+                semantic_cache.get_stats() if semantic_cache else "disabled"
+            ),
+            "result_cache": (
+                result_cache.get_stats() if result_cache else "disabled"
+            ),
+            "coalescing": self.single_flight.get_stats(),
+            "mongo_cursors": mongo_executor.cursors.get_stats(),
+            "cost_guard": (
+                self.cost_guard.get_stats() if self.cost_guard else "disabled"
+            ),
+        }
+
+    def llm_stats(self):
+        return query_generator.ollama_client.get_stats()
+
+    async def close(self):
+        await query_generator.ollama_client.close()
+        if self.schema_catalog is not None:
+            await self.schema_catalog.stop()
+        await sql_executor.close()
+        await mongo_executor.close()
+        if generation_cache is not None:
+            generation_cache.close()
+
 
 query_service = QueryService()
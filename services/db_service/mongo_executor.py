@@ -1,133 +1,285 @@
-import re
-import json
-import json5
+import copy
 from bson import json_util
-from pymongo import MongoClient, collection
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
 from config.config import Config
+from services.db_service.mongo_parser import (
+    READ_METHODS,
+    WRITE_METHODS,
+    MongoPlan,
+    compile_mongo_query,
+)
+from services.db_service.result_cache import result_cache
+from services.db_service.cursor_registry import CursorRegistry, OpenCursor
+from services.db_service.page_tokens import encode_page_token
+from services.deadline import cap_ms
+from services.metrics import span
+from services.db_service.json_encoding import bson_to_jsonable
 from typing import Any, List, Tuple, Dict, Optional, Union
+from services.log import get_logger, log_payload
+
+logger = get_logger("mongo")
+
+# Chained find() cursor methods and the find command field each one sets
+FIND_COMMAND_FIELDS = {
+    "sort": "sort",
+    "limit": "limit",
+    "skip": "skip",
+    "hint": "hint",
+}
 
 
 class MongoExecutor:
     def __init__(self) -> None:
-        self.client: MongoClient = MongoClient(
+        self.client: AsyncMongoClient = AsyncMongoClient(
             Config.MONGODB["host"],
             Config.MONGODB["port"],
         )
         self.max_preview_docs: int = 50
+        # Server-side time limit for reads (0 disables)
+        self.max_time_ms: int = Config.MONGO_MAX_TIME_MS
+        # Unbounded find/aggregate cursors parked for POST /query/next
+        self.cursors = CursorRegistry()
 
-    def execute_query(
-        self, query: str, db_name: str
+    async def execute_query(
+        self, query: str, db_name: str, limit: Optional[int] = None
     ) -> Union[List[Dict[str, Any]], Dict[str, Any], int]:
         try:
             db = self.client[db_name]
 
-            # # Remove JS-style comments
-            # query = re.sub(r"//.*(?=\n|$)", "", query)
-            # # Flatten newlines
-            # query = query.replace("\n", " ").replace("\r", "").strip()
+            with span("mongo_parse"):
+                plan = compile_mongo_query(query)
+            if limit is not None and plan.method in ("find", "aggregate"):
+                plan = plan.with_limit(limit)
 
             # Support raw 'show collections' instruction
-            if query.strip().lower() == "show collections":
-                return self._execute_show_collections(db_name)
-
-            raw_query: str = self._extract_mongo_query(query)
-
-            cleaned_query: str = self._sanitize_mongo_query_safe(raw_query)
+            if plan.show_collections:
+                return await self._execute_show_collections(db_name)
 
-            query = cleaned_query
+            log_payload(logger, "📥 Received query", query, db=db_name)
 
-            print("📥 Received query:", query)
+            coll = db[plan.collection]
+            ops = plan.ops
+            if not ops:
+                return {"error": "No operations found in the query."}
 
-            try:
-                match = re.match(
-                    r"db\.([a-zA-Z0-9_]+)\.(.+)$", query.strip(), re.DOTALL
-                )
-                if not match:
-                    raise Exception(
-                        {
-                            "error": "Invalid query format. Expected: db.collection.method(...) chain"
-                        }
-                    )
+            method = ops[0][0]
 
-                collection_name = match.group(1)
-                operation_chain = match.group(2)
-
-            except:
-                db_prefix_pattern = re.compile(
-                    r"db\.(\w+)\.(\w+)\.(.+)$"
-                )  # db.imdb_ijs.actors.find(...)
-                db_concat_pattern = re.compile(
-                    r"db\.([a-zA-Z0-9_]+)\((.*?)\)"
-                )  # fallback pattern
-                fallback_pattern = re.compile(
-                    r"db\.(\w+)(\w+)\.(.+)$"
-                )  # db.imdb_ijsactors.find(...)
-
-                match = db_prefix_pattern.match(query.strip())
-                if match:
-                    db_prefix, collection_name, operation_chain = match.groups()
-                elif fallback_pattern.match(query.strip()):
-                    db_name_and_coll, operation_chain = fallback_pattern.match(
-                        query.strip()
-                    ).groups()
-                    # Try to split db + collection by checking known db names
-                    for known_db in self.client.list_database_names():
-                        if db_name_and_coll.startswith(known_db):
-                            db_prefix = known_db
-                            collection_name = db_name_and_coll[len(known_db) :]
-                            break
-                    else:
-                        return {
-                            "error": f"Unable to resolve DB + collection from: {db_name_and_coll}"
-                        }
-                elif re.match(r"db\.([a-zA-Z0-9_]+)\.(.+)$", query.strip()):
-                    match = re.match(
-                        r"db\.([a-zA-Z0-9_]+)\.(.+)$", query.strip()
+            cache_key = self._cache_key(plan, db_name)
+            if cache_key is not None:
+                with span("result_cache"):
+                    cached = result_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("⚡ Result cache hit")
+                    return cached
+                tables = self._cache_tables(plan, db_name)
+                # Taken before executing, so a write finishing during the
+                # read keeps its stale documents out of the cache
+                generation = result_cache.generation(tables)
+
+            with span("mongo_execute"):
+                if method == "find":
+                    result = await self._execute_find_chain(coll, ops)
+                elif method == "aggregate":
+                    try:
+                        result = await self._execute_aggregate(coll, ops[0][1])
+                    finally:
+                        # $out / $merge stages write their target collection
+                        self._invalidate(plan, db_name)
+                elif method in WRITE_METHODS:
+                    try:
+                        result = await self._execute_simple_op(
+                            coll, method, ops[0][1]
+                        )
+                    finally:
+                        self._invalidate(plan, db_name)
+                elif method == "countDocuments":
+                    result = await self._execute_count_documents(
+                        coll, ops[0][1]
                     )
-                    collection_name = match.group(1)
-                    operation_chain = match.group(2)
-                    db_prefix = db_name  # Use provided db_name
+                elif method == "distinct":
+                    result = await self._execute_distinct(coll, ops[0][1])
                 else:
-                    return {
-                        "error": "Invalid query format. Expected: db.collection.method(...) chain"
-                    }
+                    return {"error": f"Unsupported root operation: {method}"}
 
-            coll = db[collection_name]
+            with span("mongo_encode"):
+                result = bson_to_jsonable(result)
+            if cache_key is not None:
+                result_cache.set(cache_key, result, tables, generation)
+            return result
 
-            ops = self._parse_method_chain(operation_chain)
-            if not ops:
-                return {"error": "No operations found in the query."}
+        except Exception as e:
+            return {"error": str(e)}
 
-            method = ops[0][0]
+    @staticmethod
+    def _cache_key(
+        plan: MongoPlan, db_name: str
+    ) -> Optional[Tuple[str, str, str]]:
+        """
+        Result cache key for a read-only plan, or None when the plan must
+        not be cached (caching disabled, a write, an $out/$merge, or a
+        value generated at parse time such as `new Date()`).
+        """
+        if (
+            result_cache is None
+            or plan.volatile
+            or plan.method not in READ_METHODS
+            or plan.write_collections()
+        ):
+            return None
+        # Extended JSON keeps BSON types apart; key order is significant
+        text = json_util.dumps([plan.collection, plan.ops])
+        return result_cache.make_key("mongo", db_name, text)
+
+    @staticmethod
+    def _cache_tables(plan: MongoPlan, db_name: str):
+        db = db_name.lower()
+        return frozenset(
+            ("mongo", db, name.lower()) for name in plan.read_collections()
+        )
 
-            if method == "find":
-                result = self._execute_find_chain(coll, ops)
-            elif method == "aggregate":
-                result = self._execute_aggregate(coll, ops[0][1])
-            elif method in [
-                "insertOne",
-                "insertMany",
-                "updateOne",
-                "updateMany",
-                "deleteOne",
-                "deleteMany",
-            ]:
-                result = self._execute_simple_op(coll, method, ops[0][1])
-            elif method == "countDocuments":
-                result = self._execute_count_documents(coll, ops[0][1])
-            elif method == "distinct":
-                result = self._execute_distinct(coll, ops[0][1])
-            else:
-                return {"error": f"Unsupported root operation: {method}"}
+    @staticmethod
+    def _invalidate(plan: MongoPlan, db_name: str) -> None:
+        if result_cache is None:
+            return
+        written = plan.write_collections()
+        if written:
+            result_cache.invalidate("mongo", db_name, frozenset(written))
+
+    async def execute_page(
+        self, query: str, db_name: str, limit: Optional[int] = None
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Like execute_query, but a find/aggregate without a limit keeps its
+        cursor open after the first `max_preview_docs` documents and
+        returns (documents, page) with a continuation token for the rest.
+        Anything else returns (execute_query result, None).
+        """
+        try:
+            with span("mongo_parse"):
+                plan = compile_mongo_query(query)
+        except Exception:
+            return await self.execute_query(query, db_name, limit), None
+        if plan.show_collections or plan.method not in ("find", "aggregate"):
+            return await self.execute_query(query, db_name, limit), None
+        if limit is not None or plan.write_collections() or plan.is_bounded():
+            return await self.execute_query(query, db_name, limit), None
+
+        try:
+            log_payload(logger, "📥 Received query (paged)", query, db=db_name)
+            coll = self.client[db_name][plan.collection]
+            with span("mongo_execute"):
+                if plan.method == "find":
+                    cursor = self._open_find_cursor(coll, plan.ops)
+                else:
+                    cursor = await coll.aggregate(
+                        self._pipeline(plan.ops[0][1]), **self._time_limit()
+                    )
+                # One document of read-ahead tells whether a next page exists
+                entry = OpenCursor(cursor, db_name, self.max_preview_docs, [])
+                return await self._read_page(entry)
+        except Exception as e:
+            return {"error": str(e)}, None
 
-            return json.loads(json_util.dumps(result))
+    async def explain(
+        self, query: str, db_name: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The query planner's explain output for a find/aggregate query,
+        without running it. None for any other operation.
+        """
+        plan = compile_mongo_query(query)
+        if plan.show_collections or plan.method not in ("find", "aggregate"):
+            return None
+        db = self.client[db_name]
+        # queryPlanner only plans the query; Cursor.explain() would run it
+        # and every candidate plan to completion
+        if plan.method == "find":
+            command = self._find_command(plan.collection, plan.ops)
+        else:
+            command = {
+                "aggregate": plan.collection,
+                "pipeline": self._pipeline(plan.ops[0][1]),
+                "cursor": {},
+            }
+        return await db.command("explain", command, verbosity="queryPlanner")
 
+    @staticmethod
+    def _find_command(
+        collection: str, ops: List[Tuple[str, List[Any]]]
+    ) -> Dict[str, Any]:
+        """
+        The find command a find(...).sort(...).limit(...) chain runs.
+        Chained methods without a command field are left out.
+        """
+        command: Dict[str, Any] = {"find": collection}
+        for method, args in ops:
+            if method == "find":
+                if len(args) > 0:
+                    command["filter"] = args[0]
+                if len(args) > 1:
+                    command["projection"] = args[1]
+            elif method in FIND_COMMAND_FIELDS and args:
+                value = args[0]
+                # sort("year", -1)
+                if method == "sort" and len(args) == 2:
+                    value = {args[0]: args[1]}
+                command[FIND_COMMAND_FIELDS[method]] = value
+        return command
+
+    async def next_page(
+        self, state: Dict[str, Any]
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Next batch from a cursor parked by execute_page. Raises ValueError
+        when the cursor is gone (expired, evicted or already read).
+        """
+        entry = self.cursors.take(state["cursor"])
+        if entry is None:
+            raise ValueError("Cursor has expired or was already read.")
+        logger.debug("📄 Next page from open Mongo cursor")
+        try:
+            return await self._read_page(entry, resumed=True)
         except Exception as e:
-            return {"error": str(e)}
+            return {"error": str(e)}, None
 
-    def _execute_find_chain(
-        self, coll: collection.Collection, ops: List[Tuple[str, List[Any]]]
-    ) -> List[Dict[str, Any]]:
+    async def _read_page(
+        self, entry: OpenCursor, resumed: bool = False
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        size = entry.page_size
+        try:
+            documents = entry.pending + await entry.cursor.to_list(
+                size + 1 - len(entry.pending)
+            )
+        except BaseException:
+            # Cancellation included: the entry is in no registry while it
+            # is read, so nothing else would close the server cursor
+            await self.cursors.discard(entry)
+            raise
+        entry.pending = documents[size:]
+        has_more = bool(entry.pending)
+        next_token = None
+        if has_more:
+            cursor_id = await self.cursors.add(entry, resumed=resumed)
+            next_token = encode_page_token(
+                {"kind": "mongo", "db": entry.db_name, "cursor": cursor_id}
+            )
+        else:
+            await self.cursors.finish(entry)
+        return bson_to_jsonable(documents[:size]), {
+            "mode": "cursor",
+            "page_size": size,
+            "has_more": has_more,
+            "next_token": next_token,
+        }
+
+    async def close(self) -> None:
+        await self.cursors.close()
+        await self.client.close()
+
+    def _open_find_cursor(
+        self, coll: AsyncCollection, ops: List[Tuple[str, List[Any]]]
+    ):
         cursor = None
         for method, args in ops:
             if method == "find":
@@ -146,16 +298,28 @@ class MongoExecutor:
                     cursor = getattr(cursor, method)(*args)
                 else:
                     raise ValueError(f"Unsupported method chained: {method}")
+        time_limit = cap_ms(self.max_time_ms)
+        if time_limit:
+            cursor = cursor.max_time_ms(time_limit)
+        return cursor
 
+    async def _execute_find_chain(
+        self, coll: AsyncCollection, ops: List[Tuple[str, List[Any]]]
+    ) -> List[Dict[str, Any]]:
+        cursor = self._open_find_cursor(coll, ops)
         if not any(m[0] == "limit" for m in ops):
-            print("📉 No limit in find chain — lazy stream")
-            return [doc for _, doc in zip(range(self.max_preview_docs), cursor)]
+            logger.debug("📉 No limit in find chain — lazy stream")
+            return await cursor.to_list(self.max_preview_docs)
         else:
-            return list(cursor)
+            return await cursor.to_list()
 
-    def _execute_aggregate(
-        self, coll: collection.Collection, args: List[Any]
-    ) -> List[Dict[str, Any]]:
+    def _time_limit(self) -> Dict[str, int]:
+        # Server-side limit, shortened to the current request's deadline
+        time_limit = cap_ms(self.max_time_ms)
+        return {"maxTimeMS": time_limit} if time_limit else {}
+
+    @staticmethod
+    def _pipeline(args: List[Any]) -> List[Any]:
         pipeline = (
             args[0]
             if isinstance(args, list)
@@ -165,199 +329,71 @@ class MongoExecutor:
         )
         if not isinstance(pipeline, list):
             raise ValueError("aggregate() expects a list as its argument")
-        print("⏳ Running aggregation pipeline:", pipeline)
+        return pipeline
+
+    async def _execute_aggregate(
+        self, coll: AsyncCollection, args: List[Any]
+    ) -> List[Dict[str, Any]]:
+        pipeline = self._pipeline(args)
+        log_payload(logger, "⏳ Running aggregation pipeline", pipeline)
         has_limit: bool = any("$limit" in stage for stage in pipeline)
-        cursor = coll.aggregate(pipeline)
+        cursor = await coll.aggregate(pipeline, **self._time_limit())
         if has_limit:
-            return list(cursor)
+            return await cursor.to_list()
         else:
-            print("📉 No $limit in aggregation — lazy stream")
-            return [doc for _, doc in zip(range(self.max_preview_docs), cursor)]
+            logger.debug("📉 No $limit in aggregation — lazy stream")
+            return await cursor.to_list(self.max_preview_docs)
 
-    def _execute_simple_op(
-        self, coll: collection.Collection, method: str, args: List[Any]
+    async def _execute_simple_op(
+        self, coll: AsyncCollection, method: str, args: List[Any]
     ) -> Any:
-        print(f"⚙️ Executing {method} with args:", args)
+        log_payload(logger, f"⚙️ Executing {method} with args", args)
+        # Compiled plans are cached; inserts add _id to their documents
+        args = copy.deepcopy(args)
         if method == "insertOne":
-            return {"inserted_id": str(coll.insert_one(args[0]).inserted_id)}
+            result = await coll.insert_one(args[0])
+            return {"inserted_id": str(result.inserted_id)}
         elif method == "insertMany":
-            return {
-                "inserted_ids": [
-                    str(_id) for _id in coll.insert_many(args[0]).inserted_ids
-                ]
-            }
+            result = await coll.insert_many(args[0])
+            return {"inserted_ids": [str(_id) for _id in result.inserted_ids]}
         elif method == "updateOne":
-            return coll.update_one(*args).raw_result
+            return (await coll.update_one(*args)).raw_result
         elif method == "updateMany":
-            return coll.update_many(*args).raw_result
+            return (await coll.update_many(*args)).raw_result
         elif method == "deleteOne":
-            return coll.delete_one(*args).raw_result
+            return (await coll.delete_one(*args)).raw_result
         elif method == "deleteMany":
-            return coll.delete_many(*args).raw_result
+            return (await coll.delete_many(*args)).raw_result
         else:
             return {"error": f"Unsupported operation: {method}"}
 
-    def _execute_count_documents(
-        self, coll: collection.Collection, args: List[Any]
+    async def _execute_count_documents(
+        self, coll: AsyncCollection, args: List[Any]
     ) -> int:
-        print("🔢 Running countDocuments with args:", args)
+        log_payload(logger, "🔢 Running countDocuments with args", args)
         if len(args) != 1:
             raise ValueError("countDocuments() requires exactly 1 argument")
-        return coll.count_documents(args[0])
+        return await coll.count_documents(args[0], **self._time_limit())
 
-    def _execute_distinct(
-        self, coll: collection.Collection, args: List[Any]
+    async def _execute_distinct(
+        self, coll: AsyncCollection, args: List[Any]
     ) -> List[Any]:
-        print("🧪 Running distinct with args:", args)
+        log_payload(logger, "🧪 Running distinct with args", args)
         if not args:
             raise ValueError(
                 "distinct() requires at least 1 argument (field name)"
             )
         field = args[0]
         query = args[1] if len(args) > 1 else {}
-        return coll.distinct(field, query)
+        return await coll.distinct(field, query, **self._time_limit())
 
-    def _execute_show_collections(self, db_name: str) -> List[str]:
+    async def _execute_show_collections(self, db_name: str) -> List[str]:
         """
         Returns a list of collections in the given database,
         simulating 'show collections' in mongosh.
         """
         db = self.client[db_name]
-        return db.list_collection_names()
-
-    def _parse_method_chain(self, chain: str) -> List[Tuple[str, List[Any]]]:
-        """
-        Parses Mongo-style method chains like:
-        db.collection.aggregate([...]) or db.collection.find({...})
-        using a bracket-balanced parser instead of regex.
-
-        Returns:
-            List of (method_name, [args]) tuples
-        """
-        parsed: List[Tuple[str, List[Any]]] = []
-
-        i = 0
-        while i < len(chain):
-            # Match method name
-            method_match = re.match(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*\(", chain[i:])
-            if not method_match:
-                break
-
-            method = method_match.group(1)
-            i += method_match.end()
-
-            # Parse arguments with parenthesis balance
-            start = i
-            depth = 1
-            while i < len(chain) and depth > 0:
-                if chain[i] == "(":
-                    depth += 1
-                elif chain[i] == ")":
-                    depth -= 1
-                i += 1
-
-            arg_str = chain[start : i - 1].strip()
-            cleaned_args = self._normalize_quotes(arg_str)
-            json_str = f"[{cleaned_args}]"
-            try:
-                args: List[Any] = json5.loads(json_str)
-            except Exception as e:
-                raise ValueError(
-                    f"Failed to parse `{method}` args: {arg_str}  cleaned_args: {cleaned_args}  error:  {e}"
-                )
-            parsed.append((method, args))
-
-            # Skip any dot after the method call for chaining
-            if i < len(chain) and chain[i] == ".":
-                i += 1
-
-        return parsed
-
-    def _normalize_quotes(self, s: str) -> str:
-        """
-        Converts single-quoted Mongo shell strings to valid Python-style double-quoted strings.
-        Preserves things like $ and $$ variable references.
-        """
-        # Replace outer single quotes with double quotes
-        s = re.sub(r"(?<!\")'(.*?)'(?!\")", r'"\1"', s)
-
-        # Fix ISODate() → {"$date": "..."}
-        s = re.sub(
-            r'ISODate\(\s*"(\d{4})-(\d{2})-(\d{2})T\d{2}:\d{2}:\d{2}\.\d{3}Z"\s*\)',
-            lambda m: f'"{m.group(1)}-{m.group(2)}-{m.group(3)}"',
-            s,
-        )
-
-        # Fix bad $$ references like {"$$var"} → "$$var"
-        s = re.sub(r'{\s*"(\$\$[a-zA-Z0-9_\.]+)"\s*}', r'"\1"', s)
-
-        # Unescape $ symbols that may have been affected
-        s = s.replace('\\"$', "$").replace('\\"$$', "$$")
-        return s
-
-    def _extract_mongo_query(self, llm_response: str) -> str | None:
-        """
-        Extracts the MongoDB query string from the LLM's response.
-        Handles various formats (code block, inline, raw JSON).
-        Returns only the query as a string (e.g., db.collection.aggregate([...])).
-        """
-        if not llm_response:
-            return None
-
-        # 1. Try to extract code from triple backtick blocks (```mongodb ... ```)
-        code_block_match = re.search(
-            r"```(?:\w+)?\s*\n([\s\S]+?)```", llm_response, re.IGNORECASE
-        )
-        if code_block_match:
-            code = code_block_match.group(1).strip()
-            return code
-
-        # 2. Try to find the first line that starts with `db.` and ends with a valid structure
-        db_query_match = re.search(
-            r"(db\.\w+\.(?:aggregate|find|insertOne|updateOne|deleteOne)\s*\([\s\S]+)",
-            llm_response,
-        )
-        if db_query_match:
-            return db_query_match.group(1).strip()
-
-        # 3. Try extracting a JSON-like aggregation pipeline list
-        pipeline_match = re.search(r"\[\s*{[\s\S]+?}\s*]", llm_response)
-        if pipeline_match:
-            # Assume "db.<collection>.aggregate(...)" or fallback to "paper" as default collection
-            return f"db.paper.aggregate({pipeline_match.group(0).strip()})"
-
-        # 4. Fallback: Check if response *is* the query directly
-        stripped = llm_response.strip()
-        if stripped.startswith("db.") and ("(" in stripped and ")" in stripped):
-            return stripped
-
-        return None
-
-    def _sanitize_mongo_query_safe(self, query: str) -> str:
-        if not query:
-            return query
-
-        # TEMPORARILY protect regex patterns like /pattern/ or /pattern/i
-        regex_patterns = re.findall(r"/[^/]+/[a-z]*", query)
-        for i, pat in enumerate(regex_patterns):
-            query = query.replace(pat, f"__REGEX_PLACEHOLDER_{i}__")
-
-        # Remove JS-style and block comments
-        query = re.sub(r"//.*(?=\n|$)", "", query)
-        query = re.sub(r"/\*.*?\*/", "", query, flags=re.DOTALL)
-
-        # Unescape quotes, remove semicolons
-        query = query.replace('\\"', '"').replace(";", "")
-
-        # Flatten to one line, normalize spaces
-        query = query.replace("\n", " ").replace("\r", " ")
-        query = re.sub(r"\s+", " ", query).strip()
-
-        # Reinsert regex safely
-        for i, pat in enumerate(regex_patterns):
-            query = query.replace(f"__REGEX_PLACEHOLDER_{i}__", pat)
-
-        return query
+        return await db.list_collection_names()
 
 
 mongo_executor = MongoExecutor()
@@ -0,0 +1,538 @@
+import re
+import datetime
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+from bson import Decimal128, Int64, ObjectId
+from bson.regex import Regex
+from config.config import Config
+
+# Root methods that only read, and those that modify the collection
+READ_METHODS = {"find", "aggregate", "countDocuments", "distinct"}
+WRITE_METHODS = {
+    "insertOne",
+    "insertMany",
+    "updateOne",
+    "updateMany",
+    "deleteOne",
+    "deleteMany",
+}
+
+PUNCTUATION = "{}[]():,."
+IDENT_START = re.compile(r"[A-Za-z_$]")
+IDENT_REST = re.compile(r"[A-Za-z0-9_$]*")
+NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+REGEX_FLAGS = re.compile(r"[a-z]*")
+
+# A '/' after one of these tokens starts a regex literal, not a division
+REGEX_PRECEDERS = {None, "(", ",", ":", "[", "{"}
+
+LITERALS = {"true": True, "false": False, "null": None, "undefined": None}
+
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "0": "\0"}
+
+
+class Token:
+    __slots__ = ("kind", "value", "pos")
+
+    def __init__(self, kind: str, value: Any, pos: int) -> None:
+        self.kind = kind
+        self.value = value
+        self.pos = pos
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.value!r}, {self.pos})"
+
+
+class MongoPlan:
+    """
+    Compiled form of a mongosh query. `ops` is the method chain as
+    (method_name, [args]) tuples; plans are cached and shared, so
+    callers must not mutate the argument values. A `volatile` plan holds
+    values generated while parsing (`ObjectId()`, `new Date()`) and is
+    neither shared nor result-cached.
+    """
+
+    __slots__ = (
+        "collection",
+        "db_prefix",
+        "ops",
+        "show_collections",
+        "volatile",
+    )
+
+    def __init__(
+        self,
+        collection: Optional[str] = None,
+        db_prefix: Optional[str] = None,
+        ops: Optional[List[Tuple[str, List[Any]]]] = None,
+        show_collections: bool = False,
+        volatile: bool = False,
+    ) -> None:
+        self.collection = collection
+        self.db_prefix = db_prefix
+        self.ops = ops or []
+        self.show_collections = show_collections
+        self.volatile = volatile
+
+    @property
+    def method(self) -> Optional[str]:
+        return self.ops[0][0] if self.ops else None
+
+    @property
+    def pipeline(self) -> List[Any]:
+        """
+        Top-level stages of an aggregate plan (empty for other methods).
+        """
+        if self.method != "aggregate":
+            return []
+        args = self.ops[0][1]
+        return (
+            args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        )
+
+    def is_bounded(self) -> bool:
+        """
+        Whether a find/aggregate plan limits its own result size.
+        """
+        if self.method == "find":
+            return any(method == "limit" for method, _ in self.ops)
+        return any(
+            isinstance(stage, dict) and "$limit" in stage
+            for stage in self.pipeline
+        )
+
+    def with_limit(self, limit: int) -> "MongoPlan":
+        """
+        Copy of a find/aggregate plan returning at most `limit` documents.
+        """
+        if self.method == "find":
+            ops = self.ops + [("limit", [limit])]
+        else:
+            ops = [("aggregate", [self.pipeline + [{"$limit": limit}]])]
+            ops += self.ops[1:]
+        return MongoPlan(
+            self.collection, self.db_prefix, ops, volatile=self.volatile
+        )
+
+    def _pipeline_stages(self) -> List[Any]:
+        stages: List[Any] = []
+
+        def walk(items: List[Any]) -> None:
+            for stage in items:
+                if not isinstance(stage, dict):
+                    continue
+                stages.append(stage)
+                # Sub-pipelines of $lookup / $unionWith / $facet
+                for spec in stage.values():
+                    if isinstance(spec, dict):
+                        if isinstance(spec.get("pipeline"), list):
+                            walk(spec["pipeline"])
+                        for value in spec.values():
+                            if isinstance(value, list) and all(
+                                isinstance(v, dict) for v in value
+                            ):
+                                walk(value)
+
+        walk(self.pipeline)
+        return stages
+
+    def read_collections(self) -> Tuple[str, ...]:
+        """
+        Every collection the query reads, including $lookup, $graphLookup
+        and $unionWith sources.
+        """
+        names = [self.collection] if self.collection else []
+        for stage in self._pipeline_stages():
+            for op in ("$lookup", "$graphLookup", "$unionWith"):
+                spec = stage.get(op)
+                if isinstance(spec, str):
+                    names.append(spec)
+                elif isinstance(spec, dict):
+                    source = spec.get("from", spec.get("coll"))
+                    if isinstance(source, str):
+                        names.append(source)
+        return tuple(dict.fromkeys(names))
+
+    def write_collections(self) -> Tuple[str, ...]:
+        """
+        Collections the query modifies: the target of a write method or
+        of an $out / $merge stage.
+        """
+        if self.method in WRITE_METHODS:
+            return (self.collection,)
+        names = []
+        for stage in self._pipeline_stages():
+            for op in ("$out", "$merge"):
+                spec = stage.get(op)
+                if isinstance(spec, str):
+                    names.append(spec)
+                elif isinstance(spec, dict):
+                    target = spec.get("into", spec.get("coll"))
+                    if isinstance(target, str):
+                        names.append(target)
+        return tuple(names)
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Single pass over the query text. Comments are skipped, strings are
+    decoded with their escapes, and `/.../flags` becomes a REGEX token
+    wherever a value may start.
+    """
+    tokens: List[Token] = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch.isspace() or ch == ";":
+            i += 1
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            if end == -1:
+                raise ValueError(f"Unterminated comment at position {i}")
+            i = end + 2
+        elif ch in "\"'":
+            start = i
+            value, i = _read_string(text, i)
+            tokens.append(Token("STRING", value, start))
+        elif ch == "/" and _previous(tokens) in REGEX_PRECEDERS:
+            start = i
+            pattern, i = _read_regex(text, i)
+            flags = REGEX_FLAGS.match(text, i).group(0)
+            i += len(flags)
+            tokens.append(Token("REGEX", Regex(pattern, flags), start))
+        elif ch in PUNCTUATION and not (
+            ch == "." and i + 1 < n and text[i + 1].isdigit()
+        ):
+            tokens.append(Token(ch, ch, i))
+            i += 1
+        elif IDENT_START.match(ch):
+            match = IDENT_REST.match(text, i + 1)
+            tokens.append(Token("IDENT", text[i : match.end()], i))
+            i = match.end()
+        else:
+            match = NUMBER.match(text, i)
+            if not match:
+                raise ValueError(
+                    f"Unexpected character {ch!r} at position {i}"
+                )
+            literal = match.group(0)
+            value = (
+                float(literal)
+                if any(c in literal for c in ".eE")
+                else int(literal)
+            )
+            tokens.append(Token("NUMBER", value, i))
+            i = match.end()
+    tokens.append(Token("EOF", None, n))
+    return tokens
+
+
+def _previous(tokens: List[Token]) -> Optional[str]:
+    return tokens[-1].kind if tokens else None
+
+
+def _read_string(text: str, i: int) -> Tuple[str, int]:
+    quote = text[i]
+    i += 1
+    chars: List[str] = []
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text):
+            nxt = text[i + 1]
+            if nxt == "u" and i + 5 < len(text):
+                chars.append(chr(int(text[i + 2 : i + 6], 16)))
+                i += 6
+                continue
+            chars.append(ESCAPES.get(nxt, nxt))
+            i += 2
+        elif ch == quote:
+            return "".join(chars), i + 1
+        else:
+            chars.append(ch)
+            i += 1
+    raise ValueError("Unterminated string literal")
+
+
+def _read_regex(text: str, i: int) -> Tuple[str, int]:
+    start = i
+    i += 1
+    in_class = False
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "[":
+            in_class = True
+        elif ch == "]":
+            in_class = False
+        elif ch == "/" and not in_class:
+            return text[start + 1 : i], i + 1
+        elif ch == "\n":
+            break
+        i += 1
+    raise ValueError(f"Unterminated regex literal at position {start}")
+
+
+class MongoQueryParser:
+    """
+    Recursive-descent parser for the mongosh subset the LLM produces:
+
+        query  := "show" "collections"
+                | "db" target ("." IDENT "(" args ")")+
+        target := ("." IDENT)+ | "[" STRING "]"
+                | "." "getCollection" "(" STRING ")"
+        value  := object | array | STRING | NUMBER | REGEX
+                | true | false | null | IDENT "(" args ")"
+
+    Object keys may be bare identifiers (including `$op` and dotted
+    paths) or quoted strings, and trailing commas are accepted.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.tokens = tokenize(text)
+        self.index = 0
+        # Set once a constructor generates its value (ObjectId(), Date())
+        self.volatile = False
+
+    @property
+    def current(self) -> Token:
+        return self.tokens[self.index]
+
+    def peek(self, offset: int = 1) -> Token:
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def advance(self) -> Token:
+        token = self.current
+        self.index += 1
+        return token
+
+    def expect(self, kind: str) -> Token:
+        token = self.current
+        if token.kind != kind:
+            raise ValueError(
+                f"Expected {kind!r} at position {token.pos}, "
+                f"found {token.value!r}"
+            )
+        return self.advance()
+
+    def accept(self, kind: str) -> bool:
+        if self.current.kind == kind:
+            self.index += 1
+            return True
+        return False
+
+    def parse(self) -> MongoPlan:
+        token = self.current
+        if (
+            token.kind == "IDENT"
+            and token.value == "show"
+            and self.peek().value == "collections"
+        ):
+            return MongoPlan(show_collections=True)
+
+        if not (token.kind == "IDENT" and token.value == "db"):
+            raise ValueError(
+                "Invalid query format. Expected: db.collection.method(...) chain"
+            )
+        self.advance()
+
+        path = self.parse_target()
+        if len(path) < 2:
+            raise ValueError(
+                "Invalid query format. Expected: db.collection.method(...) chain"
+            )
+        # The last name is the first method; anything before the
+        # collection is a database prefix such as db.imdb_ijs.actors
+        first_method = path.pop()
+        collection = path.pop()
+        db_prefix = ".".join(path) or None
+
+        ops = [(first_method, self.parse_call_args())]
+        while self.accept("."):
+            method = self.expect("IDENT").value
+            ops.append((method, self.parse_call_args()))
+        if self.current.kind != "EOF":
+            raise ValueError(
+                f"Unexpected {self.current.value!r} after query at "
+                f"position {self.current.pos}"
+            )
+        return MongoPlan(collection, db_prefix, ops, volatile=self.volatile)
+
+    def parse_target(self) -> List[str]:
+        path: List[str] = []
+        if self.accept("["):
+            path.append(self.expect("STRING").value)
+            self.expect("]")
+        while self.accept("."):
+            name = self.expect("IDENT").value
+            if name == "getCollection" and not path:
+                self.expect("(")
+                path.append(self.expect("STRING").value)
+                self.expect(")")
+                continue
+            path.append(name)
+            if self.current.kind == "(":
+                break
+        return path
+
+    def parse_call_args(self) -> List[Any]:
+        self.expect("(")
+        args: List[Any] = []
+        while self.current.kind != ")":
+            args.append(self.parse_value())
+            if not self.accept(","):
+                break
+        self.expect(")")
+        return args
+
+    def parse_value(self) -> Any:
+        token = self.current
+        if token.kind == "{":
+            return self.parse_object()
+        if token.kind == "[":
+            return self.parse_array()
+        if token.kind in ("STRING", "NUMBER", "REGEX"):
+            self.advance()
+            return token.value
+        if token.kind == "IDENT":
+            if token.value in LITERALS:
+                self.advance()
+                return LITERALS[token.value]
+            if token.value == "new":
+                self.advance()
+            return self.parse_constructor()
+        raise ValueError(f"Unexpected {token.value!r} at position {token.pos}")
+
+    def parse_object(self) -> Any:
+        self.expect("{")
+        obj = {}
+        while self.current.kind != "}":
+            key_token = self.advance()
+            if key_token.kind not in ("IDENT", "STRING", "NUMBER"):
+                raise ValueError(
+                    f"Invalid object key {key_token.value!r} at position "
+                    f"{key_token.pos}"
+                )
+            key = str(key_token.value)
+            # Unquoted dotted paths such as director_info.first_name: 1
+            while (
+                key_token.kind == "IDENT"
+                and self.current.kind == "."
+                and self.peek().kind == "IDENT"
+            ):
+                self.advance()
+                key += "." + self.advance().value
+            # {"$$var"} is a common LLM slip for the bare "$$var" reference
+            if not obj and self.current.kind == "}" and key.startswith("$$"):
+                self.advance()
+                return key
+            self.expect(":")
+            obj[key] = self.parse_value()
+            if not self.accept(","):
+                break
+        self.expect("}")
+        return obj
+
+    def parse_array(self) -> List[Any]:
+        self.expect("[")
+        items: List[Any] = []
+        while self.current.kind != "]":
+            items.append(self.parse_value())
+            if not self.accept(","):
+                break
+        self.expect("]")
+        return items
+
+    def parse_constructor(self) -> Any:
+        token = self.expect("IDENT")
+        args = self.parse_call_args()
+        name = token.value
+        if name in ("ISODate", "Date"):
+            # Dates are loaded as "YYYY-MM-DD" strings, so compare as such
+            if not args:
+                self.volatile = True
+                return datetime.datetime.now(datetime.timezone.utc)
+            value = str(args[0])
+            return (
+                value[:10] if re.match(r"\d{4}-\d{2}-\d{2}", value) else value
+            )
+        if name == "ObjectId":
+            if not args:
+                self.volatile = True
+                return ObjectId()
+            return ObjectId(args[0])
+        if name in ("NumberInt", "NumberLong"):
+            value = int(args[0])
+            return Int64(value) if name == "NumberLong" else value
+        if name == "NumberDecimal":
+            return Decimal128(str(args[0]))
+        raise ValueError(
+            f"Unsupported constructor {name}() at position {token.pos}"
+        )
+
+
+def extract_mongo_query(llm_response: str) -> Optional[str]:
+    """
+    Extracts the MongoDB query string from the LLM's response.
+    Handles various formats (code block, inline, raw JSON).
+    Returns only the query as a string (e.g., db.collection.aggregate([...])).
+    """
+    if not llm_response:
+        return None
+
+    # 1. Try to extract code from triple backtick blocks (```mongodb ... ```)
+    code_block_match = re.search(
+        r"```(?:\w+)?\s*\n([\s\S]+?)```", llm_response, re.IGNORECASE
+    )
+    if code_block_match:
+        return code_block_match.group(1).strip()
+
+    # 2. Try to find the first line that starts with `db.` and ends with a valid structure
+    db_query_match = re.search(
+        r"(db\.\w+\.(?:aggregate|find|insertOne|updateOne|deleteOne)\s*\([\s\S]+)",
+        llm_response,
+    )
+    if db_query_match:
+        return db_query_match.group(1).strip()
+
+    # 3. Try extracting a JSON-like aggregation pipeline list
+    pipeline_match = re.search(r"\[\s*{[\s\S]+?}\s*]", llm_response)
+    if pipeline_match:
+        # Assume "db.<collection>.aggregate(...)" or fallback to "paper" as default collection
+        return f"db.paper.aggregate({pipeline_match.group(0).strip()})"
+
+    # 4. Fallback: Check if response *is* the query directly
+    stripped = llm_response.strip()
+    if stripped.startswith(("db.", "db[")) and (
+        "(" in stripped and ")" in stripped
+    ):
+        return stripped
+
+    return None
+
+
+def _parse(query: str) -> MongoPlan:
+    if query.strip().lower() == "show collections":
+        return MongoPlan(show_collections=True)
+    extracted = extract_mongo_query(query)
+    if not extracted:
+        raise ValueError("No MongoDB query found in the input.")
+    return MongoQueryParser(extracted).parse()
+
+
+_parse_cached = lru_cache(maxsize=Config.MONGO_PLAN_CACHE_SIZE)(_parse)
+
+
+def compile_mongo_query(query: str) -> MongoPlan:
+    """
+    Extracts, tokenizes and parses a query into a MongoPlan. Memoized on
+    the raw text, so repeated queries skip parsing entirely. Volatile
+    plans are parsed again on every call, so each run gets its own
+    `ObjectId()` and `new Date()` values.
+    """
+    plan = _parse_cached(query)
+    return _parse(query) if plan.volatile else plan
@@ -0,0 +1,129 @@
+import time
+import asyncio
+import mysql.connector.aio
+from mysql.connector import errors
+from mysql.connector.aio import MySQLConnection
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config.config import Config
+from services.log import get_logger
+
+logger = get_logger("sql")
+
+
+class MySQLPool:
+    """
+    Bounded pool of async MySQL connections bound to a single schema.
+
+    Connections are opened with `database=db_name`, so statements run
+    without a per-query `USE`. Idle connections are pinged on checkout
+    once they have been unused for longer than `ping_interval` seconds,
+    and are transparently replaced when the ping fails.
+    """
+
+    def __init__(
+        self,
+        db_name: Optional[str],
+        size: int = Config.MYSQL_POOL_SIZE,
+        ping_interval: float = Config.MYSQL_POOL_PING_INTERVAL,
+    ) -> None:
+        self.db_name = db_name
+        self.size = size
+        self.ping_interval = ping_interval
+        self._slots = asyncio.Semaphore(size)
+        # LIFO so the hottest connections are reused and the rest can age
+        self._idle: List[Tuple[MySQLConnection, float]] = []
+
+    async def _connect(self) -> MySQLConnection:
+        params = {
+            "host": Config.MYSQL["host"],
+            "user": Config.MYSQL["user"],
+            "password": Config.MYSQL["password"],
+            "port": Config.MYSQL["port"],
+            # Pooled sessions outlive a request; autocommit keeps reads from
+            # pinning an old REPEATABLE READ snapshot between checkouts.
+            "autocommit": True,
+        }
+        if self.db_name:
+            params["database"] = self.db_name
+        logger.info(
+            "🔌 Opening MySQL connection to %s", self.db_name or "<no db>"
+        )
+        return await mysql.connector.aio.connect(**params)
+
+    async def _checkout(self) -> MySQLConnection:
+        while self._idle:
+            connection, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.ping_interval:
+                return connection
+            try:
+                await connection.ping()
+                return connection
+            except Exception as e:
+                logger.warning("♻️ Dropping dead MySQL connection: %s", e)
+                await self._close_quietly(connection)
+        return await self._connect()
+
+    def _checkin(self, connection: MySQLConnection) -> None:
+        if connection.is_socket_connected():
+            self._idle.append((connection, time.monotonic()))
+
+    async def _close_quietly(self, connection: MySQLConnection) -> None:
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def connection(
+        self,
+    ) -> AsyncIterator[MySQLConnection]:
+        """
+        Borrows a healthy connection for the duration of the block.
+        A connection that failed mid-statement is discarded instead of
+        being returned to the pool.
+        """
+        async with self._slots:
+            connection = await self._checkout()
+            try:
+                yield connection
+            except errors.DatabaseError as e:
+                # Server-side statement errors leave the session usable
+                if isinstance(e, errors.OperationalError):
+                    await self._close_quietly(connection)
+                else:
+                    self._checkin(connection)
+                raise
+            except BaseException:
+                # Dropped links and cancellations mid-statement leave the
+                # protocol in an unknown state, so never reuse those.
+                await self._close_quietly(connection)
+                raise
+            else:
+                self._checkin(connection)
+
+    async def close(self) -> None:
+        while self._idle:
+            connection, _ = self._idle.pop()
+            await self._close_quietly(connection)
+
+
+class MySQLPoolManager:
+    """
+    Keeps one MySQLPool per database name, created on first use.
+    """
+
+    def __init__(self) -> None:
+        self.pools: Dict[Optional[str], MySQLPool] = {}
+
+    def get_pool(self, db_name: Optional[str]) -> MySQLPool:
+        pool = self.pools.get(db_name)
+        if pool is None:
+            pool = MySQLPool(db_name)
+            self.pools[db_name] = pool
+        return pool
+
+    async def close(self) -> None:
+        for pool in self.pools.values():
+            await pool.close()
+        self.pools.clear()
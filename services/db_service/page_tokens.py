@@ -0,0 +1,101 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import datetime
+from decimal import Decimal
+from typing import Any, Dict
+from config.config import Config
+
+# Without a configured secret, tokens only survive until the next restart
+_SECRET = (Config.PAGE_TOKEN_SECRET or os.urandom(32).hex()).encode("utf-8")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: bytes) -> str:
+    digest = hmac.new(_SECRET, payload, hashlib.sha256).digest()
+    return _b64encode(digest[:16])
+
+
+def _tag(value: Any) -> Dict[str, Any]:
+    """
+    `default=` hook keeping driver values (a keyset page's last key)
+    exact: each is written as {"$<type>": text} and read back as the
+    same type, where plain JSON would round Decimals and turn dates into
+    strings.
+    """
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$time": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$timedelta": [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": _b64encode(bytes(value))}
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
+
+
+_UNTAG = {
+    "$decimal": Decimal,
+    "$datetime": datetime.datetime.fromisoformat,
+    "$date": datetime.date.fromisoformat,
+    "$time": datetime.time.fromisoformat,
+    "$timedelta": lambda parts: datetime.timedelta(*parts),
+    "$bytes": _b64decode,
+}
+
+
+def _untag(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        ((tag, value),) = obj.items()
+        if tag in _UNTAG:
+            return _UNTAG[tag](value)
+    return obj
+
+
+def encode_page_token(state: Dict[str, Any]) -> str:
+    """
+    Opaque continuation token carrying `state`. The state is readable by
+    the client but signed, so it cannot be altered to run other queries.
+    """
+    payload = json.dumps(
+        {**state, "issued": int(time.time())},
+        default=_tag,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return f"{_b64encode(payload)}.{_sign(payload)}"
+
+
+def decode_page_token(token: str) -> Dict[str, Any]:
+    """
+    Returns the state of a token made by `encode_page_token`. Raises
+    ValueError when the token is malformed, tampered with or expired.
+    """
+    try:
+        body, signature = token.split(".")
+        payload = _b64decode(body)
+    except ValueError:
+        raise ValueError("Malformed page token.")
+    # Bytes, since compare_digest rejects str holding non-ASCII characters
+    expected = _sign(payload).encode("ascii")
+    if not hmac.compare_digest(signature.encode("utf-8"), expected):
+        raise ValueError("Invalid page token.")
+    state = json.loads(payload, object_hook=_untag)
+    if time.time() - state.get("issued", 0) > Config.PAGE_TOKEN_TTL:
+        raise ValueError("Page token has expired.")
+    return state
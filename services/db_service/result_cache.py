@@ -0,0 +1,253 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional, Set, Tuple
+from config.config import Config
+from services.db_service.json_encoding import json_default
+from services.log import get_logger
+
+logger = get_logger("cache")
+
+# (dbms_type, database, table/collection), all lower-cased
+TableRef = Tuple[str, str, str]
+CacheKey = Tuple[str, str, str]
+
+# Rows encoded at a time while sizing a result against the entry limit
+SIZE_CHUNK_ROWS = 256
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "tables")
+
+    def __init__(
+        self,
+        value: Any,
+        size: int,
+        expires_at: float,
+        tables: FrozenSet[TableRef],
+    ) -> None:
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.tables = tables
+
+
+def _json_length(value: Any) -> int:
+    return len(json.dumps(value, default=json_default, separators=(",", ":")))
+
+
+def result_size(value: Any, limit: Optional[int] = None) -> int:
+    """
+    Length of `value` as compact JSON. Lists are encoded SIZE_CHUNK_ROWS
+    rows at a time and, with `limit`, counting stops once the length
+    passes it, so a result too large to cache is never encoded in full.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if not isinstance(value, list) or len(value) <= SIZE_CHUNK_ROWS:
+        return _json_length(value)
+    size = 1
+    for start in range(0, len(value), SIZE_CHUNK_ROWS):
+        # The chunk's rows and the "," or "]" after them
+        chunk = value[start : start + SIZE_CHUNK_ROWS]
+        size += _json_length(chunk) - 1
+        if limit is not None and size > limit:
+            break
+    return size
+
+
+class ResultCache:
+    """
+    Byte-bounded LRU of query results keyed on (dbms, database,
+    canonical query text).
+
+    Every entry records the tables or collections it read. A write calls
+    `invalidate` with the tables it touched, which evicts exactly the
+    entries that read any of them. Entries also expire after `ttl`
+    seconds to cover writes made outside this service.
+
+    A read that overlaps a write could still store rows from before it,
+    after the write's invalidation ran. Each invalidation therefore
+    stamps the tables it covers with a new generation; a reader takes
+    `generation` of its tables before executing and passes it to `set`,
+    which drops the result when any of them was stamped since.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = Config.RESULT_CACHE_MAX_BYTES,
+        ttl: float = Config.RESULT_CACHE_TTL,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # One result may take at most this share of the cache
+        self.max_entry_bytes = max_bytes // 8
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._by_table: Dict[TableRef, Set[CacheKey]] = {}
+        self._bytes = 0
+        # Generation stamped on each table, and on each (dbms, database)
+        # by whole-database invalidations, by the last invalidate call
+        self._clock = 0
+        self._table_generations: Dict[TableRef, int] = {}
+        self._db_generations: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "too_large": 0,
+            "evictions": 0,
+            "expired": 0,
+            "invalidated": 0,
+            "stale": 0,
+        }
+
+    @staticmethod
+    def make_key(dbms_type: str, db_name: Optional[str], query: str):
+        return (dbms_type, (db_name or "").lower(), query)
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry.value
+
+    def generation(self, tables: FrozenSet[TableRef]) -> int:
+        with self._lock:
+            return self._generation(tables)
+
+    def _generation(self, tables: FrozenSet[TableRef]) -> int:
+        return max(
+            (
+                max(
+                    self._table_generations.get(table, 0),
+                    self._db_generations.get(table[:2], 0),
+                )
+                for table in tables
+            ),
+            default=0,
+        )
+
+    def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        tables: FrozenSet[TableRef],
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Stores a result read from `tables`. With the `generation` taken
+        before the read, the result is dropped if a write to any of the
+        tables was invalidated while it ran.
+        """
+        size = result_size(value, self.max_entry_bytes)
+        with self._lock:
+            if (
+                generation is not None
+                and self._generation(tables) != generation
+            ):
+                self.stats["stale"] += 1
+                return
+            if size > self.max_entry_bytes:
+                self.stats["too_large"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                value, size, time.time() + self.ttl, tables
+            )
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self.stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def invalidate(
+        self,
+        dbms_type: str,
+        db_name: Optional[str],
+        tables: Optional[FrozenSet[str]] = None,
+    ) -> int:
+        """
+        Evicts entries that read any of `tables` in the database, or every
+        entry of the database when `tables` is None (e.g. after DDL).
+        """
+        db = (db_name or "").lower()
+        with self._lock:
+            self._clock += 1
+            if tables is None:
+                self._db_generations[(dbms_type, db)] = self._clock
+            else:
+                for table in tables:
+                    self._table_generations[(dbms_type, db, table.lower())] = (
+                        self._clock
+                    )
+            if tables is None:
+                keys = {
+                    key
+                    for key, entry in self._entries.items()
+                    if any(t[:2] == (dbms_type, db) for t in entry.tables)
+                    or key[:2] == (dbms_type, db)
+                }
+            else:
+                keys = set()
+                for table in tables:
+                    keys |= self._by_table.get(
+                        (dbms_type, db, table.lower()), set()
+                    )
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidated"] += len(keys)
+            if keys:
+                logger.debug(
+                    "🧹 Result cache: evicted %d entries (%s)", len(keys), db
+                )
+            return len(keys)
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": (
+                    round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+                ),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+
+result_cache = ResultCache() if Config.RESULT_CACHE_ENABLED else None
@@ -0,0 +1,387 @@
+import asyncio
+import datetime
+import hashlib
+from collections import Counter
+from decimal import Decimal
+from bson import Decimal128, Int64, ObjectId
+from config.config import Config
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from services.log import get_logger
+
+logger = get_logger("schema")
+
+SQL_COLUMNS_QUERY = """
+    SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA IN ({placeholders})
+    ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+"""
+
+SQL_KEYS_QUERY = """
+    SELECT k.TABLE_SCHEMA, k.TABLE_NAME, k.CONSTRAINT_NAME, k.COLUMN_NAME,
+           k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+           c.CONSTRAINT_TYPE
+    FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+    JOIN INFORMATION_SCHEMA.TABLE_CONSTRAINTS c
+      ON c.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA
+     AND c.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+     AND c.TABLE_NAME = k.TABLE_NAME
+    WHERE k.TABLE_SCHEMA IN ({placeholders})
+    ORDER BY k.TABLE_SCHEMA, k.TABLE_NAME, k.CONSTRAINT_NAME,
+             k.ORDINAL_POSITION
+"""
+
+# Python/BSON value type -> type name used in the Mongo prompt schema
+BSON_TYPE_NAMES = [
+    (bool, "bool"),
+    ((int, Int64), "int"),
+    ((float, Decimal, Decimal128), "float"),
+    (str, "string"),
+    (datetime.datetime, "ISODate"),
+    (ObjectId, "ObjectId"),
+    (dict, "object"),
+    (list, "array"),
+]
+
+
+def bson_type_name(value: Any) -> Optional[str]:
+    for types, name in BSON_TYPE_NAMES:
+        if isinstance(value, types):
+            return name
+    return None
+
+
+class ColumnInfo:
+    __slots__ = ("name", "type", "nullable")
+
+    def __init__(self, name: str, type: str, nullable: bool) -> None:
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+
+
+class TableInfo:
+    """
+    Columns and keys of one table or collection. Key columns are kept in
+    declaration order; `foreign_keys` holds (column, ref_table, ref_column).
+    """
+
+    __slots__ = (
+        "name",
+        "columns",
+        "primary_key",
+        "unique_keys",
+        "foreign_keys",
+        "row_estimate",
+    )
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.columns: Dict[str, ColumnInfo] = {}
+        self.primary_key: Tuple[str, ...] = ()
+        self.unique_keys: List[Tuple[str, ...]] = []
+        self.foreign_keys: List[Tuple[str, str, str]] = []
+        self.row_estimate: Optional[int] = None
+
+
+class DatabaseInfo:
+    __slots__ = ("name", "dbms_type", "tables", "signature")
+
+    def __init__(self, name: str, dbms_type: str) -> None:
+        self.name = name
+        self.dbms_type = dbms_type
+        self.tables: Dict[str, TableInfo] = {}
+        self.signature = ""
+
+
+class SchemaCatalog:
+    """
+    In-memory catalog of the live MySQL and MongoDB schemas.
+
+    MySQL is read with two bulk INFORMATION_SCHEMA queries covering every
+    configured database. Mongo collections are typed from a `$sample` of
+    their documents and only re-sampled when their document count moves.
+    Each refresh compares per-database signatures; when any database
+    changed, `version` is bumped and subscribers are called with the
+    changed (dbms_type, db) pairs.
+    """
+
+    def __init__(
+        self,
+        sql_executor,
+        mongo_executor,
+        databases: List[str] = Config.SCHEMA_CATALOG_DATABASES,
+        sample_size: int = Config.MONGO_SCHEMA_SAMPLE_SIZE,
+        refresh_interval: float = Config.SCHEMA_REFRESH_INTERVAL,
+    ) -> None:
+        self.sql_executor = sql_executor
+        self.mongo_executor = mongo_executor
+        self.databases = databases
+        self.sample_size = sample_size
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        # Keyed by lower-cased database name
+        self.sql: Dict[str, DatabaseInfo] = {}
+        self.mongo: Dict[str, DatabaseInfo] = {}
+        self._listeners: List[
+            Callable[["SchemaCatalog", List[Tuple[str, str]]], None]
+        ] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def subscribe(
+        self,
+        callback: Callable[["SchemaCatalog", List[Tuple[str, str]]], None],
+    ) -> None:
+        self._listeners.append(callback)
+
+    def get_database(
+        self, dbms_type: str, db_name: str
+    ) -> Optional[DatabaseInfo]:
+        databases = self.sql if dbms_type == "sql" else self.mongo
+        return databases.get(db_name.lower())
+
+    def get_table(
+        self, dbms_type: str, db_name: str, table_name: str
+    ) -> Optional[TableInfo]:
+        database = self.get_database(dbms_type, db_name)
+        if database is None:
+            return None
+        return database.tables.get(table_name)
+
+    async def refresh(self) -> List[Tuple[str, str]]:
+        """
+        Re-introspects both backends and publishes the databases whose
+        schema changed. A backend that cannot be reached keeps its last
+        known catalog.
+        """
+        async with self._lock:
+            changed: List[Tuple[str, str]] = []
+            for dbms_type, introspect, current in (
+                ("sql", self._introspect_mysql, self.sql),
+                ("mongo", self._introspect_mongo, self.mongo),
+            ):
+                try:
+                    fresh = await introspect()
+                except Exception as e:
+                    logger.warning(
+                        "⚠️ %s schema introspection failed: %s", dbms_type, e
+                    )
+                    continue
+                for key, database in fresh.items():
+                    previous = current.get(key)
+                    current[key] = database
+                    if previous is None or (
+                        previous.signature != database.signature
+                    ):
+                        changed.append((dbms_type, key))
+
+            if changed:
+                self.version += 1
+                logger.info(
+                    "📚 Schema catalog v%d: %s",
+                    self.version,
+                    ", ".join(f"{d}:{n}" for d, n in changed),
+                )
+                for callback in self._listeners:
+                    callback(self, changed)
+            return changed
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _introspect_mysql(self) -> Dict[str, DatabaseInfo]:
+        placeholders = ", ".join(["%s"] * len(self.databases))
+        pool = self.sql_executor.pools.get_pool(None)
+        async with pool.connection() as connection:
+            cursor = await connection.cursor(dictionary=True)
+            try:
+                await cursor.execute(
+                    SQL_COLUMNS_QUERY.format(placeholders=placeholders),
+                    tuple(self.databases),
+                )
+                columns = await cursor.fetchall()
+                await cursor.execute(
+                    SQL_KEYS_QUERY.format(placeholders=placeholders),
+                    tuple(self.databases),
+                )
+                keys = await cursor.fetchall()
+            finally:
+                await cursor.close()
+
+        databases: Dict[str, DatabaseInfo] = {}
+        signatures: Dict[str, Any] = {}
+
+        def table_for(row: Dict[str, Any]) -> TableInfo:
+            schema = row["TABLE_SCHEMA"]
+            database = databases.get(schema.lower())
+            if database is None:
+                database = DatabaseInfo(schema, "sql")
+                databases[schema.lower()] = database
+                signatures[schema.lower()] = hashlib.sha256()
+            signatures[schema.lower()].update(
+                repr(sorted(row.items())).encode("utf-8")
+            )
+            table = database.tables.get(row["TABLE_NAME"])
+            if table is None:
+                table = TableInfo(row["TABLE_NAME"])
+                database.tables[row["TABLE_NAME"]] = table
+            return table
+
+        for row in columns:
+            table = table_for(row)
+            table.columns[row["COLUMN_NAME"]] = ColumnInfo(
+                row["COLUMN_NAME"],
+                row["COLUMN_TYPE"].upper(),
+                row["IS_NULLABLE"] == "YES",
+            )
+
+        constraints: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        for row in keys:
+            table_for(row)
+            key = (
+                row["TABLE_SCHEMA"],
+                row["TABLE_NAME"],
+                row["CONSTRAINT_NAME"],
+            )
+            constraints.setdefault(key, []).append(row)
+
+        for (schema, table_name, _), rows in constraints.items():
+            table = databases[schema.lower()].tables[table_name]
+            key_columns = tuple(row["COLUMN_NAME"] for row in rows)
+            kind = rows[0]["CONSTRAINT_TYPE"]
+            if kind == "PRIMARY KEY":
+                table.primary_key = key_columns
+            elif kind == "UNIQUE":
+                table.unique_keys.append(key_columns)
+            elif kind == "FOREIGN KEY":
+                table.foreign_keys.extend(
+                    (
+                        row["COLUMN_NAME"],
+                        row["REFERENCED_TABLE_NAME"],
+                        row["REFERENCED_COLUMN_NAME"],
+                    )
+                    for row in rows
+                )
+
+        for key, database in databases.items():
+            database.signature = signatures[key].hexdigest()
+        return databases
+
+    async def _introspect_mongo(self) -> Dict[str, DatabaseInfo]:
+        client = self.mongo_executor.client
+        databases: Dict[str, DatabaseInfo] = {}
+        for db_name in self.databases:
+            db = client[db_name.lower()]
+            previous = self.mongo.get(db_name.lower())
+            database = DatabaseInfo(db_name.lower(), "mongo")
+            signature = hashlib.sha256()
+
+            for coll_name in sorted(await db.list_collection_names()):
+                count = await db[coll_name].estimated_document_count()
+                known = previous.tables.get(coll_name) if previous else None
+                # Unchanged document count: reuse the previous sample
+                if known is not None and known.row_estimate == count:
+                    table = known
+                else:
+                    table = await self._sample_collection(db, coll_name)
+                    table.row_estimate = count
+                database.tables[coll_name] = table
+                signature.update(
+                    repr(
+                        (
+                            coll_name,
+                            [(c.name, c.type) for c in table.columns.values()],
+                        )
+                    ).encode("utf-8")
+                )
+
+            if database.tables:
+                database.signature = signature.hexdigest()
+                databases[db_name.lower()] = database
+        return databases
+
+    async def _sample_collection(self, db, coll_name: str) -> TableInfo:
+        """
+        Infers field types from a random sample: each field gets its most
+        common non-null type, and fields are listed in first-seen order.
+        """
+        table = TableInfo(coll_name)
+        table.primary_key = ("_id",)
+        seen: Dict[str, Counter] = {}
+        nulls: Counter = Counter()
+        cursor = await db[coll_name].aggregate(
+            [{"$sample": {"size": self.sample_size}}]
+        )
+        documents = await cursor.to_list()
+        for document in documents:
+            for field, value in document.items():
+                if field == "_id":
+                    continue
+                counts = seen.setdefault(field, Counter())
+                type_name = bson_type_name(value)
+                if type_name is None:
+                    nulls[field] += 1
+                else:
+                    counts[type_name] += 1
+
+        for field, counts in seen.items():
+            table.columns[field] = ColumnInfo(
+                field,
+                counts.most_common(1)[0][0] if counts else "null",
+                # Missing from some documents or explicitly null
+                sum(counts.values()) < len(documents) or field in nulls,
+            )
+        return table
+
+    def render_sql_schemas(self, db_key: str) -> Dict[str, str]:
+        """
+        Table prompt fragments for SchemaLoader, one per table.
+        """
+        database = self.sql[db_key]
+        return {
+            name: "\n".join(
+                [f"Table: {name}"]
+                + [
+                    f"- {column.name}: {column.type}"
+                    for column in table.columns.values()
+                ]
+            )
+            for name, table in database.tables.items()
+        }
+
+    def render_mongo_schema(
+        self, db_key: str, refs: Dict[Tuple[str, str], Tuple[str, str]]
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Collection definitions in MongoSchemaLoader's format. Mongo has no
+        declared references, so `refs` maps (collection, field) to the
+        known (collection, field) it points at.
+        """
+        database = self.mongo[db_key]
+        schema: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for coll_name, table in database.tables.items():
+            fields: Dict[str, Dict[str, Any]] = {}
+            for column in table.columns.values():
+                meta: Dict[str, Any] = {"type": column.type}
+                ref = refs.get((coll_name, column.name))
+                if ref is not None:
+                    meta["ref"] = ref
+                fields[column.name] = meta
+            schema[coll_name] = fields
+        return schema
@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from services.deadline import current_deadline, set_deadline
+from services.metrics import collect_timings, extend_timings
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "context", "deadline", "timings")
+
+    def __init__(self, deadline: Optional[float]) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # The task's own context, holding none of the leader's request
+        # state; its deadline is moved out as later waiters join
+        self.context = contextvars.Context()
+        self.deadline = deadline
+        self.context.run(set_deadline, deadline)
+        # Spans of the shared work, copied to every waiter's request
+        self.timings: List = []
+
+    def extend_deadline(self, deadline: Optional[float]) -> None:
+        if self.deadline is None:
+            return
+        if deadline is None or deadline > self.deadline:
+            self.deadline = deadline
+            # The task is suspended while another task runs, so its
+            # context can be entered; stages it starts from now on see
+            # the later deadline
+            self.context.run(set_deadline, deadline)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one running task.
+
+    The first caller (the leader) starts the work; callers arriving while
+    it runs (followers) await the same task and get the same result or
+    exception. The work runs in a context of its own, under the latest
+    deadline among its waiters (none if any waiter has none), and its
+    spans are reported to every waiter. Each waiter is shielded
+    separately and applies its own timeout, so a cancelled caller never
+    cancels the work for the others; the work itself is cancelled only
+    once every waiter has gone away.
+
+    Only use it for read-only work: coalesced calls run once.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.stats: Dict[str, int] = {
+            "leaders": 0,
+            "followers": 0,
+            "cancelled_waiters": 0,
+            "abandoned": 0,
+        }
+
+    async def do(
+        self, key: Hashable, work: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(current_deadline())
+            flight.task = asyncio.get_running_loop().create_task(
+                self._run(flight, work), context=flight.context
+            )
+            self._flights[key] = flight
+            flight.task.add_done_callback(
+                lambda _, key=key, flight=flight: self._forget(key, flight)
+            )
+            self.stats["leaders"] += 1
+        else:
+            flight.extend_deadline(current_deadline())
+            self.stats["followers"] += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.cancelled():
+                self.stats["cancelled_waiters"] += 1
+            raise
+        except Exception:
+            extend_timings(flight.timings)
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to read the result; later callers must
+                # not attach to the task being cancelled
+                self.stats["abandoned"] += 1
+                self._forget(key, flight)
+                flight.task.cancel()
+        extend_timings(flight.timings)
+        return result
+
+    @staticmethod
+    async def _run(flight: _Flight, work: Callable[[], Awaitable[Any]]) -> Any:
+        with collect_timings(flight.timings):
+            return await work()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._flights)}
@@ -1,143 +1,506 @@
-import mysql.connector
+import json
+import asyncio
 import sqlglot
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from sqlglot.errors import ParseError
 from config.config import Config
+from services.db_service.mysql_pool import MySQLPoolManager
+from services.db_service.result_cache import result_cache
+from services.deadline import cap_ms
+from services.metrics import span
 from sqlglot import expressions as exp
+from services.log import get_logger, log_payload
 
+logger = get_logger("sql")
 
-def check_sql_syntax(sql_query):
+# Dialects tried in order: the generic one first (what the LLM usually
+# writes), then MySQL for its own syntax such as backtick identifiers.
+PARSE_DIALECTS = (None, "mysql")
+
+# Statements that produce a result set besides SELECT/UNION/WITH queries
+ROW_RETURNING_COMMANDS = ("SHOW", "DESCRIBE", "DESC", "EXPLAIN")
+
+# Data changes scoped to the tables they reference
+DML_TYPES = (exp.Insert, exp.Update, exp.Delete)
+
+# Functions whose result changes between runs; queries using them are
+# never served from the result cache
+NONDETERMINISTIC_FUNCS = (
+    exp.Rand,
+    exp.Uuid,
+    exp.CurrentDate,
+    exp.CurrentTime,
+    exp.CurrentTimestamp,
+)
+NONDETERMINISTIC_NAMES = {"NOW", "SYSDATE", "UUID_SHORT", "CONNECTION_ID"}
+
+
+class PreparedQuery:
     """
-    Checks the syntax of a SQL query using sqlglot.
+    Result of running the SQL pipeline once over a raw query: the final
+    MySQL text plus facts read off the AST so callers never reparse.
     """
-    try:
-        sqlglot.parse_one(sql_query)
-        return True
-    except ParseError:
-        return False
 
+    __slots__ = (
+        "sql",
+        "returns_rows",
+        "read_tables",
+        "cacheable",
+        "is_write",
+        "write_tables",
+        "is_query",
+        "limit_in_session",
+    )
+
+    def __init__(
+        self,
+        sql,
+        returns_rows,
+        read_tables=frozenset(),
+        cacheable=False,
+        is_write=False,
+        write_tables=None,
+        is_query=False,
+        limit_in_session=False,
+    ):
+        self.sql = sql
+        self.returns_rows = returns_rows
+        # (db or "", table) pairs; "" means the connection's database
+        self.read_tables = read_tables
+        self.cacheable = cacheable
+        self.is_write = is_write
+        # None on a write means the whole database may have changed
+        self.write_tables = write_tables
+        # SELECT / UNION / WITH: can be EXPLAINed and carries a time limit
+        self.is_query = is_query
+        # A WITH query: MySQL ignores a hint on it, so the time limit is
+        # set on the session instead
+        self.limit_in_session = limit_in_session
 
-def fix_sql_syntax(sql_query):
+
+def parse_sql(sql_query):
     """
-    Attempts to fix the syntax of a SQL query using sqlglot.
+    Validates a SQL query by parsing it with sqlglot, falling back to the
+    MySQL dialect when the generic parser rejects it.
+    Returns the AST, or None if no dialect accepts it.
     """
-    try:
-        expression = sqlglot.parse_one(sql_query)
-        return expression.sql(dialect="mysql")
-    except ParseError:
-        return None
+    for dialect in PARSE_DIALECTS:
+        try:
+            expression = sqlglot.parse_one(sql_query, read=dialect)
+        except ParseError:
+            continue
+        if expression is not None:
+            if dialect:
+                logger.debug("✅ Query parsed as %s", dialect)
+            return expression
+    return None
 
 
-def rewrite_problematic_subqueries(sql_query):
+def rewrite_problematic_subqueries(expression):
     """
-    Uses sqlglot AST to detect and transform subqueries that use LIMIT inside IN clauses,
-    which are not supported by MySQL.
+    AST pass that detects and transforms subqueries that use LIMIT inside
+    IN clauses, which are not supported by MySQL.
     """
-    try:
-        expression = sqlglot.parse_one(sql_query)
+    for select_node in expression.find_all(exp.Select):
+        for in_node in select_node.find_all(exp.In):
+            if isinstance(in_node.args.get("expressions"), exp.Subquery):
+                subquery_expr = in_node.args["expressions"].args.get("this")
+
+                if isinstance(
+                    subquery_expr, exp.Select
+                ) and subquery_expr.args.get("limit"):
+                    logger.debug("🔁 Rewriting IN + LIMIT subquery to JOIN")
+
+                    # Extract the first column used in the subquery
+                    subquery_column = subquery_expr.expressions[0]
+
+                    # Alias the subquery as a derived table
+                    subquery_alias = exp.Alias(
+                        this=subquery_expr, alias=exp.to_identifier("sub")
+                    )
+
+                    # Build join condition: original_column = subquery_column
+                    join_condition = exp.EQ(
+                        this=in_node.args["this"],
+                        expression=exp.column("sub", subquery_column.name),
+                    )
+
+                    # Replace IN expression with a JOIN
+                    join = exp.Join(
+                        this=subquery_alias, on=join_condition, kind="INNER"
+                    )
+
+                    # Remove the original WHERE ... IN(...) condition
+                    if select_node.args.get("where"):
+                        original_where = select_node.args["where"]
+                        if original_where.find(in_node):
+                            select_node.set("where", None)
+
+                    # Add the JOIN
+                    if "joins" in select_node.args:
+                        select_node.args["joins"].append(join)
+                    else:
+                        select_node.set("joins", [join])
+
+    return expression
+
+
+def starts_with_cte(expression):
+    """
+    Whether the statement's first SELECT keyword belongs to a WITH
+    clause rather than to the top-level query block.
+    """
+    node = expression
+    while isinstance(node, (exp.SetOperation, exp.Subquery, exp.Select)):
+        if node.args.get("with") is not None:
+            return True
+        if isinstance(node, exp.Select):
+            return False
+        node = node.this
+    return False
+
+
+def limit_execution_time(expression):
+    """
+    AST pass adding a MAX_EXECUTION_TIME optimizer hint to the top-level
+    SELECT, so MySQL aborts reads running past SQL_MAX_EXECUTION_MS.
+    A limit already present in the query is kept. MySQL only honours the
+    hint after the statement's first SELECT keyword, which for a WITH
+    query is inside the CTE; those are left unhinted and get the limit
+    through the session instead (see MySQLExecutor._statement).
+    """
+    if Config.SQL_MAX_EXECUTION_MS <= 0 or starts_with_cte(expression):
+        return expression
+    select = expression
+    while isinstance(select, (exp.SetOperation, exp.Subquery)):
+        select = select.this
+    if not isinstance(select, exp.Select):
+        return expression
+
+    hint = select.args.get("hint")
+    if hint is not None and any(
+        isinstance(item, exp.Anonymous)
+        and str(item.this).upper() == "MAX_EXECUTION_TIME"
+        for item in hint.expressions
+    ):
+        return expression
+    limit = exp.Anonymous(
+        this="MAX_EXECUTION_TIME",
+        expressions=[exp.Literal.number(Config.SQL_MAX_EXECUTION_MS)],
+    )
+    if hint is None:
+        select.set("hint", exp.Hint(expressions=[limit]))
+    else:
+        hint.append("expressions", limit)
+    return expression
 
-        for select_node in expression.find_all(exp.Select):
-            for in_node in select_node.find_all(exp.In):
-                if isinstance(in_node.args.get("expressions"), exp.Subquery):
-                    subquery_expr = in_node.args["expressions"].args.get("this")
 
-                    if isinstance(
-                        subquery_expr, exp.Select
-                    ) and subquery_expr.args.get("limit"):
-                        print("🔁 Rewriting IN + LIMIT subquery to JOIN")
+# AST passes applied in order to the single parsed tree
+SQL_PASSES = [rewrite_problematic_subqueries, limit_execution_time]
 
-                        # Extract the first column used in the subquery
-                        subquery_column = subquery_expr.expressions[0]
 
-                        # Alias the subquery as a derived table
-                        subquery_alias = exp.Alias(
-                            this=subquery_expr, alias=exp.to_identifier("sub")
-                        )
+def returns_rows(expression):
+    if isinstance(expression, (exp.Query, exp.Show, exp.Describe)):
+        return True
+    if isinstance(expression, exp.Command):
+        return str(expression.this).upper() in ROW_RETURNING_COMMANDS
+    return False
+
 
-                        # Build join condition: original_column = subquery_column
-                        join_condition = exp.EQ(
-                            this=in_node.args["this"],
-                            expression=exp.column("sub", subquery_column.name),
-                        )
+def referenced_tables(expression):
+    """
+    Real tables named anywhere in the statement, skipping CTE names.
+    """
+    ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+    return frozenset(
+        (table.db.lower(), table.name.lower())
+        for table in expression.find_all(exp.Table)
+        if table.name and not (not table.db and table.name.lower() in ctes)
+    )
 
-                        # Replace IN expression with a JOIN
-                        join = exp.Join(
-                            this=subquery_alias, on=join_condition, kind="INNER"
-                        )
 
-                        # Remove the original WHERE ... IN(...) condition
-                        if select_node.args.get("where"):
-                            original_where = select_node.args["where"]
-                            if original_where.find(in_node):
-                                select_node.set("where", None)
+def is_deterministic(expression):
+    for func in expression.find_all(exp.Func):
+        if isinstance(func, NONDETERMINISTIC_FUNCS):
+            return False
+        if (
+            isinstance(func, exp.Anonymous)
+            and str(func.this).upper() in NONDETERMINISTIC_NAMES
+        ):
+            return False
+    return True
 
-                        # Add the JOIN
-                        if "joins" in select_node.args:
-                            select_node.args["joins"].append(join)
-                        else:
-                            select_node.set("joins", [join])
 
-        return expression.sql(dialect="mysql")
+@lru_cache(maxsize=Config.SQL_PREPARE_CACHE_SIZE)
+def prepare_sql(sql_query):
+    """
+    Parses the query once, runs every AST pass over that tree and renders
+    it as MySQL. Memoized on the raw text, so repeated queries skip
+    parsing entirely. Returns None if the query cannot be parsed.
+    """
+    expression = parse_sql(sql_query)
+    if expression is None:
+        return None
+
+    for sql_pass in SQL_PASSES:
+        try:
+            expression = sql_pass(expression)
+        except Exception as e:
+            logger.warning(
+                "⚠️ AST transformation %s failed: %s", sql_pass.__name__, e
+            )
 
-    except Exception as e:
-        print(f"⚠️ AST transformation failed: {e}")
-        return sql_query
+    tables = referenced_tables(expression)
+    rows = returns_rows(expression)
+    is_write = not rows
+    return PreparedQuery(
+        expression.sql(dialect="mysql"),
+        rows,
+        read_tables=tables,
+        cacheable=isinstance(expression, exp.Query)
+        and bool(tables)
+        and is_deterministic(expression),
+        is_write=is_write,
+        # DDL and unknown commands are not scoped to particular tables
+        write_tables=(
+            tables if isinstance(expression, DML_TYPES) and tables else None
+        ),
+        is_query=isinstance(expression, exp.Query),
+        limit_in_session=isinstance(expression, exp.Query)
+        and starts_with_cte(expression),
+    )
 
 
 class MySQLExecutor:
     def __init__(self):
-        self.connection = mysql.connector.connect(
-            host=Config.MYSQL["host"],
-            user=Config.MYSQL["user"],
-            password=Config.MYSQL["password"],
-            port=Config.MYSQL["port"],
-        )
-        self.cursor = self.connection.cursor(dictionary=True)
+        # Connections are opened lazily per database, since the async
+        # driver can only connect from inside a running event loop.
+        self.pools = MySQLPoolManager()
+        # In-flight KILL QUERY tasks, kept referenced until they finish
+        self._kills = set()
 
-    def execute_query(self, query, db_name=None):
+    def _prepare(self, query, db_name, mode=""):
+        """
+        First step of every execution path: logs the query and runs it
+        through the sqlglot pipeline. Raises ValueError when it cannot be
+        fixed.
+        """
+        label = f"📥 Received query ({mode})" if mode else "📥 Received query"
+        log_payload(logger, label, query, db=db_name)
+        with span("sql_prepare"):
+            prepared = prepare_sql(query)
+        if prepared is None:
+            raise ValueError("SQL syntax is invalid and could not be fixed.")
+        if prepared.sql != query:
+            log_payload(logger, "🧠 Rewritten query (AST)", prepared.sql)
+        return prepared
+
+    @asynccontextmanager
+    async def _statement(self, prepared, db_name, buffered=True):
+        """
+        Runs a prepared statement on a pooled connection and yields its
+        cursor, shared by execute_query and stream_query. Writes are
+        committed and their cached results invalidated. If the caller is
+        cancelled or stops reading, the statement is killed server-side
+        and the pool drops the connection; its cursor is not closed,
+        which would wait for the statement to end. A WITH query runs
+        under a session max_execution_time, reset once it is done.
+        """
+        pool = self.pools.get_pool(db_name)
+        session_limit = self._session_limit(prepared)
+        async with pool.connection() as connection:
+            cursor = await connection.cursor(
+                dictionary=True, buffered=buffered
+            )
+            try:
+                try:
+                    with span("sql_execute"):
+                        if session_limit is not None:
+                            await cursor.execute(
+                                "SET SESSION max_execution_time = "
+                                f"{session_limit}"
+                            )
+                        await cursor.execute(self._timed_sql(prepared))
+                    if not prepared.returns_rows:
+                        await connection.commit()
+                finally:
+                    self._invalidate(prepared, db_name)
+                yield cursor
+            except (asyncio.CancelledError, GeneratorExit):
+                self._kill_query(connection)
+                cursor = None
+                raise
+            finally:
+                if cursor is not None:
+                    await cursor.close()
+                    if session_limit is not None:
+                        # Pooled sessions outlive the request
+                        cursor = await connection.cursor()
+                        try:
+                            await cursor.execute(
+                                "SET SESSION max_execution_time = DEFAULT"
+                            )
+                        finally:
+                            await cursor.close()
+
+    async def execute_query(self, query, db_name=None):
         try:
-            print("📥 Received query:", query)
-
-            # Step 1: Syntax check and fix
-            if not check_sql_syntax(query):
-                print("⚠️ Syntax issue detected. Attempting to fix...")
-                fixed_query = fix_sql_syntax(query)
-                if fixed_query:
-                    print("✅ Query fixed by sqlglot:", fixed_query)
-                    query = fixed_query
-                else:
-                    return {
-                        "error": "SQL syntax is invalid and could not be fixed.",
-                        "query": query,
-                    }
-
-            # Step 2: Rewrite AST to fix incompatible structures
-            rewritten_query = rewrite_problematic_subqueries(query)
-            if rewritten_query != query:
-                print("🧠 Rewritten query (AST):", rewritten_query)
-                query = rewritten_query
-
-            cursor = self.connection.cursor(dictionary=True)
-
-            if db_name:
-                print(f"🔀 Switching to database: {db_name}")
-                cursor.execute(f"USE {db_name}")
-
-            cursor.execute(query)
-
-            if query.strip().lower().startswith("select"):
-                results = cursor.fetchall()
-                print(f"✅ Returned {len(results)} rows")
-                return results
-
-            self.connection.commit()
-            return {"status": "success"}
+            prepared = self._prepare(query, db_name)
+            query = prepared.sql
+
+            cache_key = None
+            if result_cache is not None and prepared.cacheable:
+                with span("result_cache"):
+                    cache_key = result_cache.make_key("sql", db_name, query)
+                    cached = result_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("⚡ Result cache hit (%d rows)", len(cached))
+                    return cached
+                tables = self._cache_tables(prepared, db_name)
+                # Taken before executing, so a write finishing during the
+                # read keeps its stale rows out of the cache
+                generation = result_cache.generation(tables)
+
+            async with self._statement(prepared, db_name) as cursor:
+                if not prepared.returns_rows:
+                    return {"status": "success"}
+                with span("sql_fetch"):
+                    results = await cursor.fetchall()
+            logger.debug("✅ Returned %d rows", len(results))
+            if cache_key is not None:
+                result_cache.set(cache_key, results, tables, generation)
+            return results
 
         except Exception as e:
-            print(f"❌ Error during SQL execution: {str(e)}")
+            logger.error("❌ Error during SQL execution: %s", e)
             return {"error": str(e), "query": query}
 
-        finally:
-            cursor.close()
+    async def stream_query(
+        self, query, db_name=None, batch_size=Config.MYSQL_STREAM_BATCH_SIZE
+    ):
+        """
+        Async generator over the result set in `fetchmany` batches of row
+        dicts, read from an unbuffered cursor so only one batch is held in
+        memory. Statements without a result set yield a single
+        [{"status": "success"}] batch. Errors are raised, not returned.
+        Row caps and the cost guard are applied by the caller, as for
+        execute_query.
+        """
+        prepared = self._prepare(query, db_name, "streaming")
+        async with self._statement(
+            prepared, db_name, buffered=False
+        ) as cursor:
+            if not prepared.returns_rows:
+                yield [{"status": "success"}]
+                return
+            total = 0
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                total += len(rows)
+                yield rows
+        logger.debug("✅ Streamed %d rows", total)
+
+    async def explain(self, query, db_name=None):
+        """
+        MySQL's EXPLAIN FORMAT=JSON plan for a read query, as a dict.
+        Returns None for statements that are not queries or cannot be
+        parsed. Errors are raised, not returned.
+        """
+        prepared = prepare_sql(query)
+        if prepared is None or not prepared.is_query:
+            return None
+        pool = self.pools.get_pool(db_name)
+        async with pool.connection() as connection:
+            cursor = await connection.cursor()
+            try:
+                await cursor.execute(f"EXPLAIN FORMAT=JSON {prepared.sql}")
+                row = await cursor.fetchone()
+            finally:
+                await cursor.close()
+        return json.loads(row[0])
+
+    def _timed_sql(self, prepared):
+        """
+        The statement to send, with its MAX_EXECUTION_TIME hint shortened
+        to the current request's remaining time.
+        """
+        limit = Config.SQL_MAX_EXECUTION_MS
+        if not prepared.is_query or limit <= 0:
+            return prepared.sql
+        capped = cap_ms(limit)
+        if capped == limit:
+            return prepared.sql
+        return prepared.sql.replace(
+            f"MAX_EXECUTION_TIME({limit})", f"MAX_EXECUTION_TIME({capped})", 1
+        )
+
+    def _session_limit(self, prepared):
+        """
+        The max_execution_time to set on the session for a WITH query,
+        which cannot carry the hint, capped to the current request's
+        remaining time. None for every other statement.
+        """
+        limit = Config.SQL_MAX_EXECUTION_MS
+        if not prepared.limit_in_session or limit <= 0:
+            return None
+        return cap_ms(limit)
+
+    def _kill_query(self, connection):
+        """
+        Stops the statement running on `connection` from a separate
+        connection. Cancelling the coroutine only abandons the socket;
+        without this the server keeps executing the statement.
+        """
+        connection_id = getattr(connection, "connection_id", None)
+        if connection_id is None:
+            return
+        task = asyncio.ensure_future(self._send_kill(int(connection_id)))
+        self._kills.add(task)
+        task.add_done_callback(self._kills.discard)
+
+    async def _send_kill(self, connection_id):
+        try:
+            async with self.pools.get_pool(None).connection() as connection:
+                cursor = await connection.cursor()
+                try:
+                    await cursor.execute(f"KILL QUERY {connection_id}")
+                finally:
+                    await cursor.close()
+            logger.info(
+                "🛑 Killed MySQL query on connection %s", connection_id
+            )
+        except Exception as e:
+            logger.warning("⚠️ KILL QUERY %s failed: %s", connection_id, e)
+
+    def _cache_tables(self, prepared, db_name):
+        return frozenset(
+            ("sql", (db or db_name or "").lower(), table)
+            for db, table in prepared.read_tables
+        )
+
+    def _invalidate(self, prepared, db_name):
+        """
+        Evicts cached results a write may have changed: the tables it
+        names, or the whole database for DDL and other statements.
+        """
+        if result_cache is None or not prepared.is_write:
+            return
+        if prepared.write_tables is None:
+            result_cache.invalidate("sql", db_name)
+            return
+        by_db = {}
+        for db, table in prepared.write_tables:
+            by_db.setdefault(db or db_name, set()).add(table)
+        for db, tables in by_db.items():
+            result_cache.invalidate("sql", db, frozenset(tables))
+
+    async def close(self):
+        if self._kills:
+            await asyncio.gather(*self._kills, return_exceptions=True)
+        await self.pools.close()
 
 
 sql_executor = MySQLExecutor()
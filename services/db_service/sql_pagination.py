@@ -0,0 +1,299 @@
+import sqlglot
+import datetime
+from functools import lru_cache
+from sqlglot import expressions as exp
+from config.config import Config
+from services.db_service.sql_executor import prepare_sql
+from services.db_service.page_tokens import encode_page_token
+from typing import Any, Dict, List, Optional, Tuple
+from services.log import get_logger
+
+logger = get_logger("sql")
+
+# Hidden column carrying the seek value of each row; removed before rows
+# are returned
+PAGE_KEY = "_page_key"
+
+# Clauses after which the rows of a SELECT no longer map 1:1 onto the
+# rows of its table, so a table key cannot be used to seek
+NON_KEYSET_ARGS = ("joins", "group", "having", "distinct", "offset")
+
+
+class PagePlan:
+    """
+    How a generated query without a LIMIT is paged. `table` is set only
+    when the query can seek on a key of that table: a single-table SELECT
+    with no grouping, aggregates or windows, ordered by at most one plain
+    column (`order_column`).
+    """
+
+    __slots__ = ("table", "db", "ref", "order_column", "descending")
+
+    def __init__(
+        self,
+        table: Optional[str] = None,
+        db: str = "",
+        ref: Optional[str] = None,
+        order_column: Optional[str] = None,
+        descending: bool = False,
+    ) -> None:
+        self.table = table
+        self.db = db
+        # Name the table is referred to by in the query (alias or name)
+        self.ref = ref
+        self.order_column = order_column
+        self.descending = descending
+
+
+def inject_limit(expression: exp.Expression, row_limit: int):
+    """
+    AST pass adding `LIMIT row_limit` to a query that has none.
+    """
+    if isinstance(expression, exp.Query) and not expression.args.get("limit"):
+        return expression.limit(row_limit)
+    return expression
+
+
+def limit_sql(sql: str, row_limit: int) -> str:
+    """
+    `sql` with `LIMIT row_limit` added when it has no LIMIT.
+    """
+    expression = sqlglot.parse_one(sql, read="mysql")
+    return inject_limit(expression, row_limit).sql(dialect="mysql")
+
+
+@lru_cache(maxsize=Config.SQL_PREPARE_CACHE_SIZE)
+def page_plan(sql: str) -> Optional[PagePlan]:
+    """
+    Paging plan for a prepared (MySQL) query, or None when the query is
+    left as is: not a query, or already carrying its own LIMIT.
+    """
+    expression = sqlglot.parse_one(sql, read="mysql")
+    if not isinstance(expression, exp.Query) or expression.args.get("limit"):
+        return None
+    if not isinstance(expression, exp.Select) or any(
+        expression.args.get(arg) for arg in NON_KEYSET_ARGS
+    ):
+        return PagePlan()
+    if any(
+        projection.find(exp.AggFunc, exp.Window)
+        for projection in expression.expressions
+    ):
+        return PagePlan()
+
+    source = expression.args.get("from")
+    table = source.this if source else None
+    if not isinstance(table, exp.Table) or not table.name:
+        return PagePlan()
+
+    order = expression.args.get("order")
+    ordered = order.expressions if order else []
+    if len(ordered) > 1:
+        return PagePlan()
+    order_column = None
+    descending = False
+    if ordered:
+        key = ordered[0].this
+        if not isinstance(key, exp.Column) or key.table not in (
+            "",
+            table.alias_or_name,
+        ):
+            return PagePlan()
+        order_column = key.name
+        descending = bool(ordered[0].args.get("desc"))
+
+    return PagePlan(
+        table=table.name,
+        db=table.db,
+        ref=table.alias_or_name,
+        order_column=order_column,
+        descending=descending,
+    )
+
+
+def key_literal(value: Any) -> exp.Expression:
+    """
+    SQL literal for a page key as the driver returned it. TIME columns
+    arrive as timedelta (or time), which sqlglot cannot convert.
+    """
+    if isinstance(value, datetime.timedelta):
+        micros = abs(value) // datetime.timedelta(microseconds=1)
+        seconds, micros = divmod(micros, 1_000_000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        sign = "-" if value < datetime.timedelta(0) else ""
+        return exp.Literal.string(
+            f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}.{micros:06d}"
+        )
+    if isinstance(value, datetime.time):
+        return exp.Literal.string(value.isoformat())
+    return exp.convert(value)
+
+
+def keyset_sql(
+    sql: str,
+    ref: str,
+    column: str,
+    descending: bool,
+    after: Any,
+    row_limit: int,
+) -> str:
+    """
+    One keyset page of `sql`: rows past `after` on `ref.column` in the
+    page order, with the key projected as PAGE_KEY.
+    """
+    expression = sqlglot.parse_one(sql, read="mysql")
+    key = exp.column(column, table=ref, quoted=True)
+    if after is not None:
+        seek = exp.LT if descending else exp.GT
+        expression = expression.where(
+            seek(this=key.copy(), expression=key_literal(after)),
+            copy=False,
+        )
+    # MySQL's own NULL placement, so no NULL-ordering emulation is emitted
+    ordered = exp.Ordered(
+        this=key.copy(), desc=descending, nulls_first=not descending
+    )
+    expression.set("order", exp.Order(expressions=[ordered]))
+    expression = expression.select(
+        exp.alias_(key.copy(), PAGE_KEY), copy=False
+    )
+    return inject_limit(expression, row_limit).sql(dialect="mysql")
+
+
+class SQLPager:
+    """
+    Caps generated SELECTs that have no LIMIT at `page_size` rows and,
+    where the query can seek on a unique non-null key of its table,
+    returns a continuation token for the next page.
+
+    Pages after the first are read with `WHERE key > last_key ORDER BY
+    key LIMIT n`, which the key's index answers directly instead of
+    re-running the query and skipping the rows already sent. Keys come
+    from the live schema catalog; without it, queries are only capped.
+    """
+
+    def __init__(
+        self,
+        sql_executor,
+        schema_catalog=None,
+        page_size: int = Config.SQL_PAGE_SIZE,
+    ) -> None:
+        self.sql_executor = sql_executor
+        self.schema_catalog = schema_catalog
+        self.page_size = page_size
+
+    def _seek_column(
+        self, plan: PagePlan, db_name: Optional[str]
+    ) -> Optional[str]:
+        if self.schema_catalog is None or plan.table is None:
+            return None
+        database = self.schema_catalog.get_database(
+            "sql", plan.db or db_name or ""
+        )
+        if database is None:
+            return None
+        table = next(
+            (
+                info
+                for name, info in database.tables.items()
+                if name.lower() == plan.table.lower()
+            ),
+            None,
+        )
+        if table is None:
+            return None
+
+        keys: List[str] = []
+        for key in (table.primary_key, *table.unique_keys):
+            column = table.columns.get(key[0]) if len(key) == 1 else None
+            if column is not None and not column.nullable:
+                keys.append(column.name)
+        if plan.order_column is None:
+            return keys[0] if keys else None
+        return next(
+            (k for k in keys if k.lower() == plan.order_column.lower()),
+            None,
+        )
+
+    async def first_page(
+        self, query: str, db_name: Optional[str]
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Runs a generated query and returns (result, page). `page` is None
+        when the query was not capped.
+        """
+        prepared = prepare_sql(query)
+        plan = None
+        if prepared is not None and self.page_size > 0:
+            plan = page_plan(prepared.sql)
+        if plan is None:
+            return await self.sql_executor.execute_query(query, db_name), None
+
+        column = self._seek_column(plan, db_name)
+        if column is None:
+            logger.debug("📄 Capping result at %d rows", self.page_size)
+            capped = limit_sql(prepared.sql, self.page_size + 1)
+            rows = await self.sql_executor.execute_query(capped, db_name)
+            if not isinstance(rows, list):
+                return rows, None
+            has_more = len(rows) > self.page_size
+            return rows[: self.page_size], {
+                "mode": "limit",
+                "page_size": self.page_size,
+                "has_more": has_more,
+                "next_token": None,
+            }
+
+        state = {
+            "kind": "sql",
+            "db": db_name,
+            "sql": prepared.sql,
+            "ref": plan.ref,
+            "column": column,
+            "desc": plan.descending,
+            "size": self.page_size,
+        }
+        return await self._fetch(state, None)
+
+    async def next_page(
+        self, state: Dict[str, Any]
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        logger.debug(
+            "📄 Next page after %s = %r", state["column"], state["after"]
+        )
+        return await self._fetch(state, state["after"])
+
+    async def _fetch(
+        self, state: Dict[str, Any], after: Any
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        size = state["size"]
+        sql = keyset_sql(
+            state["sql"],
+            state["ref"],
+            state["column"],
+            state["desc"],
+            after,
+            size + 1,
+        )
+        rows = await self.sql_executor.execute_query(sql, state["db"])
+        if not isinstance(rows, list):
+            return rows, None
+
+        has_more = len(rows) > size
+        rows = rows[:size]
+        next_token = None
+        if has_more:
+            next_token = encode_page_token(
+                {**state, "after": rows[-1][PAGE_KEY]}
+            )
+        # Rows may be shared with the result cache; copy, don't mutate
+        rows = [
+            {k: v for k, v in row.items() if k != PAGE_KEY} for row in rows
+        ]
+        return rows, {
+            "mode": "keyset",
+            "page_size": size,
+            "has_more": has_more,
+            "next_token": next_token,
+        }
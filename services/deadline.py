@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# time.monotonic() by which the current request must be answered. Tasks
+# inherit it from the context they are created in.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """
+    Sets the deadline for work started inside the block. A nested scope
+    can only bring an existing deadline closer, never extend it.
+    """
+    deadline = None if seconds is None else time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """
+    The current deadline as a time.monotonic() value, or None.
+    """
+    return _deadline.get()
+
+
+def set_deadline(deadline: Optional[float]) -> None:
+    """
+    Replaces the deadline outright rather than for a block, for contexts
+    created to run work shared by several requests.
+    """
+    _deadline.set(deadline)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the deadline (0 once it has passed), or None when
+    no deadline is set.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def cap_seconds(limit: float) -> float:
+    """
+    `limit` shortened to the time left, for client-side timeouts.
+    """
+    left = remaining()
+    return limit if left is None else max(min(limit, left), 0.001)
+
+
+def cap_ms(limit_ms: int) -> int:
+    """
+    A server-side time limit in milliseconds (0 meaning none) shortened
+    to the time left. Never returns 0 once a deadline is set, so an
+    expired deadline still yields the smallest limit rather than none.
+    """
+    left = remaining()
+    if left is None:
+        return limit_ms
+    left_ms = max(int(left * 1000), 1)
+    return left_ms if limit_ms <= 0 else min(limit_ms, left_ms)
@@ -0,0 +1,118 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from config.config import Config
+
+ROOT_LOGGER = "nlq"
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Renders a record with the fields passed through `extra`, either as
+    "time LEVEL stage message key=value ..." or as one JSON object.
+    """
+
+    def __init__(self, fmt: str = "text") -> None:
+        super().__init__(datefmt="%Y-%m-%dT%H:%M:%S")
+        self.json = fmt == "json"
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields: Dict[str, Any] = {
+            key: value
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS
+        }
+        stage = record.name.removeprefix(f"{ROOT_LOGGER}.")
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        timestamp = self.formatTime(record, self.datefmt)
+        if self.json:
+            return json.dumps(
+                {
+                    "time": timestamp,
+                    "level": record.levelname,
+                    "stage": stage,
+                    "message": message,
+                    **fields,
+                },
+                default=str,
+                ensure_ascii=False,
+            )
+        extra = "".join(f" {key}={value}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {stage} {message}{extra}"
+
+
+def _stage_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        stage, _, level = item.partition("=")
+        if stage.strip() and level.strip():
+            levels[stage.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> QueueListener:
+    """
+    Sends the "nlq" loggers through a queue to a listener thread, so a
+    request only pays for building the record; formatting and the write
+    to stdout happen off the event loop.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(Config.LOG_LEVEL)
+    root.propagate = False
+    for stage, level in _stage_levels(Config.LOG_STAGE_LEVELS).items():
+        logging.getLogger(f"{ROOT_LOGGER}.{stage}").setLevel(level)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root.handlers = [QueueHandler(records)]
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(Config.LOG_FORMAT))
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+def get_logger(stage: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{stage}")
+
+
+def truncate(text: str, limit: Optional[int] = None) -> str:
+    limit = Config.LOG_PAYLOAD_CHARS if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} chars)"
+
+
+def log_payload(
+    logger: logging.Logger, message: str, payload: Any, **fields: Any
+) -> None:
+    """
+    Logs a large payload at DEBUG, for a sample of calls and truncated.
+    Nothing is rendered when DEBUG is off for the stage or the call is
+    not sampled.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= Config.LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.debug(
+        "%s: %s", message, truncate(str(payload)), extra=fields or None
+    )
+
+
+listener = configure_logging()
@@ -0,0 +1,216 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; from cache hits to slow LLM generations
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# (stage, seconds) spans of the current request, in completion order
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "timings", default=None
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram, one series per label set.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            pairs = [
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.label_names, labels)
+            ]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = ",".join(pairs + [f'le="{_number(bound)}"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+            le = ",".join(pairs + ['le="+Inf"'])
+            lines.append(f"{self.name}_bucket{{{le}}} {count}")
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Histogram] = {}
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(
+                name, documentation, label_names, buckets
+            )
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "nlq_stage_duration_seconds",
+    "Time spent in each stage of answering a question.",
+    ("stage",),
+)
+http_seconds = registry.histogram(
+    "nlq_http_request_duration_seconds",
+    "Gateway request latency.",
+    ("method", "route", "status"),
+)
+ollama_seconds = registry.histogram(
+    "nlq_ollama_duration_seconds",
+    "Durations reported by Ollama per generation "
+    "(load, prompt_eval, eval, total) and the measured first token.",
+    ("phase",),
+)
+ollama_tokens = registry.histogram(
+    "nlq_ollama_tokens",
+    "Tokens per generation: prompt tokens evaluated and tokens generated.",
+    ("kind",),
+    TOKEN_BUCKETS,
+)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times the block into the stage histogram and, inside a request,
+    into that request's Server-Timing entries. Failed blocks count too.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+@contextmanager
+def collect_timings(
+    timings: Optional[List[Tuple[str, float]]] = None,
+) -> Iterator[List[Tuple[str, float]]]:
+    """
+    Collects the spans of work started inside the block, including in
+    tasks it creates, into `timings` or a new list.
+    """
+    if timings is None:
+        timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def extend_timings(timings: List[Tuple[str, float]]) -> None:
+    """
+    Adds spans measured in another context (work shared by several
+    requests) to the current request's Server-Timing entries. They were
+    observed into the histogram when measured and are not counted again.
+    """
+    current = _timings.get()
+    if current is not None and current is not timings:
+        current.extend(timings)
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    A Server-Timing header value. Repeated stages (batch items, pages)
+    are summed.
+    """
+    totals: Dict[str, float] = {}
+    for stage, elapsed in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(
+        f"{stage};dur={elapsed * 1000:.2f}"
+        for stage, elapsed in totals.items()
+    )
+
+
+def observe_ollama(timings: Dict[str, float]) -> None:
+    """
+    Records one generation's figures as returned by `extract_timings`.
+    """
+    for phase in ("load", "prompt_eval", "eval", "total", "first_token"):
+        if f"{phase}_ms" in timings:
+            ollama_seconds.observe(timings[f"{phase}_ms"] / 1000, phase)
+    if "prompt_eval_count" in timings:
+        ollama_tokens.observe(timings["prompt_eval_count"], "prompt")
+    if "eval_count" in timings:
+        ollama_tokens.observe(timings["eval_count"], "generated")
@@ -0,0 +1,37 @@
+import os
+import pytest
+
+# config.config reads the connection settings at import time; the tests
+# never connect, they only need the module to load
+for name, value in {
+    "MYSQL_HOST": "127.0.0.1",
+    "MYSQL_PORT": "3306",
+    "MYSQL_USER": "root",
+    "MYSQL_PASSWORD": "",
+    "MONGO_HOST": "127.0.0.1",
+    "MONGO_PORT": "27017",
+    "LLAMA_MODEL_NAME": "llama3",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """
+    Factory for an httpx client talking to the gateway app in process.
+    Lifespan events do not run, so no database or Ollama is contacted;
+    tests replace the generator and executors they need. The cost guard
+    is off, since it would explain queries against a real server.
+    """
+    import httpx
+    from api_gateway.main import app
+    from services.db_service.main import query_service
+
+    monkeypatch.setattr(query_service, "cost_guard", None)
+
+    def client():
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        )
+
+    return client
@@ -0,0 +1,97 @@
+import asyncio
+from config.config import Config
+from services.db_service import main
+
+
+def fake_backends(monkeypatch, generated, executed):
+    async def generate_query(nl_query):
+        generated.append(nl_query)
+        await asyncio.sleep(0.01)
+        if "broken" in nl_query:
+            raise RuntimeError("model unavailable")
+        if "delete" in nl_query.lower():
+            return "sql", "imdb_ijs", "DELETE FROM movies WHERE id = 1"
+        return "sql", "imdb_ijs", "SELECT COUNT(*) AS n FROM movies"
+
+    async def execute_query(query, db_name=None):
+        executed.append(query)
+        if query.startswith("DELETE"):
+            return {"status": "success"}
+        return [{"n": 3}]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "execute_query", execute_query)
+
+
+def post_batch(gateway, nl_queries):
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/batch", json={"nl_queries": nl_queries}
+            )
+
+    return asyncio.run(run())
+
+
+def test_batch_answers_every_item_in_order(gateway, monkeypatch):
+    generated, executed = [], []
+    fake_backends(monkeypatch, generated, executed)
+    questions = [
+        "How many movies in imdb_ijs?",
+        "how many movies in IMDB_IJS",
+        "Delete movie 1 in imdb_ijs",
+        "Delete movie 1 in imdb_ijs",
+    ]
+    response = post_batch(gateway, questions)
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["nl_query"] for item in body["results"]] == questions
+    results = [item["query_result"] for item in body["results"]]
+    assert [r["status"] for r in results] == ["success"] * 4
+    assert results[0]["result"] == results[1]["result"] == [{"n": 3}]
+    # The rephrased read runs once; each write runs every time
+    assert body["unique_questions"] == 3
+    assert len(generated) == 3
+    assert executed.count("DELETE FROM movies WHERE id = 1") == 2
+
+
+def test_a_failed_item_does_not_fail_the_batch(gateway, monkeypatch):
+    fake_backends(monkeypatch, [], [])
+    response = post_batch(
+        gateway, ["How many movies in imdb_ijs?", "broken question"]
+    )
+    ok, failed = (item["query_result"] for item in response.json()["results"])
+    assert ok["status"] == "success"
+    assert failed == {
+        "status": "error",
+        "query": None,
+        "result": {"error": "model unavailable"},
+    }
+
+
+def test_generation_concurrency_is_bounded(gateway, monkeypatch):
+    monkeypatch.setattr(Config, "BATCH_LLM_CONCURRENCY", 2)
+    active = peak = 0
+
+    async def generate_query(nl_query):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "sql", "imdb_ijs", "SELECT 1"
+
+    async def execute_query(query, db_name=None):
+        return [{"1": 1}]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "execute_query", execute_query)
+    questions = [f"question {i} in imdb_ijs" for i in range(6)]
+    assert post_batch(gateway, questions).status_code == 200
+    assert peak == 2
+
+
+def test_oversized_batches_are_rejected(gateway, monkeypatch):
+    monkeypatch.setattr(Config, "BATCH_MAX_ITEMS", 2)
+    response = post_batch(gateway, ["a", "b", "c"])
+    assert response.status_code == 400
@@ -0,0 +1,127 @@
+import asyncio
+from services.db_service.cost_guard import CostGuard
+from services.db_service.mongo_executor import MongoExecutor
+
+COLLECTION_SIZE = 5_000_000
+
+
+class FakeCollection:
+    async def estimated_document_count(self):
+        return COLLECTION_SIZE
+
+    async def index_information(self):
+        return {"_id_": {"key": [("_id", 1)]}}
+
+
+class FakeMongo:
+    def __init__(self, explain):
+        self._explain = explain
+        self.client = {"imdb": FakeDatabase()}
+
+    async def explain(self, query, db_name):
+        return self._explain
+
+
+class FakeDatabase:
+    def __getitem__(self, name):
+        return FakeCollection()
+
+
+def check(query, explain, **limits):
+    guard = CostGuard(None, FakeMongo(explain), **limits)
+    return asyncio.run(guard.check("mongo", query, "imdb"))
+
+
+def planner(winning, rejected=()):
+    return {
+        "queryPlanner": {
+            "winningPlan": winning,
+            "rejectedPlans": list(rejected),
+        }
+    }
+
+
+def test_filtered_find_is_estimated_from_the_plan():
+    explain = planner({"stage": "COLLSCAN", "filter": {"year": {"$eq": 1}}})
+    verdict = check('db.movies.find({"year": 1})', explain, max_rows=1000)
+    assert verdict.action == "allowed" and verdict.rows is None
+    assert verdict.cost == COLLECTION_SIZE
+    indexed = planner({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}})
+    verdict = check('db.movies.find({"id": 1})', indexed, max_rows=1000)
+    assert (verdict.action, verdict.rows, verdict.cost) == ("allowed", None, 0)
+
+
+def test_unfiltered_find_returns_every_document():
+    verdict = check(
+        "db.movies.find()", planner({"stage": "COLLSCAN"}), max_rows=1000
+    )
+    assert verdict.rows == COLLECTION_SIZE and verdict.action == "limited"
+
+
+def test_find_is_explained_without_running_it():
+    commands = []
+
+    class Database:
+        async def command(self, name, spec, verbosity):
+            commands.append((name, spec, verbosity))
+            return {}
+
+    executor = MongoExecutor.__new__(MongoExecutor)
+    executor.client = {"imdb": Database()}
+    asyncio.run(
+        executor.explain(
+            'db.movies.find({"year": 1999}, {"name": 1})'
+            '.sort("rank", -1).skip(5).limit(10).count()',
+            "imdb",
+        )
+    )
+    assert commands == [
+        (
+            "explain",
+            {
+                "find": "movies",
+                "filter": {"year": 1999},
+                "projection": {"name": 1},
+                "sort": {"rank": -1},
+                "skip": 5,
+                "limit": 10,
+            },
+            "queryPlanner",
+        )
+    ]
+
+
+def test_index_scan_skips_the_row_check():
+    explain = planner(
+        {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        rejected=[{"stage": "COLLSCAN"}],
+    )
+    verdict = check(
+        'db.movies.aggregate([{"$match": {"year": 1999}}])',
+        explain,
+        max_rows=1000,
+    )
+    assert verdict.action == "allowed"
+    assert verdict.rows is None and verdict.full_scans == []
+
+
+def test_filtered_collection_scan_is_held_to_max_cost_only():
+    explain = planner({"stage": "COLLSCAN", "filter": {"year": {"$eq": 1999}}})
+    query = 'db.movies.aggregate([{"$match": {"year": 1999}}])'
+    verdict = check(query, explain, max_rows=1000)
+    assert verdict.action == "allowed" and verdict.rows is None
+    assert verdict.cost == COLLECTION_SIZE
+    assert check(query, explain, max_cost=1000).action == "rejected"
+
+
+def test_unfiltered_collection_scan_returns_every_document():
+    explain = planner({"stage": "COLLSCAN"})
+    verdict = check(
+        'db.movies.aggregate([{"$project": {"name": 1}}])',
+        explain,
+        max_rows=1000,
+        action="limit",
+        limit=50,
+    )
+    assert verdict.rows == COLLECTION_SIZE
+    assert (verdict.action, verdict.limit) == ("limited", 50)
@@ -0,0 +1,135 @@
+import json
+import asyncio
+from types import SimpleNamespace
+from config.config import Config
+from services import deadline
+from services.db_service import main
+from services.db_service.sql_executor import MySQLExecutor
+
+
+def test_nested_scopes_only_bring_the_deadline_closer():
+    with deadline.deadline_scope(10):
+        outer = deadline.current_deadline()
+        with deadline.deadline_scope(60):
+            assert deadline.current_deadline() == outer
+        with deadline.deadline_scope(None):
+            assert deadline.current_deadline() == outer
+        with deadline.deadline_scope(1):
+            assert deadline.current_deadline() < outer
+    assert deadline.current_deadline() is None
+
+
+def test_limits_are_capped_to_the_time_left():
+    assert deadline.remaining() is None
+    assert deadline.cap_ms(30_000) == 30_000
+    with deadline.deadline_scope(2):
+        assert 1_900 <= deadline.cap_ms(30_000) <= 2_000
+        # 0 means no server-side limit, which the deadline replaces
+        assert 1_900 <= deadline.cap_ms(0) <= 2_000
+        assert deadline.cap_ms(500) == 500
+        assert deadline.cap_seconds(60) <= 2
+    with deadline.deadline_scope(-1):
+        assert deadline.remaining() == 0
+        assert deadline.cap_ms(30_000) == 1
+
+
+def test_sql_hint_is_shortened_to_the_time_left(monkeypatch):
+    monkeypatch.setattr(Config, "SQL_MAX_EXECUTION_MS", 30_000)
+    prepared = SimpleNamespace(
+        is_query=True,
+        sql="SELECT /*+ MAX_EXECUTION_TIME(30000) */ id FROM movies",
+    )
+    executor = MySQLExecutor()
+    assert executor._timed_sql(prepared) == prepared.sql
+    with deadline.deadline_scope(0.5):
+        timed = executor._timed_sql(prepared)
+    hint = int(timed.split("MAX_EXECUTION_TIME(")[1].split(")")[0])
+    assert 0 < hint <= 500
+
+
+def slow_generator(monkeypatch, seen):
+    async def generate_query(nl_query):
+        seen["remaining"] = deadline.remaining()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            seen["cancelled"] = True
+            raise
+        return "sql", "imdb_ijs", "SELECT 1"
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+
+
+def test_slow_request_is_cancelled_with_a_504(gateway, monkeypatch):
+    seen = {}
+    slow_generator(monkeypatch, seen)
+
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/",
+                json={"nl_query": "movies in imdb_ijs", "timeout": 0.05},
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 504
+    assert "0.05 seconds" in response.json()["detail"]
+    # The work saw the client's deadline and was cancelled when it passed
+    assert 0 < seen["remaining"] <= 0.05
+    assert seen["cancelled"]
+
+
+def test_client_cannot_extend_the_request_timeout(gateway, monkeypatch):
+    monkeypatch.setattr(Config, "REQUEST_TIMEOUT", 0.05)
+    slow_generator(monkeypatch, {})
+
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/",
+                json={"nl_query": "movies in imdb_ijs", "timeout": 60},
+            )
+
+    assert asyncio.run(run()).status_code == 504
+
+
+def test_slow_stream_ends_with_an_error_line(gateway, monkeypatch):
+    async def generate_query(nl_query):
+        return "sql", "imdb_ijs", "SELECT id FROM movies"
+
+    cancelled = []
+
+    async def stream_query(query, db_name=None):
+        yield [{"id": 1}]
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        yield [{"id": 2}]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "stream_query", stream_query)
+
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/",
+                json={
+                    "nl_query": "movie ids in imdb_ijs",
+                    "stream": True,
+                    "timeout": 0.1,
+                },
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    header, row, error = [
+        json.loads(line) for line in response.text.splitlines()
+    ]
+    assert header["status"] == "success" and row == {"id": 1}
+    assert error == {
+        "status": "error",
+        "error": "Request did not complete within 0.1 seconds.",
+    }
+    assert cancelled
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from services.chatbot_service.generation_cache import (
+    GenerationCache,
+    normalize_question,
+)
+
+
+def key(cache, question="How many movies?", schema="movies(id, name)"):
+    return cache.make_key(
+        question, "IMDB", "sql", "query", "llama3", schema, "rules"
+    )
+
+
+def test_memory_eviction_falls_back_to_disk(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache.db"), max_entries=2)
+
+    async def main():
+        for i in range(3):
+            await cache.set(f"k{i}", f"SELECT {i}")
+        assert cache.get_stats()["memory_entries"] == 2
+        # The oldest entry left the LRU but is still on disk
+        assert await cache.get("k0") == "SELECT 0"
+        stats = cache.get_stats()
+        assert stats["disk_hits"] == 1 and stats["memory_entries"] == 2
+        assert await cache.get("k0") == "SELECT 0"
+        assert cache.get_stats()["memory_hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache.db"), max_entries=1)
+    threads = []
+    execute = cache._db.execute
+
+    class Connection:
+        def execute(self, *args):
+            threads.append(threading.current_thread())
+            return execute(*args)
+
+        def commit(self):
+            threads.append(threading.current_thread())
+
+    cache._db = Connection()
+
+    async def main():
+        await cache.set("k0", "SELECT 0")
+        await cache.set("k1", "SELECT 1")
+        return await cache.get("k0")
+
+    assert asyncio.run(main()) == "SELECT 0"
+    assert threads and threading.main_thread() not in threads
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = GenerationCache(path)
+    asyncio.run(first.set(key(first), "SELECT COUNT(*) FROM movies"))
+    first.close()
+    second = GenerationCache(path)
+    assert (
+        asyncio.run(second.get(key(second))) == "SELECT COUNT(*) FROM movies"
+    )
+
+
+def test_expired_entries_are_dropped_from_both_tiers(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache.db"), ttl=-1)
+    asyncio.run(cache.set("k", "SELECT 1"))
+    assert asyncio.run(cache.get("k")) is None
+    assert cache.get_stats()["expired"] == 2
+    assert cache.purge_expired() == 0
+
+
+def test_schema_change_misses():
+    cache = GenerationCache(":memory:")
+    asyncio.run(cache.set(key(cache), "SELECT COUNT(*) FROM movies"))
+    assert (
+        asyncio.run(cache.get(key(cache, schema="movies(id, title)"))) is None
+    )
+
+
+def test_rephrasings_share_a_key():
+    cache = GenerationCache(":memory:")
+    assert key(cache, "How many  movies?") == key(cache, "how many movies")
+    assert normalize_question("  Top 5 films!? ") == "top 5 films"
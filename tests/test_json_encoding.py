@@ -0,0 +1,63 @@
+import json
+import datetime
+from decimal import Decimal
+from bson import Binary, Decimal128, Int64, ObjectId, json_util
+from bson.regex import Regex
+from services.db_service.json_encoding import (
+    bson_to_jsonable,
+    json_bytes,
+    ndjson_line,
+)
+
+DOCUMENT = {
+    "_id": ObjectId("5f43a1b2c3d4e5f601234567"),
+    "name": "Heat",
+    "year": 1995,
+    "votes": Int64(2**40),
+    "rank": 8.3,
+    "budget": Decimal128("60000000.50"),
+    "released": datetime.datetime(1995, 12, 15, tzinfo=datetime.timezone.utc),
+    "genres": ["Crime", {"sub": ObjectId("5f43a1b2c3d4e5f601234568")}],
+    "pattern": Regex("^He", "i"),
+    "poster": Binary(b"\x89PNG"),
+    "missing": None,
+    "seen": True,
+}
+
+
+def test_matches_the_json_util_round_trip():
+    expected = json.loads(json_util.dumps(DOCUMENT))
+    assert bson_to_jsonable(DOCUMENT) == expected
+    assert bson_to_jsonable([DOCUMENT, DOCUMENT]) == [expected, expected]
+
+
+def test_output_is_json_native():
+    converted = bson_to_jsonable(DOCUMENT)
+    assert type(converted["votes"]) is int
+    assert converted["_id"] == {"$oid": "5f43a1b2c3d4e5f601234567"}
+    assert json.loads(json.dumps(converted)) == converted
+
+
+def test_plain_values_pass_through_unchanged():
+    rows = [{"id": 1, "name": "Heat", "tags": ["a", "b"]}]
+    assert bson_to_jsonable(rows) == rows
+    assert bson_to_jsonable("text") == "text"
+
+
+def test_json_bytes_encodes_driver_types_compactly():
+    row = {
+        "price": Decimal("9.99"),
+        "day": datetime.date(2024, 2, 29),
+        "at": datetime.datetime(2024, 2, 29, 8, 30),
+        "length": datetime.timedelta(minutes=90),
+        "raw": b"abc",
+    }
+    assert json.loads(json_bytes(row)) == {
+        "price": 9.99,
+        "day": "2024-02-29",
+        "at": "2024-02-29T08:30:00",
+        "length": 5400.0,
+        "raw": "abc",
+    }
+    assert b" " not in json_bytes({"a": [1, 2]})
+    assert ndjson_line({"a": 1}) == b'{"a":1}\n'
@@ -0,0 +1,133 @@
+import json
+import asyncio
+import threading
+import httpx
+import pytest
+from services.chatbot_service.llm_replay import (
+    LLMRecording,
+    RecordingOllamaClient,
+    ReplayOllamaClient,
+    create_llm_client,
+    recording_key,
+)
+from services.chatbot_service.ollama_client import OllamaClient
+from services.deadline import deadline_scope
+
+
+def test_recording_reads_and_writes_off_the_event_loop(tmp_path):
+    recording = LLMRecording(str(tmp_path / "calls.db"))
+    threads = []
+    execute = recording._db.execute
+
+    class Connection:
+        def execute(self, *args):
+            threads.append(threading.current_thread())
+            return execute(*args)
+
+        def commit(self):
+            pass
+
+    recording._db = Connection()
+    key = recording_key("generate", "llama3", "How many movies?")
+
+    async def main():
+        await recording.put(key, "generate", {"response": "SELECT 1"}, 12.345)
+        return await recording.get(key)
+
+    assert asyncio.run(main()) == ({"response": "SELECT 1"}, 12.35)
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+
+ANSWER = "SELECT COUNT(*) FROM movies;\nExplanation: counts the movies."
+
+
+def record(path):
+    """
+    Records one generation and one prefix encoding from a fake Ollama.
+    """
+    sent = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        sent.append(payload)
+        if payload["prompt"].endswith("Schema: movies(id)"):
+            return httpx.Response(200, json={"context": [7, 8], "done": True})
+        return httpx.Response(
+            200,
+            json={"response": ANSWER, "done": True, "context": [1, 2, 3]},
+        )
+
+    client = RecordingOllamaClient(
+        "llama3", "http://ollama/api/generate", LLMRecording(path)
+    )
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def main():
+        await client.encode_prefix("Schema: movies(id)")
+        await client.generate("How many movies?")
+        await client.close()
+
+    asyncio.run(main())
+    assert len(sent) == 2 and client.stats["recorded"] == 2
+
+
+def test_recorded_calls_replay_without_ollama(tmp_path):
+    path = str(tmp_path / "calls.db")
+    record(path)
+    recording = LLMRecording(path)
+    assert recording.count() == 2
+    client = ReplayOllamaClient(
+        "llama3", "http://unreachable", recording, latency="0"
+    )
+
+    async def main():
+        context = await client.encode_prefix("Schema: movies(id)")
+        result = await client.generate("How many movies?")
+        cut = await client.generate_until_complete("How many movies?", "sql")
+        return context, result, cut
+
+    context, result, cut = asyncio.run(main())
+    assert context == [7, 8]
+    assert result["response"] == ANSWER
+    # The returned token context is not recorded
+    assert "context" not in result
+    # A replayed stream stops where a live one would have
+    assert cut["early_stop"] == "SELECT COUNT(*) FROM movies;"
+    assert client.stats["replayed"] == 3
+    assert client.client is None
+    recording.close()
+
+
+def test_unrecorded_prompt_raises_lookup_error(tmp_path):
+    client = ReplayOllamaClient(
+        "llama3",
+        "http://unreachable",
+        LLMRecording(str(tmp_path / "calls.db")),
+        latency="0",
+    )
+    with pytest.raises(LookupError):
+        asyncio.run(client.generate("Never asked"))
+    assert client.stats["missing"] == 1
+
+
+def test_recorded_latency_is_bounded_by_the_deadline(tmp_path):
+    recording = LLMRecording(str(tmp_path / "calls.db"))
+    key = recording_key("generate", "llama3", "How many movies?")
+    client = ReplayOllamaClient(
+        "llama3", "http://unreachable", recording, latency="recorded"
+    )
+
+    async def main():
+        await recording.put(key, "generate", {"response": "x"}, 10_000)
+        with deadline_scope(0.05):
+            await client.generate("How many movies?")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(main())
+
+
+def test_backend_selects_the_client():
+    client = create_llm_client("llama3", "http://ollama", "ollama")
+    assert type(client) is OllamaClient
+    with pytest.raises(ValueError):
+        create_llm_client("llama3", "http://ollama", "mock")
@@ -0,0 +1,93 @@
+import json
+import atexit
+import logging
+from logging.handlers import QueueHandler
+from config.config import Config
+from services import log
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def capture(stage, level=logging.DEBUG):
+    logger = log.get_logger(stage)
+    logger.setLevel(level)
+    logger.propagate = False
+    handler = Records()
+    logger.handlers = [handler]
+    return logger, handler.records
+
+
+def make_record(**extra):
+    logger, records = capture("test_format")
+    logger.info("🧠 Generated %s", "SELECT 1", extra=extra)
+    return records[0]
+
+
+def test_text_lines_carry_the_stage_and_extra_fields():
+    line = log.StructuredFormatter().format(make_record(db="imdb", rows=3))
+    _, level, stage, message = line.split(" ", 3)
+    assert (level, stage) == ("INFO", "test_format")
+    assert message == "🧠 Generated SELECT 1 db=imdb rows=3"
+
+
+def test_json_lines_are_one_object_per_record():
+    line = log.StructuredFormatter("json").format(make_record(rows=3))
+    entry = json.loads(line)
+    assert entry["stage"] == "test_format"
+    assert entry["message"] == "🧠 Generated SELECT 1"
+    assert entry["rows"] == 3 and entry["level"] == "INFO"
+
+
+def test_stage_levels_are_parsed_leniently():
+    assert log._stage_levels(" llm=debug, cache = warning ,bad,=INFO,") == {
+        "llm": "DEBUG",
+        "cache": "WARNING",
+    }
+
+
+def test_configure_sets_stage_levels_behind_a_queue(monkeypatch):
+    monkeypatch.setattr(Config, "LOG_STAGE_LEVELS", "test_levels=ERROR")
+    root = logging.getLogger(log.ROOT_LOGGER)
+    handlers = root.handlers
+    listener = log.configure_logging()
+    try:
+        assert log.get_logger("test_levels").level == logging.ERROR
+        assert [type(h) for h in root.handlers] == [QueueHandler]
+    finally:
+        listener.stop()
+        atexit.unregister(listener.stop)
+        root.handlers = handlers
+
+
+def test_payloads_are_truncated(monkeypatch):
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_CHARS", 5)
+    logger, records = capture("test_payload")
+    log.log_payload(logger, "📥 Raw response", "SELECT 1;", db="imdb")
+    (record,) = records
+    assert record.getMessage() == "📥 Raw response: SELEC… (+4 chars)"
+    assert record.db == "imdb"
+
+
+def test_payloads_are_skipped_unless_debug_and_sampled(monkeypatch):
+    class Payload:
+        rendered = 0
+
+        def __str__(self):
+            Payload.rendered += 1
+            return "payload"
+
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    logger, records = capture("test_sampling", logging.INFO)
+    log.log_payload(logger, "📥 Raw response", Payload())
+    logger.setLevel(logging.DEBUG)
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 0.0)
+    log.log_payload(logger, "📥 Raw response", Payload())
+    assert records == [] and Payload.rendered == 0
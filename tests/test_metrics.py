@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from services.db_service import main
+from services.metrics import (
+    Histogram,
+    collect_timings,
+    observe_ollama,
+    ollama_tokens,
+    server_timing,
+    span,
+    stage_seconds,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("t_seconds", "Test.", ("stage",), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, 'a"b')
+    assert histogram.render() == [
+        "# HELP t_seconds Test.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{stage="a\\"b",le="0.1"} 1',
+        't_seconds_bucket{stage="a\\"b",le="1"} 3',
+        't_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        't_seconds_sum{stage="a\\"b"} 4.05',
+        't_seconds_count{stage="a\\"b"} 4',
+    ]
+
+
+def test_failed_spans_are_timed_into_the_request():
+    with collect_timings() as timings:
+        with span("parse"):
+            pass
+        with pytest.raises(ValueError):
+            with span("parse"):
+                raise ValueError("bad query")
+    assert [stage for stage, _ in timings] == ["parse", "parse"]
+    # Outside collect_timings a span only feeds the histogram
+    with span("parse"):
+        pass
+    assert len(timings) == 2
+
+
+def test_server_timing_sums_repeated_stages():
+    header = server_timing([("llm", 0.25), ("execute", 0.01), ("llm", 0.5)])
+    assert header == "llm;dur=750.00, execute;dur=10.00"
+
+
+def test_ollama_figures_are_observed_in_seconds_and_tokens():
+    before = ollama_tokens._series.get(("generated",), [0, 0.0, 0])[2]
+    observe_ollama({"eval_ms": 20.0, "eval_count": 5})
+    assert ollama_tokens._series[("generated",)][2] == before + 1
+
+
+def count_of(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return int(line.split()[-1])
+    return 0
+
+
+def test_metrics_endpoint_exposes_stage_and_request_histograms(
+    gateway, monkeypatch
+):
+    async def generate_query(nl_query):
+        return "sql", "imdb_ijs", "SELECT 1 AS n"
+
+    async def execute_query(query, db_name=None):
+        return [{"n": 1}]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "execute_query", execute_query)
+    translate = 'nlq_stage_duration_seconds_count{stage="translate"}'
+    requests = (
+        "nlq_http_request_duration_seconds_count"
+        '{method="POST",route="/query/",status="200"}'
+    )
+
+    async def run():
+        async with gateway() as client:
+            before = (await client.get("/metrics")).text
+            answer = await client.post(
+                "/query/", json={"nl_query": "a number from imdb_ijs"}
+            )
+            after = await client.get("/metrics")
+        return before, answer, after
+
+    before, answer, after = asyncio.run(run())
+    assert answer.status_code == 200
+    stages = dict(
+        entry.split(";dur=")
+        for entry in answer.headers["server-timing"].split(", ")
+    )
+    assert {"translate", "execute", "serialize", "total"} <= set(stages)
+    assert after.headers["content-type"].startswith(
+        "text/plain; version=0.0.4"
+    )
+    assert "# TYPE nlq_stage_duration_seconds histogram" in after.text
+    assert count_of(after.text, translate) == count_of(before, translate) + 1
+    assert count_of(after.text, requests) == count_of(before, requests) + 1
+    assert stage_seconds._series[("translate",)][2] >= 1
@@ -0,0 +1,172 @@
+import asyncio
+from services.db_service import main
+from services.db_service.cursor_registry import CursorRegistry, OpenCursor
+from services.db_service.mongo_executor import MongoExecutor
+from services.db_service.page_tokens import decode_page_token
+
+
+class FakeCursor:
+    """
+    Serves `documents` in order; once `hold` is set, reads wait on it.
+    """
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.hold = None
+        self.reading = asyncio.Event()
+        self.closed = False
+
+    def max_time_ms(self, ms):
+        return self
+
+    async def to_list(self, length=None):
+        self.reading.set()
+        if self.hold is not None:
+            await self.hold.wait()
+        batch, self.documents = (
+            self.documents[:length],
+            self.documents[length:],
+        )
+        return batch
+
+    async def close(self):
+        self.closed = True
+
+
+def make_executor(cursor):
+    class Collection:
+        def find(self, *args):
+            return cursor
+
+    executor = MongoExecutor()
+    executor.client = {"imdb": {"movies": Collection()}}
+    executor.max_preview_docs = 2
+    return executor
+
+
+def test_pages_read_on_from_the_parked_cursor():
+    cursor = FakeCursor({"_id": i} for i in range(5))
+    executor = make_executor(cursor)
+
+    async def main():
+        rows, page = await executor.execute_page("db.movies.find()", "imdb")
+        pages = [rows]
+        while page["next_token"]:
+            state = decode_page_token(page["next_token"])
+            rows, page = await executor.next_page(state)
+            pages.append(rows)
+        return pages
+
+    pages = asyncio.run(main())
+    assert [[row["_id"] for row in rows] for rows in pages] == [
+        [0, 1],
+        [2, 3],
+        [4],
+    ]
+    assert cursor.closed
+    assert executor.cursors.get_stats()["open"] == 0
+
+
+def test_cancelled_first_page_closes_the_cursor():
+    cursor = FakeCursor([{"_id": 1}])
+    executor = make_executor(cursor)
+
+    async def main():
+        cursor.hold = asyncio.Event()
+        task = asyncio.ensure_future(
+            executor.execute_page("db.movies.find()", "imdb")
+        )
+        await cursor.reading.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return task.cancelled()
+
+    assert asyncio.run(main())
+    assert cursor.closed
+    assert executor.cursors.get_stats()["discarded"] == 1
+
+
+def test_cancelled_next_page_closes_the_taken_cursor():
+    cursor = FakeCursor({"_id": i} for i in range(5))
+    executor = make_executor(cursor)
+
+    async def main():
+        _, page = await executor.execute_page("db.movies.find()", "imdb")
+        cursor.hold = asyncio.Event()
+        cursor.reading.clear()
+        task = asyncio.ensure_future(
+            executor.next_page(decode_page_token(page["next_token"]))
+        )
+        await cursor.reading.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return task.cancelled()
+
+    assert asyncio.run(main())
+    assert cursor.closed
+    stats = executor.cursors.get_stats()
+    assert stats["discarded"] == 1 and stats["open"] == 0
+
+
+def test_a_cursor_id_can_be_taken_once():
+    registry = CursorRegistry()
+
+    async def main():
+        cursor_id = await registry.add(
+            OpenCursor(FakeCursor([]), "imdb", 2, [])
+        )
+        return registry.take(cursor_id), registry.take(cursor_id)
+
+    first, second = asyncio.run(main())
+    assert first is not None and second is None
+
+
+def test_least_recently_parked_cursor_is_evicted():
+    registry = CursorRegistry(max_cursors=2)
+    cursors = [FakeCursor([]) for _ in range(3)]
+
+    async def main():
+        return [
+            await registry.add(OpenCursor(cursor, "imdb", 2, []))
+            for cursor in cursors
+        ]
+
+    ids = asyncio.run(main())
+    assert [cursor.closed for cursor in cursors] == [True, False, False]
+    assert registry.take(ids[0]) is None
+    assert registry.get_stats()["evicted"] == 1
+
+
+def test_idle_cursors_are_swept():
+    registry = CursorRegistry(idle_ttl=-1)
+    cursor = FakeCursor([])
+
+    async def main():
+        await registry.add(OpenCursor(cursor, "imdb", 2, []))
+        return await registry.sweep()
+
+    assert asyncio.run(main()) == 1
+    assert cursor.closed and registry.get_stats()["open"] == 0
+
+
+def test_next_page_with_a_used_token_is_a_bad_request(gateway, monkeypatch):
+    cursor = FakeCursor({"_id": i} for i in range(5))
+    executor = make_executor(cursor)
+    monkeypatch.setattr(main, "mongo_executor", executor)
+
+    async def run():
+        _, page = await executor.execute_page("db.movies.find()", "imdb")
+        token = page["next_token"]
+        async with gateway() as client:
+            first = await client.post("/query/next", json={"token": token})
+            again = await client.post("/query/next", json={"token": token})
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first.status_code == 200
+    assert [row["_id"] for row in first.json()["query_result"]["result"]] == [
+        2,
+        3,
+    ]
+    assert again.status_code == 400
+    assert "already read" in again.json()["detail"]
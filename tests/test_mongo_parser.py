@@ -0,0 +1,106 @@
+import pytest
+from bson import Decimal128, Int64, ObjectId
+from bson.regex import Regex
+from services.db_service.mongo_executor import MongoExecutor
+from services.db_service.mongo_parser import compile_mongo_query
+
+
+def test_find_chain_with_operators():
+    plan = compile_mongo_query(
+        "db.movies.find({year: {$gte: 1990, $lt: 2000}, "
+        "'genre': {$in: ['Drama', \"Comedy\"]}}, {name: 1, _id: 0})"
+        ".sort({rank: -1}).limit(10)"
+    )
+    assert plan.collection == "movies" and plan.db_prefix is None
+    assert plan.ops == [
+        (
+            "find",
+            [
+                {
+                    "year": {"$gte": 1990, "$lt": 2000},
+                    "genre": {"$in": ["Drama", "Comedy"]},
+                },
+                {"name": 1, "_id": 0},
+            ],
+        ),
+        ("sort", [{"rank": -1}]),
+        ("limit", [10]),
+    ]
+    assert plan.is_bounded()
+
+
+def test_aggregate_with_dotted_paths_and_trailing_commas():
+    plan = compile_mongo_query(
+        "db.imdb_ijs.roles.aggregate([\n"
+        "  {$lookup: {from: 'actors', localField: 'actor_id',"
+        " foreignField: 'id', as: 'actor'}},\n"
+        "  {$unwind: '$actor'},\n"
+        "  {$group: {_id: '$actor.id', n: {$sum: 1},},},\n"
+        "])"
+    )
+    assert (plan.db_prefix, plan.collection) == ("imdb_ijs", "roles")
+    assert plan.pipeline[2] == {
+        "$group": {"_id": "$actor.id", "n": {"$sum": 1}}
+    }
+    assert plan.read_collections() == ("roles", "actors")
+    assert not plan.is_bounded()
+
+
+def test_constructors_and_literals():
+    plan = compile_mongo_query(
+        'db.loans.find({date: {$gte: ISODate("1997-01-01T00:00:00Z")}, '
+        "_id: ObjectId('5f43a1b2c3d4e5f601234567'), "
+        "amount: NumberLong(5), rate: NumberDecimal('0.5'), "
+        "n: NumberInt(3), name: /^Ada/i, paid: true, note: null})"
+    )
+    query = plan.ops[0][1][0]
+    # Dates are stored as "YYYY-MM-DD" strings
+    assert query["date"] == {"$gte": "1997-01-01"}
+    assert query["_id"] == ObjectId("5f43a1b2c3d4e5f601234567")
+    assert query["amount"] == Int64(5) and isinstance(query["amount"], Int64)
+    assert query["rate"] == Decimal128("0.5")
+    assert query["n"] == 3
+    assert query["name"] == Regex("^Ada", "i")
+    assert (query["paid"], query["note"]) == (True, None)
+
+
+def test_code_block_and_alternate_targets():
+    plan = compile_mongo_query(
+        "Here is the query:\n```javascript\n"
+        "db.getCollection('movies').countDocuments({})\n```"
+    )
+    assert plan.collection == "movies" and plan.method == "countDocuments"
+    assert compile_mongo_query("db['movies'].find()").collection == "movies"
+    assert compile_mongo_query("show collections").show_collections
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ("SELECT * FROM movies", "No MongoDB query"),
+        ("db.movies.find({year: 1990)", "Expected"),
+        ("db.movies.find({name: 'Ada})", "Unterminated string"),
+        ("db.movies.find({year: Foo(1)})", "Unsupported constructor"),
+        ("db.movies.find({}) extra", "after query"),
+    ],
+)
+def test_malformed_queries_raise(query, message):
+    with pytest.raises(ValueError, match=message):
+        compile_mongo_query(query)
+
+
+def test_generated_values_are_new_on_every_compile():
+    query = "db.t.insertOne({_id: ObjectId(), at: new Date(), x: 1})"
+    first, second = compile_mongo_query(query), compile_mongo_query(query)
+    assert first.volatile and first is not second
+    assert first.ops[0][1][0]["_id"] != second.ops[0][1][0]["_id"]
+    # Fixed values keep sharing one cached plan
+    fixed = "db.t.find({_id: ObjectId('5f43a1b2c3d4e5f601234567')})"
+    assert compile_mongo_query(fixed) is compile_mongo_query(fixed)
+    assert not compile_mongo_query(fixed).volatile
+
+
+def test_volatile_plans_are_not_result_cached():
+    plan = compile_mongo_query("db.t.find({at: {$lt: new Date()}})")
+    assert MongoExecutor._cache_key(plan, "imdb") is None
+    assert plan.with_limit(5).volatile
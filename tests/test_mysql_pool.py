@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from mysql.connector import errors
+from services.db_service.mysql_pool import MySQLPool, MySQLPoolManager
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.pings = 0
+
+    async def ping(self):
+        self.pings += 1
+        if not self.alive:
+            raise errors.InterfaceError("MySQL server has gone away")
+
+    def is_socket_connected(self):
+        return not self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+def make_pool(monkeypatch, **kwargs):
+    opened = []
+
+    async def connect(self):
+        connection = FakeConnection(len(opened))
+        opened.append(connection)
+        return connection
+
+    monkeypatch.setattr(MySQLPool, "_connect", connect)
+    return MySQLPool("imdb", **kwargs), opened
+
+
+def test_connections_are_reused(monkeypatch):
+    pool, opened = make_pool(monkeypatch, size=4)
+
+    async def main():
+        for _ in range(5):
+            async with pool.connection():
+                pass
+
+    asyncio.run(main())
+    assert len(opened) == 1
+
+
+def test_borrowers_beyond_the_pool_size_wait(monkeypatch):
+    pool, opened = make_pool(monkeypatch, size=2)
+    active = peak = 0
+
+    async def borrow():
+        nonlocal active, peak
+        async with pool.connection():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(borrow() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2 and len(opened) == 2
+
+
+def test_dead_idle_connection_is_replaced(monkeypatch):
+    pool, opened = make_pool(monkeypatch, ping_interval=0)
+
+    async def main():
+        async with pool.connection():
+            pass
+        opened[0].alive = False
+        async with pool.connection() as connection:
+            return connection
+
+    assert asyncio.run(main()) is opened[1]
+    assert opened[0].pings == 1 and opened[0].closed
+
+
+@pytest.mark.parametrize(
+    "error, reused",
+    [
+        (errors.ProgrammingError("Unknown column 'x'"), True),
+        (errors.OperationalError("Lost connection"), False),
+        (asyncio.CancelledError(), False),
+    ],
+)
+def test_failed_statements_keep_only_usable_sessions(
+    monkeypatch, error, reused
+):
+    pool, opened = make_pool(monkeypatch)
+
+    async def main():
+        try:
+            async with pool.connection():
+                raise error
+        except BaseException:
+            pass
+        async with pool.connection() as connection:
+            return connection
+
+    assert (asyncio.run(main()) is opened[0]) is reused
+    assert opened[0].closed is not reused
+
+
+def test_one_pool_per_database():
+    pools = MySQLPoolManager()
+    assert pools.get_pool("imdb") is pools.get_pool("imdb")
+    assert pools.get_pool("imdb") is not pools.get_pool("cora")
+    assert pools.get_pool(None).db_name is None
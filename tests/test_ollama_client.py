@@ -0,0 +1,81 @@
+import json
+import asyncio
+import httpx
+from services.chatbot_service.ollama_client import (
+    OllamaClient,
+    extract_timings,
+)
+
+
+def make_client(load_ns=0, **kwargs):
+    requests = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        requests.append(payload)
+        return httpx.Response(
+            200,
+            json={
+                "response": "SELECT 1;",
+                "done": True,
+                "load_duration": load_ns,
+                "prompt_eval_duration": 40_000_000,
+                "eval_duration": 10_000_000,
+                "prompt_eval_count": 120,
+                "eval_count": 4,
+            },
+        )
+
+    client = OllamaClient(
+        "llama3", "http://ollama/api/generate", keep_alive="1h", **kwargs
+    )
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, requests
+
+
+def test_requests_share_one_http_client_and_keep_the_model_loaded():
+    client, requests = make_client()
+    http_client = client.client
+
+    async def main():
+        first = await client.generate("How many movies?")
+        await client.generate("How many actors?")
+        assert client._get_client() is http_client
+        await client.close()
+        return first
+
+    result = asyncio.run(main())
+    assert [r["keep_alive"] for r in requests] == ["1h", "1h"]
+    assert result["timings"]["prompt_eval_ms"] == 40.0
+    stats = client.get_stats()
+    assert stats["requests"] == 2 and stats["cold_loads"] == 0
+    assert stats["avg_prompt_eval_ms"] == 40.0
+    assert client.client is None
+
+
+def test_slow_model_loads_count_as_cold():
+    client, _ = make_client(load_ns=2_500_000_000)
+    asyncio.run(client.generate("How many movies?"))
+    assert client.get_stats()["cold_loads"] == 1
+
+
+def test_idle_model_is_warmed_again():
+    client, requests = make_client(warmup_interval=0.05)
+
+    async def main():
+        client.start()
+        await asyncio.sleep(0.13)
+        await client.close()
+
+    asyncio.run(main())
+    # At startup, then once per idle interval
+    assert client.stats["warmups"] >= 2
+    assert all(r["prompt"] == "" for r in requests)
+    assert client.stats["requests"] == 0
+
+
+def test_timings_are_converted_to_milliseconds():
+    timings = extract_timings(
+        {"total_duration": 1_500_000, "eval_count": 3, "other": 1}
+    )
+    assert timings == {"total_ms": 1.5, "eval_count": 3}
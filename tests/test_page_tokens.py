@@ -0,0 +1,78 @@
+import json
+import time
+import base64
+import datetime
+import pytest
+from decimal import Decimal
+from config.config import Config
+from services.db_service.page_tokens import (
+    decode_page_token,
+    encode_page_token,
+)
+
+STATE = {"kind": "sql", "sql": "SELECT id FROM movies", "after": 42}
+
+
+def reencode(token, **changes):
+    body, signature = token.split(".")
+    payload = json.loads(base64.urlsafe_b64decode(body + "=" * 4))
+    payload.update(changes)
+    body = base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8"))
+    return f"{body.decode('ascii').rstrip('=')}.{signature}"
+
+
+def test_round_trip():
+    state = decode_page_token(encode_page_token(STATE))
+    assert {k: v for k, v in state.items() if k != "issued"} == STATE
+
+
+def test_altered_state_is_rejected():
+    token = encode_page_token(STATE)
+    with pytest.raises(ValueError, match="Invalid page token"):
+        decode_page_token(reencode(token, sql="DELETE FROM movies"))
+
+
+def test_altered_signature_is_rejected():
+    body, signature = encode_page_token(STATE).split(".")
+    forged = ("A" if signature[0] != "A" else "B") + signature[1:]
+    with pytest.raises(ValueError, match="Invalid page token"):
+        decode_page_token(f"{body}.{forged}")
+
+
+def test_non_ascii_signature_is_rejected():
+    body, signature = encode_page_token(STATE).split(".")
+    with pytest.raises(ValueError, match="Invalid page token"):
+        decode_page_token(f"{body}.é{signature[1:]}")
+
+
+@pytest.mark.parametrize(
+    "after",
+    [
+        Decimal("19.990000000000000001"),
+        datetime.date(1999, 12, 31),
+        datetime.datetime(1999, 12, 31, 23, 59, 59, 999999),
+        datetime.time(8, 30),
+        datetime.timedelta(hours=-1, microseconds=5),
+        b"\x00\xff",
+    ],
+)
+def test_keys_keep_their_exact_type(after):
+    state = decode_page_token(encode_page_token({**STATE, "after": after}))
+    assert state["after"] == after
+    assert type(state["after"]) is type(after)
+
+
+@pytest.mark.parametrize("token", ["", "no-signature", "a.b.c", "!!.x"])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(ValueError):
+        decode_page_token(token)
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    token = encode_page_token(STATE)
+    issued = time.time()
+    monkeypatch.setattr(
+        time, "time", lambda: issued + Config.PAGE_TOKEN_TTL + 1
+    )
+    with pytest.raises(ValueError, match="expired"):
+        decode_page_token(token)
@@ -0,0 +1,119 @@
+import asyncio
+from config.config import Config
+from services.chatbot_service.main import QueryGenerator
+
+
+class SchemaLoader:
+    def __init__(self):
+        self.version = 1
+
+    def get_schema(self, db_name, table_name=None):
+        return f"{db_name} v{self.version}: movies(id, name)"
+
+
+class Instructions:
+    mongo_instructions = "Use only the fields in the schema."
+
+
+class Generator(QueryGenerator):
+    def __init__(self):
+        super().__init__(SchemaLoader(), SchemaLoader(), Instructions())
+        self.encoded = []
+
+        async def encode_prefix(prefix):
+            self.encoded.append(prefix)
+            return [len(self.encoded)]
+
+        self.ollama_client.encode_prefix = encode_prefix
+
+
+def test_schema_change_replaces_the_prefix_and_its_context():
+    generator = Generator()
+
+    async def main():
+        first = generator.build_prompt_prefix("sql", "IMDB")
+        await generator.prefix_context(first)
+        generator.sql_schema_loader.version = 2
+        second = generator.build_prompt_prefix("sql", "imdb")
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert "v1" in first and "v2" in second
+    assert list(generator.prompt_prefixes) == [("sql", "imdb")]
+    assert first not in generator.prefix_contexts
+
+
+def test_prefixes_and_contexts_are_bounded(monkeypatch):
+    monkeypatch.setattr(Config, "PROMPT_PREFIX_CACHE_SIZE", 2)
+    generator = Generator()
+
+    async def main():
+        for db_name in ("imdb", "cora", "imdb", "world"):
+            prefix = generator.build_prompt_prefix("sql", db_name)
+            await generator.prefix_context(prefix)
+
+    asyncio.run(main())
+    # imdb was used again, so cora is the one evicted
+    assert list(generator.prompt_prefixes) == [
+        ("sql", "imdb"),
+        ("sql", "world"),
+    ]
+    assert len(generator.prefix_contexts) == 2
+    assert len(generator.encoded) == 3
+
+
+def test_reused_context_sees_the_same_template_as_a_whole_prompt():
+    client = Generator().ollama_client
+    prefix, suffix = "Schema:\nmovies(id)\n\n", "Question: count\nSQL:"
+    whole = client._payload(prefix + suffix, False)
+    continued = client._payload(suffix, False, context=[1, 2])
+    assert whole["raw"] and continued["raw"]
+    assert whole["prompt"] == client.prompt_head + prefix + continued["prompt"]
+    assert whole["prompt"].startswith("<|start_header_id|>user")
+    assert whole["prompt"].endswith("assistant<|end_header_id|>\n\n")
+
+
+def generate_all(monkeypatch, questions, reuse):
+    monkeypatch.setattr(Config, "PROMPT_LAYOUT", "prefix_stable")
+    monkeypatch.setattr(Config, "OLLAMA_REUSE_CONTEXT", reuse)
+    monkeypatch.setattr(Config, "OLLAMA_STREAMING", False)
+    generator = Generator()
+    sent = []
+
+    async def generate(prompt, context=None):
+        sent.append((prompt, context))
+        return {"response": "SELECT 1;"}
+
+    generator.ollama_client.generate = generate
+
+    async def main():
+        return [await generator.generate_query(q) for q in questions]
+
+    return generator, sent, asyncio.run(main())
+
+
+QUESTIONS = [
+    "How many movies are in imdb_ijs using sql?",
+    "Delete the movie Heat from imdb_ijs using sql",
+]
+
+
+def test_every_question_shares_the_database_prefix(monkeypatch):
+    generator, sent, results = generate_all(monkeypatch, QUESTIONS, False)
+    assert [query for _, _, query in results] == ["SELECT 1;"] * 2
+    prefix = generator.build_prompt_prefix("sql", "imdb_ijs")
+    (count, _), (delete, _) = sent
+    assert count.startswith(prefix) and delete.startswith(prefix)
+    # Only the tail differs: the intent's task and the question
+    assert count[len(prefix) :].startswith("Task: Convert the following")
+    assert "SQL DELETE" in delete[len(prefix) :]
+    assert delete.endswith("Instruction: " + QUESTIONS[1] + "\nSQL:")
+
+
+def test_reused_context_sends_only_the_suffix(monkeypatch):
+    generator, sent, _ = generate_all(monkeypatch, QUESTIONS, True)
+    prefix = generator.build_prompt_prefix("sql", "imdb_ijs")
+    assert generator.encoded == [prefix]
+    assert [context for _, context in sent] == [[1], [1]]
+    assert all(not prompt.startswith(prefix) for prompt, _ in sent)
+    assert sent[0][0].startswith("Task: ")
@@ -0,0 +1,71 @@
+import time
+import asyncio
+from services.db_service import main
+
+SLEEP = 0.2
+
+
+def fake_backends(monkeypatch, calls):
+    async def generate_query(nl_query):
+        calls.append(nl_query)
+        await asyncio.sleep(SLEEP)
+        year = nl_query.split()[2]
+        return (
+            "sql",
+            "imdb_ijs",
+            f"SELECT name FROM movies WHERE year = {year}",
+        )
+
+    async def execute_query(query, db_name=None):
+        await asyncio.sleep(SLEEP)
+        return [{"name": "Heat", "query": query}]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "execute_query", execute_query)
+
+
+def question(year):
+    return f"movies from {year} in imdb_ijs using sql"
+
+
+def test_query_returns_the_generated_query_and_rows(gateway, monkeypatch):
+    fake_backends(monkeypatch, [])
+
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/", json={"nl_query": question(1995)}
+            )
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    result = response.json()["query_result"]
+    assert result["status"] == "success"
+    assert result["query"] == "SELECT name FROM movies WHERE year = 1995"
+    assert result["result"][0]["name"] == "Heat"
+    assert "translate" in response.headers["server-timing"]
+
+
+def test_concurrent_queries_wait_on_the_llm_and_db_together(
+    gateway, monkeypatch
+):
+    calls = []
+    fake_backends(monkeypatch, calls)
+
+    async def run():
+        async with gateway() as client:
+            return await asyncio.gather(
+                *(
+                    client.post("/query/", json={"nl_query": question(year)})
+                    for year in range(1990, 1998)
+                )
+            )
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    assert [r.status_code for r in responses] == [200] * 8
+    assert len(calls) == 8
+    # One generation plus one query each, all overlapping: a blocking
+    # step anywhere on the path would serialize them (8 * 0.4s)
+    assert elapsed < 4 * SLEEP
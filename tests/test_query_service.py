@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from services.db_service import main
+from services.db_service.main import QueryService
+
+QUESTION = "list every movie in imdb_ijs using mongo"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    calls = {"generate": 0, "execute": 0}
+
+    async def generate_query(nl_query):
+        calls["generate"] += 1
+        # Long enough for every concurrent caller to join the flight
+        await asyncio.sleep(0.05)
+        return "mongo", "imdb_ijs", "db.movies.find()"
+
+    async def execute_page(query, db_name, limit=None):
+        calls["execute"] += 1
+        token = f"cursor-{calls['execute']}"
+        return [{"name": "Heat"}], {
+            "mode": "cursor",
+            "page_size": 1,
+            "has_more": True,
+            "next_token": token,
+        }
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.mongo_executor, "execute_page", execute_page)
+    query_service = QueryService()
+    query_service.cost_guard = None
+    query_service.calls = calls
+    return query_service
+
+
+def test_coalesced_callers_get_their_own_mongo_cursor(service):
+    async def main():
+        return await asyncio.gather(
+            *(service.process_query(QUESTION) for _ in range(3))
+        )
+
+    responses = asyncio.run(main())
+    tokens = {response["page"]["next_token"] for response in responses}
+    assert len(tokens) == 3
+    # The question is translated once; only execution is repeated
+    assert service.calls == {"generate": 1, "execute": 3}
+    assert {response["query"] for response in responses} == {
+        "db.movies.find()"
+    }
+
+
+def test_duplicate_batch_items_get_their_own_mongo_cursor(service):
+    batch = asyncio.run(service.process_batch([QUESTION, QUESTION.upper()]))
+    assert batch["unique_questions"] == 1
+    first, second = (item["query_result"] for item in batch["results"])
+    assert first["page"]["next_token"] != second["page"]["next_token"]
+    assert service.calls == {"generate": 1, "execute": 2}
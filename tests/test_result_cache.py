@@ -0,0 +1,165 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from services.db_service import sql_executor
+from services.db_service import result_cache
+from services.db_service.result_cache import ResultCache, result_size
+from services.db_service.sql_executor import MySQLExecutor
+
+MOVIES = frozenset({("sql", "imdb", "movies")})
+
+
+class SlowReadConnection:
+    """
+    Holds every SELECT until `release` is set, so a write can run while
+    the read is in flight.
+    """
+
+    def __init__(self):
+        self.reading = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def cursor(self, **kwargs):
+        connection = self
+
+        class Cursor:
+            async def execute(self, sql):
+                if sql.startswith("SELECT"):
+                    connection.reading.set()
+                    await connection.release.wait()
+
+            async def fetchall(self):
+                return [{"id": 1, "year": 1999}]
+
+            async def close(self):
+                pass
+
+        return Cursor()
+
+    async def commit(self):
+        pass
+
+
+class FakePools:
+    def __init__(self):
+        self.connection = SlowReadConnection()
+
+    def get_pool(self, db_name):
+        connection = self.connection
+
+        class Pool:
+            @asynccontextmanager
+            async def connection(self):
+                yield connection
+
+        return Pool()
+
+
+def test_read_overlapping_a_write_is_not_cached(monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr(sql_executor, "result_cache", cache)
+    executor = MySQLExecutor()
+    executor.pools = FakePools()
+    connection = executor.pools.connection
+
+    async def main():
+        read = asyncio.ensure_future(
+            executor.execute_query("SELECT id, year FROM movies", "imdb")
+        )
+        await connection.reading.wait()
+        await executor.execute_query(
+            "UPDATE movies SET year = 2000 WHERE id = 1", "imdb"
+        )
+        connection.release.set()
+        return await read
+
+    assert asyncio.run(main()) == [{"id": 1, "year": 1999}]
+    stats = cache.get_stats()
+    assert stats["stale"] == 1 and stats["entries"] == 0
+
+
+def test_set_keeps_a_result_with_an_unchanged_generation():
+    cache = ResultCache()
+    generation = cache.generation(MOVIES)
+    cache.invalidate("sql", "imdb", frozenset({"actors"}))
+    cache.set(("sql", "imdb", "q"), [1], MOVIES, generation)
+    assert cache.get(("sql", "imdb", "q")) == [1]
+
+
+def test_whole_database_invalidation_makes_reads_stale():
+    cache = ResultCache()
+    generation = cache.generation(MOVIES)
+    cache.invalidate("sql", "IMDB")
+    cache.set(("sql", "imdb", "q"), [1], MOVIES, generation)
+    assert cache.get(("sql", "imdb", "q")) is None
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    # Each ["xxxx"] result takes 8 bytes, so ten fill the cache
+    cache = ResultCache(max_bytes=80)
+    for i in range(10):
+        cache.set(("sql", "imdb", str(i)), [f"{i}" * 4], MOVIES)
+    # 0 is used again, so 1 is the oldest when 10 needs room
+    assert cache.get(("sql", "imdb", "0")) == ["0000"]
+    cache.set(("sql", "imdb", "10"), ["aaaa"], MOVIES)
+    assert cache.get(("sql", "imdb", "1")) is None
+    assert cache.get(("sql", "imdb", "0")) is not None
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 80
+
+
+def test_oversized_results_are_not_stored():
+    cache = ResultCache(max_bytes=80)
+    cache.set(("sql", "imdb", "q"), ["x" * 20], MOVIES)
+    assert cache.get_stats()["too_large"] == 1
+    assert cache.get(("sql", "imdb", "q")) is None
+
+
+def test_result_size_matches_the_encoded_length():
+    rows = [{"id": i, "name": f"movie {i}"} for i in range(600)]
+    for n in (0, 1, 256, 257, 600):
+        encoded = json.dumps(rows[:n], separators=(",", ":"))
+        assert result_size(rows[:n]) == len(encoded)
+
+
+def test_oversized_results_stop_encoding_at_the_limit(monkeypatch):
+    encoded = []
+    json_length = result_cache._json_length
+    monkeypatch.setattr(
+        result_cache,
+        "_json_length",
+        lambda value: encoded.append(len(value)) or json_length(value),
+    )
+    cache = ResultCache(max_bytes=8 * 1000)
+    rows = [{"id": i, "name": f"movie {i}"} for i in range(10_000)]
+    cache.set(("sql", "imdb", "q"), rows, MOVIES)
+    assert cache.get_stats()["too_large"] == 1
+    # 256 rows already pass the 1000 byte entry limit
+    assert encoded == [256]
+
+
+def test_expired_entries_miss():
+    cache = ResultCache(ttl=-1)
+    cache.set(("sql", "imdb", "q"), [1], MOVIES)
+    assert cache.get(("sql", "imdb", "q")) is None
+    assert cache.get_stats()["expired"] == 1
+
+
+def test_invalidate_evicts_only_readers_of_the_written_tables():
+    cache = ResultCache()
+    actors = frozenset({("sql", "imdb", "actors")})
+    cache.set(("sql", "imdb", "movies"), [1], MOVIES)
+    cache.set(("sql", "imdb", "actors"), [2], actors)
+    cache.set(("sql", "imdb", "both"), [3], MOVIES | actors)
+    assert cache.invalidate("sql", "IMDB", frozenset({"Movies"})) == 2
+    assert cache.get(("sql", "imdb", "actors")) == [2]
+    assert cache.get(("sql", "imdb", "both")) is None
+
+
+def test_whole_database_invalidation_spares_other_databases():
+    cache = ResultCache()
+    cache.set(("sql", "imdb", "q"), [1], MOVIES)
+    cache.set(("sql", "cora", "q"), [2], frozenset({("sql", "cora", "paper")}))
+    cache.set(("mongo", "imdb", "q"), [3], frozenset({("mongo", "imdb", "m")}))
+    assert cache.invalidate("sql", "imdb") == 1
+    assert cache.get_stats()["entries"] == 2
@@ -0,0 +1,148 @@
+import asyncio
+from contextlib import asynccontextmanager
+from services.db_service.schema_catalog import SchemaCatalog
+
+
+def column(table, name, type="INT", nullable="NO"):
+    return {
+        "TABLE_SCHEMA": "shop",
+        "TABLE_NAME": table,
+        "COLUMN_NAME": name,
+        "COLUMN_TYPE": type,
+        "IS_NULLABLE": nullable,
+    }
+
+
+class FakeSQL:
+    def __init__(self):
+        self.columns = [column("orders", "id"), column("orders", "total")]
+        self.keys = [
+            {
+                "TABLE_SCHEMA": "shop",
+                "TABLE_NAME": "orders",
+                "CONSTRAINT_NAME": "PRIMARY",
+                "COLUMN_NAME": "id",
+                "REFERENCED_TABLE_NAME": None,
+                "REFERENCED_COLUMN_NAME": None,
+                "CONSTRAINT_TYPE": "PRIMARY KEY",
+            }
+        ]
+        self.down = False
+        self.pools = self
+
+    def get_pool(self, db_name):
+        return self
+
+    @asynccontextmanager
+    async def connection(self):
+        if self.down:
+            raise ConnectionError("MySQL is down")
+        yield self
+
+    async def cursor(self, **kwargs):
+        results = iter([self.columns, self.keys])
+
+        class Cursor:
+            async def execute(self, sql, params):
+                self.rows = next(results)
+
+            async def fetchall(self):
+                return self.rows
+
+            async def close(self):
+                pass
+
+        return Cursor()
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.samples = 0
+
+    async def estimated_document_count(self):
+        return len(self.documents)
+
+    async def aggregate(self, pipeline):
+        self.samples += 1
+        documents = self.documents
+
+        class Cursor:
+            async def to_list(self):
+                return documents
+
+        return Cursor()
+
+
+class FakeMongo:
+    def __init__(self):
+        self.users = FakeCollection([{"_id": 1, "name": "Ada"}])
+        self.client = {"shop": self}
+
+    async def list_collection_names(self):
+        return ["users"]
+
+    def __getitem__(self, name):
+        return self.users
+
+
+def make_catalog():
+    sql, mongo = FakeSQL(), FakeMongo()
+    catalog = SchemaCatalog(sql, mongo, databases=["shop"], sample_size=10)
+    published = []
+    catalog.subscribe(lambda catalog, changed: published.append(changed))
+    return catalog, sql, mongo, published
+
+
+def test_first_refresh_publishes_both_backends():
+    catalog, _, _, published = make_catalog()
+    assert asyncio.run(catalog.refresh()) == [
+        ("sql", "shop"),
+        ("mongo", "shop"),
+    ]
+    assert catalog.version == 1 and len(published) == 1
+    orders = catalog.get_table("sql", "SHOP", "orders")
+    assert orders.primary_key == ("id",)
+    assert list(orders.columns) == ["id", "total"]
+    users = catalog.get_table("mongo", "shop", "users")
+    assert users.columns["name"].type == "string"
+
+
+def test_unchanged_schema_keeps_the_version():
+    catalog, _, mongo, published = make_catalog()
+
+    async def main():
+        await catalog.refresh()
+        return await catalog.refresh()
+
+    assert asyncio.run(main()) == []
+    assert catalog.version == 1 and len(published) == 1
+    # Same document count: the previous sample is reused
+    assert mongo.users.samples == 1
+
+
+def test_changed_table_bumps_the_version():
+    catalog, sql, _, published = make_catalog()
+
+    async def main():
+        await catalog.refresh()
+        sql.columns.append(column("orders", "note", "TEXT", "YES"))
+        return await catalog.refresh()
+
+    assert asyncio.run(main()) == [("sql", "shop")]
+    assert catalog.version == 2 and published[-1] == [("sql", "shop")]
+    assert catalog.render_sql_schemas("shop")["orders"].endswith(
+        "- note: TEXT"
+    )
+
+
+def test_unreachable_backend_keeps_its_last_catalog():
+    catalog, sql, _, _ = make_catalog()
+
+    async def main():
+        await catalog.refresh()
+        sql.down = True
+        return await catalog.refresh()
+
+    assert asyncio.run(main()) == []
+    assert catalog.get_table("sql", "shop", "orders") is not None
@@ -0,0 +1,50 @@
+import pytest
+from services.chatbot_service.mongo_schema_loader import MongoSchemaLoader
+from services.chatbot_service.schema_loader import SchemaLoader
+
+
+def test_table_prompt_includes_its_related_tables():
+    loader = SchemaLoader()
+    prompt = loader.get_schema("CORA", "paper")
+    assert "Table: paper" in prompt and "Table: cites" in prompt
+    assert (
+        loader.get_schema("cora") == loader.fragments["cora"]["prompts"][None]
+    )
+    assert loader.get_schema("unknown") == "Schema not available."
+
+
+def test_fragments_are_read_only():
+    loader = SchemaLoader()
+    with pytest.raises(TypeError):
+        loader.fragments["cora"]["prompts"]["paper"] = "changed"
+
+
+def test_invalidate_rebuilds_and_bumps_the_version():
+    loader = SchemaLoader()
+    before = loader.fragments
+    loader.invalidate(
+        schemas={"shop": {"orders": "Table: orders\n- id: INT\n- total: INT"}},
+        related_table_map={},
+    )
+    assert loader.version == 1
+    assert loader.fragments is not before
+    assert loader.get_schema("cora") == "Schema not available."
+    assert loader.get_fields("shop", "orders") == ("id: INT", "total: INT")
+
+
+def test_mongo_prompt_follows_references():
+    loader = MongoSchemaLoader()
+    prompt = loader.get_schema("imdb_ijs", "movies_genres")
+    assert "📂 movies_genres:" in prompt and "📂 movies:" in prompt
+    assert "🔗 Relationships in imdb_ijs:" in prompt
+
+
+def test_mongo_invalidate_rebuilds_and_bumps_the_version():
+    loader = MongoSchemaLoader()
+    loader.invalidate(
+        schema={"shop": {"orders": {"total": {"type": "int"}}}},
+        relations={},
+    )
+    assert loader.version == 1
+    assert loader.get_fields("shop", "orders") == ("total: int",)
+    assert "imdb_ijs" not in loader.fragments
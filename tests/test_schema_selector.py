@@ -0,0 +1,89 @@
+import pytest
+from config.config import Config
+from services.chatbot_service.schema_selector import (
+    DatabaseIndex,
+    SchemaSelector,
+    key_column_edges,
+)
+
+COLUMNS = {
+    "movies": ["id", "name", "year", "rank"],
+    "actors": ["id", "first_name", "last_name", "gender"],
+    "roles": ["actor_id", "movie_id", "role"],
+    "directors": ["id", "first_name", "last_name"],
+    "movies_directors": ["director_id", "movie_id"],
+    "movies_genres": ["movie_id", "genre"],
+}
+
+
+def make_index():
+    return DatabaseIndex(COLUMNS, key_column_edges(COLUMNS), {})
+
+
+def test_key_columns_join_their_owning_tables():
+    edges = key_column_edges(COLUMNS)
+    assert edges["roles"] == {"actors", "movies"}
+    assert edges["movies_directors"] == {"directors", "movies"}
+    assert edges["directors"] == {"movies_directors"}
+
+
+@pytest.mark.parametrize(
+    "question, tables",
+    [
+        ("how many films were released in 1995", {"movies"}),
+        (
+            "list female actors in movies rated above 8",
+            {"movies", "actors", "roles"},
+        ),
+        # Joined through movies_directors, which the question never names
+        (
+            "who directed the movies about crime",
+            {"movies", "directors", "movies_directors"},
+        ),
+    ],
+)
+def test_questions_select_the_tables_they_need(question, tables):
+    assert set(make_index().select(question)) == tables
+
+
+def test_unrelated_question_keeps_the_full_schema():
+    assert make_index().select("what is the weather like") is None
+
+
+def test_wide_tables_keep_asked_columns_and_join_keys(monkeypatch):
+    monkeypatch.setattr(Config, "SCHEMA_PRUNING_MAX_COLUMNS", 2)
+    selection = make_index().select("list female actors in movies")
+    assert selection["actors"] == ("id", "gender")
+    assert selection["roles"] == ("actor_id", "movie_id")
+    # No column of movies was asked for, so all of them stay
+    assert selection["movies"] is None
+
+
+class Loader:
+    def __init__(self):
+        self.version = 1
+        self.calls = 0
+
+    def get_table_names(self, db_name):
+        self.calls += 1
+        return list(COLUMNS)
+
+    def get_fields(self, db_name, table):
+        return [f"{column}: INT" for column in COLUMNS[table]]
+
+    def get_join_paths(self, db_name):
+        return {}
+
+    def render_subset(self, db_name, selection):
+        return ", ".join(sorted(selection))
+
+
+def test_selector_rebuilds_its_index_when_the_schema_changes():
+    loader = Loader()
+    selector = SchemaSelector(loader, None)
+    assert selector.prune("films from 1995", "sql", "imdb") == "movies"
+    selector.prune("female actors", "sql", "IMDB")
+    assert loader.calls == 1
+    loader.version = 2
+    selector.prune("films from 1995", "sql", "imdb")
+    assert loader.calls == 2
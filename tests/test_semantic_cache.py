@@ -0,0 +1,146 @@
+import pytest
+from services.chatbot_service.semantic_cache import (
+    SemanticCache,
+    question_literals,
+)
+
+QUERY = "SELECT 1;"
+
+
+def cache_with(question, intent="query", schema_version=1, **kwargs):
+    cache = SemanticCache(threshold=0.88)
+    cache.add(
+        question,
+        "CORA",
+        "sql",
+        intent,
+        "llama3",
+        QUERY,
+        schema_version,
+        **kwargs,
+    )
+    return cache
+
+
+def lookup(cache, question, intent="query", schema_version=1, **kwargs):
+    return cache.lookup(
+        question, "CORA", "sql", intent, "llama3", schema_version, **kwargs
+    )
+
+
+def test_near_duplicate_question_matches():
+    cache = cache_with("list papers cited by any paper in CORA")
+    match = lookup(cache, "show papers cited by any paper in CORA")
+    assert match is not None
+    assert match[2] == QUERY
+
+
+@pytest.mark.parametrize(
+    "stored, asked",
+    [
+        (
+            "papers cited by any paper in CORA",
+            "papers not cited by any paper in CORA",
+        ),
+        (
+            "papers with rank above 8 in CORA",
+            "papers with rank below 8 in CORA",
+        ),
+        (
+            "papers that cite paper 35 in CORA",
+            "papers that do not cite paper 35 in CORA",
+        ),
+        (
+            "papers that cite paper 35 in CORA",
+            "papers that don't cite paper 35 in CORA",
+        ),
+        ("authors with more than 3 papers", "authors with less than 3 papers"),
+        ("papers cited before 2001", "papers cited after 2001"),
+        ("max citations per paper", "min citations per paper"),
+        ("papers sorted by id asc", "papers sorted by id desc"),
+        ("first 5 papers by id", "last 5 papers by id"),
+    ],
+)
+def test_meaning_flips_do_not_match(stored, asked):
+    assert lookup(cache_with(stored), asked) is None
+
+
+def test_literals_capture_polarity_words():
+    assert question_literals("papers not cited") != question_literals(
+        "papers cited"
+    )
+    assert question_literals("rank above 8") == ("8", "above")
+
+
+@pytest.mark.parametrize("intent", ["insert", "update", "delete"])
+def test_write_intents_are_never_stored_or_served(intent):
+    question = "delete the paper with id 35 from CORA"
+    cache = cache_with(question, intent=intent)
+    assert cache.get_stats()["entries"] == 0
+    assert lookup(cache, question, intent=intent) is None
+
+
+def test_schema_rebuild_starts_a_new_partition():
+    question = "papers cited by any paper in CORA"
+    cache = cache_with(question, schema_version=1)
+    assert lookup(cache, question, schema_version=1) is not None
+    assert lookup(cache, question, schema_version=2) is None
+
+
+def test_table_name_is_part_of_the_partition():
+    question = "show rows where id is 5"
+    cache = cache_with(question, table_name="paper")
+    assert lookup(cache, question, table_name="paper") is not None
+    assert lookup(cache, question, table_name="cites") is None
+
+
+def add(cache, question, table, schema_version=1):
+    cache.add(
+        question,
+        "CORA",
+        "sql",
+        "query",
+        "llama3",
+        QUERY,
+        schema_version,
+        table_name=table,
+    )
+
+
+def test_capacity_bounds_all_partitions_together():
+    cache = SemanticCache(threshold=0.88, capacity=3)
+    for i, table in enumerate(["a", "b", "c"]):
+        add(cache, f"papers cited {i} times", table)
+    # A hit makes the oldest entry the most recently used
+    assert lookup(cache, "papers cited 0 times", table_name="a") is not None
+    add(cache, "papers cited 3 times", "d")
+    stats = cache.get_stats()
+    assert (stats["entries"], stats["evictions"]) == (3, 1)
+    assert lookup(cache, "papers cited 1 times", table_name="b") is None
+    assert lookup(cache, "papers cited 0 times", table_name="a") is not None
+    # The emptied partition is gone
+    assert stats["partitions"] == 3
+
+
+def test_newer_schema_version_drops_older_partitions():
+    cache = SemanticCache(threshold=0.88)
+    add(cache, "papers cited by any paper", "paper", schema_version=1)
+    add(cache, "papers citing paper 35", "cites", schema_version=2)
+    assert cache.get_stats()["entries"] == 1
+    assert all(key[-1] == 2 for key in cache.indexes)
+    # Answers generated against the replaced schema are not stored
+    add(cache, "papers cited by any paper", "paper", schema_version=1)
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_partitions_allocate_and_shrink_with_their_entries():
+    cache = SemanticCache(threshold=0.88, dim=64, capacity=100)
+    for i in range(40):
+        add(cache, f"papers cited {i} times", "paper")
+    (index,) = cache.indexes.values()
+    assert len(index.vectors) == 64
+    cache.capacity = 4
+    add(cache, "papers cited 99 times", "paper")
+    assert index.size == 4 and len(index.vectors) <= 32
+    for entry_id, slot in index.slots.items():
+        assert index.ids[slot] == entry_id
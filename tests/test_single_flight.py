@@ -0,0 +1,118 @@
+import asyncio
+from services.db_service.single_flight import SingleFlight
+from services.deadline import deadline_scope, remaining
+from services.metrics import collect_timings, span
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "rows"
+
+        results = await asyncio.gather(
+            *(flights.do("key", work) for _ in range(5))
+        )
+        return calls, results, flights.get_stats()
+
+    calls, results, stats = asyncio.run(main())
+    assert calls == 1
+    assert results == ["rows"] * 5
+    assert stats["leaders"] == 1 and stats["followers"] == 4
+
+
+def test_work_runs_under_the_latest_waiter_deadline():
+    async def main():
+        flights = SingleFlight()
+        seen = []
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            seen.append(remaining())
+            return None
+
+        async def call(seconds):
+            with deadline_scope(seconds):
+                return await flights.do("key", work)
+
+        leader = asyncio.ensure_future(call(1))
+        await started.wait()
+        await call(30)
+        await leader
+        return seen[0]
+
+    # The leader's 1s deadline was extended by the follower's 30s one
+    assert asyncio.run(main()) > 20
+
+
+def test_no_waiter_deadline_means_no_deadline():
+    async def main():
+        flights = SingleFlight()
+        seen = []
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            seen.append(remaining())
+
+        async def leader():
+            with deadline_scope(1):
+                await flights.do("key", work)
+
+        task = asyncio.ensure_future(leader())
+        await started.wait()
+        await flights.do("key", work)
+        await task
+        return seen[0]
+
+    assert asyncio.run(main()) is None
+
+
+def test_every_waiter_gets_the_shared_spans():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            with span("execute"):
+                await asyncio.sleep(0.01)
+
+        async def call():
+            with collect_timings() as timings:
+                await flights.do("key", work)
+            return timings
+
+        leader = asyncio.ensure_future(call())
+        await started.wait()
+        follower = await call()
+        return await leader, follower
+
+    leader, follower = asyncio.run(main())
+    assert [stage for stage, _ in leader] == ["execute"]
+    assert [stage for stage, _ in follower] == ["execute"]
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def main():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "rows"
+
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("rows", True)
@@ -0,0 +1,95 @@
+import asyncio
+from contextlib import asynccontextmanager
+from services.db_service.sql_executor import MySQLExecutor, prepare_sql
+from services.deadline import deadline_scope
+
+HINT = "/*+ MAX_EXECUTION_TIME("
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    async def execute(self, sql):
+        self.statements.append(sql)
+
+    async def fetchall(self):
+        return [{"id": 1}]
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    async def cursor(self, **kwargs):
+        return FakeCursor(self.statements)
+
+    async def commit(self):
+        pass
+
+
+class FakePools:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    def get_pool(self, db_name):
+        pools = self
+
+        class Pool:
+            @asynccontextmanager
+            async def connection(self):
+                yield pools.connection
+
+        return Pool()
+
+
+def run(query, timeout=None):
+    executor = MySQLExecutor()
+    executor.pools = FakePools()
+
+    async def main():
+        with deadline_scope(timeout):
+            return await executor.execute_query(query, "imdb")
+
+    assert asyncio.run(main()) == [{"id": 1}]
+    return executor.pools.connection.statements
+
+
+def test_select_and_union_carry_the_hint():
+    for query in (
+        "SELECT id FROM movies",
+        "SELECT id FROM movies UNION SELECT id FROM actors",
+        "SELECT * FROM (SELECT id FROM movies) AS m",
+    ):
+        prepared = prepare_sql(query)
+        assert prepared.sql.count(HINT) == 1
+        assert not prepared.limit_in_session
+
+
+def test_with_query_is_limited_through_the_session():
+    for query in (
+        "WITH m AS (SELECT id FROM movies) SELECT * FROM m",
+        "WITH m AS (SELECT id FROM movies) SELECT id FROM m "
+        "UNION SELECT id FROM actors",
+    ):
+        prepared = prepare_sql(query)
+        assert HINT not in prepared.sql
+        assert prepared.limit_in_session
+
+
+def test_with_query_sets_and_resets_max_execution_time():
+    statements = run("WITH m AS (SELECT id FROM movies) SELECT * FROM m", 5)
+    setting, _, limit = statements[0].partition(" = ")
+    assert setting == "SET SESSION max_execution_time"
+    # Capped to the 5s request deadline
+    assert 4000 < int(limit) <= 5000
+    assert statements[1].startswith("WITH")
+    assert statements[2] == "SET SESSION max_execution_time = DEFAULT"
+
+
+def test_select_sends_only_the_statement():
+    statements = run("SELECT id FROM movies WHERE id = 7")
+    assert len(statements) == 1 and HINT in statements[0]
@@ -0,0 +1,167 @@
+import asyncio
+import sqlite3
+import datetime
+import sqlglot
+from decimal import Decimal
+from services.db_service.page_tokens import decode_page_token
+from services.db_service.schema_catalog import (
+    ColumnInfo,
+    DatabaseInfo,
+    TableInfo,
+)
+from services.db_service.sql_pagination import (
+    SQLPager,
+    keyset_sql,
+    page_plan,
+)
+
+# (id, year, code): years tie across ids, and code is unique but nullable
+MOVIES = [
+    (1, 1999, "a"),
+    (2, 1999, None),
+    (3, 2001, "c"),
+    (4, 1999, "d"),
+    (5, None, None),
+    (6, 2001, "f"),
+    (7, 1980, "g"),
+]
+
+
+class SQLiteExecutor:
+    """
+    Runs the pager's MySQL on an in-memory SQLite copy of MOVIES.
+    """
+
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("CREATE TABLE movies (id INT, year INT, code TEXT)")
+        self.db.executemany("INSERT INTO movies VALUES (?, ?, ?)", MOVIES)
+        self.statements = []
+
+    async def execute_query(self, query, db_name=None):
+        self.statements.append(query)
+        sql = sqlglot.transpile(query, read="mysql", write="sqlite")[0]
+        cursor = self.db.execute(sql)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class Catalog:
+    def get_database(self, dbms_type, db_name):
+        table = TableInfo("movies")
+        table.columns = {
+            "id": ColumnInfo("id", "INT", False),
+            "year": ColumnInfo("year", "INT", True),
+            "code": ColumnInfo("code", "VARCHAR(1)", True),
+        }
+        table.primary_key = ("id",)
+        table.unique_keys = [("code",)]
+        database = DatabaseInfo("imdb", "sql")
+        database.tables["movies"] = table
+        return database
+
+
+def read_all(query, page_size=3):
+    executor = SQLiteExecutor()
+    pager = SQLPager(executor, Catalog(), page_size=page_size)
+
+    async def main():
+        rows, page = await pager.first_page(query, "imdb")
+        pages = [(rows, page)]
+        while page and page["next_token"]:
+            state = decode_page_token(page["next_token"])
+            rows, page = await pager.next_page(state)
+            pages.append((rows, page))
+        return pages
+
+    return asyncio.run(main()), executor.statements
+
+
+def test_keyset_pages_cover_every_row_once():
+    pages, statements = read_all("SELECT id, year FROM movies")
+    assert [page["mode"] for _, page in pages] == ["keyset"] * 3
+    ids = [row["id"] for rows, _ in pages for row in rows]
+    assert ids == [1, 2, 3, 4, 5, 6, 7]
+    # Ties and NULLs in year do not matter: pages seek on the primary key
+    assert [row["year"] for row in pages[1][0]] == [1999, None, 2001]
+    assert "> 3" in statements[1] and "> 6" in statements[2]
+    assert all("_page_key" not in row for rows, _ in pages for row in rows)
+
+
+def test_descending_keyset_pages():
+    pages, statements = read_all(
+        "SELECT id FROM movies ORDER BY id DESC", page_size=4
+    )
+    ids = [row["id"] for rows, _ in pages for row in rows]
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+    assert "< 4" in statements[1]
+
+
+def test_non_unique_sort_key_is_capped_not_paged():
+    pages, _ = read_all("SELECT id FROM movies ORDER BY year")
+    ((rows, page),) = pages
+    assert page == {
+        "mode": "limit",
+        "page_size": 3,
+        "has_more": True,
+        "next_token": None,
+    }
+    assert len(rows) == 3
+
+
+def test_nullable_unique_key_is_capped_not_paged():
+    pages, _ = read_all("SELECT id FROM movies ORDER BY code")
+    assert [page["mode"] for _, page in pages] == ["limit"]
+
+
+def test_query_with_its_own_limit_is_left_alone():
+    pages, statements = read_all("SELECT id FROM movies LIMIT 2")
+    assert pages == [([{"id": 1}, {"id": 2}], None)]
+    assert len(statements) == 1
+
+
+def test_page_plan_only_seeks_on_single_table_selects():
+    plan = page_plan("SELECT m.id FROM movies AS m ORDER BY m.id DESC")
+    assert (plan.table, plan.ref, plan.order_column, plan.descending) == (
+        "movies",
+        "m",
+        "id",
+        True,
+    )
+    for query in (
+        "SELECT year, COUNT(*) FROM movies GROUP BY year",
+        "SELECT m.id FROM movies AS m JOIN roles AS r ON r.movie_id = m.id",
+        "SELECT id FROM movies ORDER BY year, id",
+        "SELECT DISTINCT year FROM movies",
+    ):
+        assert page_plan(query).table is None, query
+
+
+def test_keyset_sql_seeks_past_the_last_key():
+    first = keyset_sql(
+        "SELECT name FROM movies", "movies", "id", False, None, 4
+    )
+    assert "WHERE" not in first and first.endswith("LIMIT 4")
+    after = keyset_sql(
+        "SELECT name FROM movies WHERE year > 1990",
+        "movies",
+        "id",
+        False,
+        "O'Brien",
+        4,
+    )
+    assert "year > 1990 AND `movies`.`id` > 'O''Brien'" in after
+
+
+def test_keyset_sql_seeks_on_exact_driver_values():
+    def seek(after):
+        sql = keyset_sql("SELECT id FROM t", "t", "k", False, after, 4)
+        return sql.split("WHERE ")[1].split(" ORDER")[0]
+
+    assert seek(Decimal("0.10")) == "`t`.`k` > 0.10"
+    assert seek(datetime.date(2001, 9, 9)) == (
+        "`t`.`k` > CAST('2001-09-09' AS DATE)"
+    )
+    assert seek(datetime.timedelta(hours=26, seconds=1)) == (
+        "`t`.`k` > '26:00:01.000000'"
+    )
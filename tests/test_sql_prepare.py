@@ -0,0 +1,59 @@
+import pytest
+from services.db_service import sql_executor
+from services.db_service.sql_executor import prepare_sql
+
+
+def test_each_query_text_is_parsed_once(monkeypatch):
+    parsed = []
+    parse_sql = sql_executor.parse_sql
+
+    def counting_parse(sql):
+        parsed.append(sql)
+        return parse_sql(sql)
+
+    monkeypatch.setattr(sql_executor, "parse_sql", counting_parse)
+    query = "SELECT name FROM movies WHERE id = 7 -- parsed once"
+    first, second = prepare_sql(query), prepare_sql(query)
+    assert first is second
+    assert parsed == [query]
+
+
+def test_reads_report_their_tables_but_not_ctes():
+    prepared = prepare_sql(
+        "WITH recent AS (SELECT id FROM movies WHERE year > 2000) "
+        "SELECT r.id, a.name FROM recent r JOIN imdb.actors a ON a.id = r.id"
+    )
+    assert prepared.returns_rows and prepared.is_query
+    assert not prepared.is_write
+    assert prepared.read_tables == {("", "movies"), ("imdb", "actors")}
+    assert prepared.cacheable
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT NOW()",
+        "SELECT id FROM movies ORDER BY RAND()",
+        "SELECT id FROM movies WHERE added < CURRENT_TIMESTAMP",
+        "SELECT 1",
+    ],
+)
+def test_nondeterministic_or_tableless_reads_are_not_cacheable(query):
+    assert not prepare_sql(query).cacheable
+
+
+def test_writes_report_the_tables_they_change():
+    update = prepare_sql("UPDATE movies SET year = 2000 WHERE id = 1")
+    assert update.is_write and not update.returns_rows
+    assert update.write_tables == {("", "movies")}
+    # DDL may change anything in the database
+    assert prepare_sql("DROP TABLE movies").write_tables is None
+
+
+def test_show_commands_return_rows():
+    assert prepare_sql("SHOW TABLES").returns_rows
+
+
+def test_unparseable_sql_is_none():
+    assert prepare_sql("SELEC name FROM WHERE") is None
+
@@ -0,0 +1,127 @@
+import json
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from config.config import Config
+from services.db_service import main
+from services.db_service.sql_executor import MySQLExecutor
+
+ROWS = [{"id": i} for i in range(7)]
+
+
+class FakePools:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.buffered = []
+        self.closed_cursors = 0
+
+    def get_pool(self, db_name):
+        pools = self
+
+        class Cursor:
+            async def execute(self, sql):
+                pass
+
+            async def fetchmany(self, size):
+                batch, pools.rows = pools.rows[:size], pools.rows[size:]
+                return batch
+
+            async def close(self):
+                pools.closed_cursors += 1
+
+        class Connection:
+            async def cursor(self, dictionary=False, buffered=True):
+                pools.buffered.append(buffered)
+                return Cursor()
+
+            async def commit(self):
+                pass
+
+        class Pool:
+            @asynccontextmanager
+            async def connection(self):
+                yield Connection()
+
+        return Pool()
+
+
+def make_executor():
+    executor = MySQLExecutor()
+    executor.pools = FakePools(ROWS)
+    executor.killed = []
+    executor._kill_query = executor.killed.append
+    return executor
+
+
+def test_rows_arrive_in_fetchmany_batches_from_an_unbuffered_cursor():
+    executor = make_executor()
+
+    async def main():
+        batches = []
+        async for rows in executor.stream_query(
+            "SELECT id FROM movies", "imdb", batch_size=3
+        ):
+            batches.append([row["id"] for row in rows])
+        return batches
+
+    assert asyncio.run(main()) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert executor.pools.buffered == [False]
+    assert executor.pools.closed_cursors == 1 and executor.killed == []
+
+
+def test_stopping_early_kills_the_statement():
+    executor = make_executor()
+
+    async def main():
+        stream = executor.stream_query("SELECT id FROM movies", "imdb", 3)
+        async with aclosing(stream):
+            return await anext(stream)
+
+    assert len(asyncio.run(main())) == 3
+    assert len(executor.killed) == 1
+    # The cursor is left to the pool, which drops the connection
+    assert executor.pools.closed_cursors == 0
+
+
+def stream_lines(gateway, monkeypatch, cap):
+    async def generate_query(nl_query):
+        return "sql", "imdb_ijs", "SELECT id FROM movies"
+
+    sent = []
+
+    async def stream_query(query, db_name=None):
+        sent.append(query)
+        for start in range(0, len(ROWS), 3):
+            yield ROWS[start : start + 3]
+
+    monkeypatch.setattr(main.query_generator, "generate_query", generate_query)
+    monkeypatch.setattr(main.sql_executor, "stream_query", stream_query)
+    monkeypatch.setattr(Config, "STREAM_MAX_ROWS", cap)
+
+    async def run():
+        async with gateway() as client:
+            return await client.post(
+                "/query/",
+                json={"nl_query": "movie ids in imdb_ijs", "stream": True},
+            )
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return lines, sent
+
+
+def test_query_endpoint_streams_ndjson_rows(gateway, monkeypatch):
+    lines, _ = stream_lines(gateway, monkeypatch, cap=0)
+    header, *rows, trailer = lines
+    assert header["status"] == "success"
+    assert header["query"] == "SELECT id FROM movies"
+    assert rows == ROWS
+    assert trailer == {"status": "done", "row_count": 7, "truncated": False}
+
+
+def test_streams_stop_at_the_row_cap(gateway, monkeypatch):
+    lines, sent = stream_lines(gateway, monkeypatch, cap=4)
+    assert lines[1:-1] == ROWS[:4]
+    assert lines[-1] == {"status": "done", "row_count": 4, "truncated": True}
+    # One row past the cap tells the stream that more rows exist
+    assert sent[0].endswith("LIMIT 5")
@@ -0,0 +1,78 @@
+import json
+import asyncio
+import httpx
+from services.chatbot_service.ollama_client import OllamaClient
+from services.chatbot_service.query_completion import QueryCompletionDetector
+
+
+def feed_all(dbms_type, chunks):
+    detector = QueryCompletionDetector(dbms_type)
+    for i, chunk in enumerate(chunks):
+        query = detector.feed(chunk)
+        if query is not None:
+            return query, i
+    return None, len(chunks)
+
+
+def test_sql_ends_at_the_first_semicolon_outside_quotes_and_comments():
+    query, _ = feed_all(
+        "sql",
+        [
+            "Here is the query:\n",
+            "SELECT name FROM movies ",
+            "WHERE note = 'a;b' -- x;\n",
+            " LIMIT 2;",
+            "\nExplanation: ...",
+        ],
+    )
+    assert (
+        query == "SELECT name FROM movies WHERE note = 'a;b' -- x;\n LIMIT 2;"
+    )
+
+
+def test_mongo_ends_after_the_last_chained_call():
+    query, stopped_at = feed_all(
+        "mongo",
+        ['db.movies.find({a: "x)"})', "\n", "  .limit(5)", "\n", "Note: "],
+    )
+    assert query == 'db.movies.find({a: "x)"})\n  .limit(5)'
+    assert stopped_at == 4
+
+
+def test_fence_ends_a_query_without_a_semicolon():
+    query, _ = feed_all("sql", ["```sql\nSELECT 1\n", "```", "\nmore"])
+    assert query.strip() == "SELECT 1"
+
+
+def test_generation_stops_reading_once_the_query_is_complete():
+    chunks = ["SELECT name ", "FROM movies;", "\nExplanation:"]
+    chunks += [" blah"] * 50
+    sent = []
+
+    async def body():
+        for chunk in chunks:
+            sent.append(chunk)
+            yield (
+                json.dumps({"response": chunk, "done": False}) + "\n"
+            ).encode()
+        yield json.dumps({"response": "", "done": True}).encode()
+
+    client = OllamaClient("llama3", "http://ollama/api/generate")
+    client.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=body())
+        )
+    )
+
+    async def main():
+        try:
+            return await client.generate_until_complete("prompt", "sql")
+        finally:
+            await client.client.aclose()
+
+    result = asyncio.run(main())
+    assert result["early_stop"] == "SELECT name FROM movies;"
+    assert result["done"] is False
+    assert "first_token_ms" in result["timings"]
+    # The body is abandoned right after the chunk that completed it
+    assert len(sent) == 3